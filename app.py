@@ -1,60 +1,144 @@
-# ...existing code...
-# ...existing code...
-# ...existing code...
-from flask import Flask, render_template, request, jsonify, url_for
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import logging
 import os
-import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from werkzeug.security import generate_password_hash, check_password_hash
-from itsdangerous import URLSafeTimedSerializer
-
-# Load environment variables
-load_dotenv()
-
-# Flask app setup
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "your-secret-key-here")
+import uuid
 
-# Supabase client setup
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-serializer = URLSafeTimedSerializer(app.secret_key)
+from dotenv import load_dotenv
+from flask import (Blueprint, Flask, Response, abort, current_app, jsonify, make_response, render_template, request,
+                   send_file, session, stream_with_context, url_for)
+from itsdangerous import URLSafeTimedSerializer
+from werkzeug.http import is_resource_modified
+
+import assets
+from concurrency import run_parallel
+from flashcards.dedup import content_hash, store_bodies
+from flashcards.export import FORMATS, gzip_stream, iter_card_pages, serialize
+from flashcards.quota import quota_response
+from flashcards.review import grade_cards, next_due, parse_grade
+from flashcards.sessions import (count_rows, create_session, dashboard_etag, delete_session, fetch_session_page,
+                                 flashcard_version, to_local_time)
+from flashcards.store import insert_flashcards
+from services import Services
+from telemetry import middleware, profiling
+from telemetry.logs import configure_logging
+from telemetry.metrics import counter
+from users.avatars import InvalidAvatar, is_data_url, is_key
+from users.passwords import HasherBusy
+
+# Supabase, mail, payments and model clients are created on first use
+services = Services()
+
+main = Blueprint("main", __name__)
+
+logger = logging.getLogger(__name__)
+
+QUOTA_REJECTIONS = counter("quota_rejections_total", "/generate calls refused by the daily limit", ["plan"])
+WEBHOOKS_RECEIVED = counter("webhooks_received_total", "Chapa webhook requests, by outcome", ["outcome"])
+
+
+def create_app(config=None):
+    """
+    Create the Flask app
+
+    Cheap to call: no client is created and no connection is opened until
+    a request needs it (see services.py).
+    """
+
+    # Load environment variables
+    load_dotenv()
+    configure_logging()
+
+    app = Flask(__name__)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY", "your-secret-key-here")
+    if config:
+        app.config.update(config)
+    app.register_blueprint(main)
+    assets.init_app(app)
+    middleware.init_app(app)
+    # Armed routes are shared by every worker
+    profiling.init_app(app, lambda: services.shared_state)
+    # A preforked server starts these in each worker instead (see gunicorn.conf.py)
+    if not os.getenv("SERVER_PREFORK"):
+        services.start_background()
+    return app
+
+
+def get_serializer():
+    return URLSafeTimedSerializer(current_app.secret_key)
+
+
+@main.app_errorhandler(HasherBusy)
+def password_hasher_busy(e):
+    response = jsonify({"status": "error", "message": "Server is busy. Please try again in a moment."})
+    response.headers["Retry-After"] = "2"
+    return response, 503
+
+@main.app_errorhandler(InvalidAvatar)
+def invalid_avatar(e):
+    return jsonify({"status": "error", "message": str(e)}), 400
+
+def store_avatar(avatar):
+    """
+    The value kept in users.avatar for an avatar sent by the client
+
+    Uploaded images (data URLs) go to the avatar store and only their key is
+    kept; links to hosted images are kept as they are.
+    """
+    if is_data_url(avatar):
+        return services.avatars.put(avatar)
+    if isinstance(avatar, str) and avatar.startswith(("https://", "http://")) and len(avatar) <= 2048:
+        return avatar
+    return None
+
+def avatar_url(avatar, size=256):
+    if is_key(avatar):
+        return url_for("main.avatar_image", key=avatar, size=size)
+    return avatar
+
+def public_user(user):
+    """User fields returned to the browser: no password hash, avatar as a URL"""
+    info = {k: v for k, v in user.items() if k != "password"}
+    if "avatar" in info:
+        info["avatar"] = avatar_url(info["avatar"])
+    return info
+
+# Avatars never change under a key, so browsers and CDNs may keep them forever
+@main.route("/avatars/<key>-<int:size>.webp")
+def avatar_image(key, size):
+    if not is_key(key) or size not in services.avatars.sizes:
+        abort(404)
+    path = services.avatars.path(key, size)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(os.path.abspath(path), mimetype="image/webp", etag=f"{key}-{size}", max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 # Update profile route
-@app.route("/api/update_profile", methods=["POST"])
+@main.route("/api/update_profile", methods=["POST"])
 def update_profile():
-    from flask import session
     data = request.get_json()
     email = session.get("user_email")
     if not email:
         return jsonify({"status": "error", "message": "Not logged in."}), 401
-    avatar = data.get("avatar")
+    avatar = store_avatar(data.get("avatar"))
     new_password = data.get("new_password")
     updates = {}
     if avatar:
         updates["avatar"] = avatar
     if new_password:
-        updates["password"] = generate_password_hash(new_password)
+        updates["password"] = services.passwords.hash(new_password)
     if not updates:
         return jsonify({"status": "error", "message": "No changes provided."}), 400
     try:
-        supabase.table("users").update(updates).eq("email", email).execute()
-        return jsonify({"status": "ok", "message": "Profile updated successfully."})
+        services.user_store.update(email, updates)
+        return jsonify({"status": "ok", "message": "Profile updated successfully.", "avatar": avatar_url(avatar)})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 def send_verification_email(email, token):
 
-    verify_url = url_for('verify_email', token=token, _external=True)
+    verify_url = url_for('main.verify_email', token=token, _external=True)
     subject = "Verify Your Email"
     body = f"""
 <html>
@@ -71,36 +155,17 @@ def send_verification_email(email, token):
 </body>
 </html>
 """
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", 587))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    to_email = email
-    msg = MIMEMultipart('alternative')
-    msg["From"] = smtp_user
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "html"))
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.sendmail(smtp_user, to_email, msg.as_string())
-        server.quit()
-    except Exception as e:
-        print("Verification email send error:", e)
+    # Delivered in the background by the outbox
+    services.outbox.enqueue_message(email, subject, body, subtype="html")
 # Email verification route
-@app.route('/verify-email/<token>')
+@main.route('/verify-email/<token>')
 def verify_email(token):
     try:
-        email = serializer.loads(token, max_age=3600)
+        email = get_serializer().loads(token, max_age=3600)
     except Exception:
         return "Invalid or expired token.", 400
-    result = supabase.table("users").select("*").eq("email", email).execute()
-    if not result.data:
+    if not services.user_store.mark_verified(email):
         return "User not found.", 404
-    user = result.data[0]
-    supabase.table("users").update({"verified": True}).eq("email", email).execute()
     return '''
     <html>
     <body>
@@ -109,112 +174,56 @@ def verify_email(token):
     </body>
     </html>
     ''', 200
-    verify_url = url_for('verify_email', token=token, _external=True)
-    subject = "Verify Your Email"
-    body = f"""
-<html>
-<body>
-<p>Dear User,</p>
-<p>Please verify your email which is used for signing up at the AI Study Buddy.</p>
-<p>
-<a href='{verify_url}' style='display:inline-block;padding:10px 20px;background:#2563eb;color:#fff;text-decoration:none;border-radius:6px;'>Verify Email</a>
-</p>
-<p>Or copy and paste this link into your browser:<br>
-<span style='color:#2563eb'>{verify_url}</span>
-</p>
-<p>With Regards,<br>the developer</p>
-</body>
-</html>
-"""
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", 587))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-    to_email = email
-    msg = MIMEMultipart('alternative')
-    msg["From"] = smtp_user
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "html"))
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.sendmail(smtp_user, to_email, msg.as_string())
-        server.quit()
-    except Exception as e:
-        print("Verification email send error:", e)
-@app.route("/api/signup", methods=["POST"])
+@main.route("/api/signup", methods=["POST"])
 def api_signup():
     data = request.get_json()
     name = data.get("name")
     email = data.get("email")
     password = data.get("password")
-    avatar = data.get("avatar")
     if not name or not email or not password:
         return jsonify({"status": "error", "message": "All fields are required."}), 400
-    result = supabase.table("users").select("*").eq("email", email).execute()
-    if result.data:
+    # Checked first with a projected lookup, so a taken email costs neither a password hash nor an avatar file
+    if services.user_store.exists(email):
         return jsonify({"status": "error", "message": "Email already registered."}), 409
-    hashed_password = generate_password_hash(password)
+    avatar = store_avatar(data.get("avatar"))
+    hashed_password = services.passwords.hash(password)
     user_data = {"name": name, "email": email, "password": hashed_password, "avatar": avatar, "verified": False}
     try:
-        res = supabase.table("users").insert(user_data).execute()
-        user = res.data[0] if res.data else user_data
-        user_info = {k: v for k, v in user.items() if k != "password"}
+        user = services.user_store.create(user_data)
+        if not user:
+            # Registered by a concurrent signup since the check above
+            return jsonify({"status": "error", "message": "Email already registered."}), 409
+        user_info = public_user(user)
         # Send verification email
-        token = serializer.dumps(email)
+        token = get_serializer().dumps(email)
         send_verification_email(email, token)
         return jsonify({"status": "ok", "user": user_info, "message": "Verification email sent. Please check your inbox."})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-@app.route("/api/login", methods=["POST"])
+@main.route("/api/login", methods=["POST"])
 def api_login():
     data = request.get_json()
     email = data.get("email")
     password = data.get("password")
     if not email or not password:
         return jsonify({"status": "error", "message": "Email and password required."}), 400
-    result = supabase.table("users").select("*").eq("email", email).execute()
-    users = result.data
-    if not users:
+    user = services.user_store.get_for_login(email)
+    if not user:
         return jsonify({"status": "error", "message": "No account found for this email."}), 401
-    user = users[0]
     if not user.get("verified"):
         return jsonify({"status": "error", "message": "Email not verified. Please check your inbox."}), 403
-    if not check_password_hash(user.get("password"), password):
+    if not services.passwords.verify(user.get("password"), password):
         return jsonify({"status": "error", "message": "Incorrect password."}), 401
-    user_info = {k: v for k, v in user.items() if k != "password"}
+    if services.passwords.needs_rehash(user.get("password")):
+        # Upgrade hashes made with older cost parameters in the background
+        services.passwords.rehash_later(password, lambda new_hash: services.user_store.update(email, {"password": new_hash}))
+    user_info = public_user(user)
     # Store user email in session for dashboard security
-    from flask import session
     session["user_email"] = user_info["email"]
     return jsonify({"status": "ok", "user": user_info})
-from flask import Flask, render_template, request, jsonify, url_for
-from supabase import create_client, Client
-from dotenv import load_dotenv
-import os
-import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-# ...existing code...
-
-# Hugging Face API setup
-HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-HUGGINGFACE_MODEL = os.getenv("HUGGINGFACE_MODEL", "distilbert-base-uncased-distilled-squad")
-HF_API_URL = f"https://api-inference.huggingface.co/models/{HUGGINGFACE_MODEL}"
-HEADERS = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
-
-# Initialize Chapa payment
-try:
-    from payments.chapa import ChapaPayment
-    chapa = ChapaPayment()
-except Exception as e:
-    print(f"Warning: Chapa payment not initialized: {e}")
-    chapa = None
 
 # Contact form endpoint
-@app.route("/send_message", methods=["POST"])
+@main.route("/send_message", methods=["POST"])
 def send_message():
     data = request.get_json()
     name = data.get("name")
@@ -228,43 +237,30 @@ def send_message():
     subject = f"AI Study Buddy Support Message from {name}"
     body = f"Name: {name}\nEmail: {email}\n\nMessage:\n{message}"
 
-    # SMTP config (use environment variables for security)
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", 587))
-    smtp_user = os.getenv("SMTP_USER")  # Your Gmail address
-    smtp_password = os.getenv("SMTP_PASSWORD")  # App password or Gmail password
-
-    if not smtp_user or not smtp_password:
+    if not services.outbox.config.configured:
         return jsonify({"status": "error", "message": "Email service not configured."}), 500
 
     try:
-        msg = MIMEMultipart()
-        msg["From"] = smtp_user
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
-
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.sendmail(smtp_user, to_email, msg.as_string())
-        server.quit()
+        # Delivered in the background by the outbox
+        services.outbox.enqueue_message(to_email, subject, body)
         return jsonify({"status": "ok"})
-    except Exception as e:
-        print("Email send error:", e)
+    except Exception:
+        logger.exception("Email send error")
         return jsonify({"status": "error", "message": "Failed to send email."}), 500
 
 # Routes
-@app.route("/")
+@main.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/dashboard")
+@main.route("/dashboard")
 def dashboard():
     try:
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)  # Default 10 sessions per page
+        after = request.args.get('after')  # keyset cursor for the next (older) page
+        before = request.args.get('before')  # keyset cursor for the previous (newer) page
         
         # Ensure valid page numbers
         if page < 1:
@@ -273,64 +269,46 @@ def dashboard():
             per_page = 10
         
         # Get user email from query parameter or session (for demo, use query param)
-        from flask import session
         user_email = session.get("user_email")
         if not user_email:
             return "You must be logged in to view your dashboard.", 401
-        # Fetch only flashcards for this user
-        result = supabase.table("flashcards").select("*").eq("email", user_email).order("created_at", desc=True).execute()
-        flashcards = result.data
-        
-        # Process flashcards to ensure proper timestamp handling
-        from datetime import datetime, timedelta, timezone
-        eat_tz = timezone(timedelta(hours=3))  # East African Time UTC+3
-        for flashcard in flashcards:
-            if flashcard.get('created_at'):
-                # Convert string timestamp to datetime if needed
-                if isinstance(flashcard['created_at'], str):
-                    try:
-                        dt = datetime.fromisoformat(flashcard['created_at'].replace('Z', '+00:00'))
-                        flashcard['created_at'] = dt.astimezone(eat_tz)
-                    except:
-                        flashcard['created_at'] = None
-                elif isinstance(flashcard['created_at'], datetime):
-                    flashcard['created_at'] = flashcard['created_at'].astimezone(eat_tz)
-            else:
-                flashcard['created_at'] = None
-        
-        # Group flashcards by session (same timestamp = same session)
-        from collections import defaultdict
-        sessions = defaultdict(list)
-        
-        for flashcard in flashcards:
-            if flashcard['created_at']:
-                # Round to nearest minute to group very close timestamps
-                from datetime import timedelta
-                rounded_time = flashcard['created_at'].replace(second=0, microsecond=0)
-                sessions[rounded_time].append(flashcard)
-            else:
-                # Group flashcards without timestamps together
-                sessions[None].append(flashcard)
-        
-        # Convert to list of tuples and sort by timestamp (newest first)
-        session_list = sorted(sessions.items(), key=lambda x: x[0] if x[0] else datetime.min, reverse=True)
-        
-        # Calculate pagination
-        total_sessions = len(session_list)
+
+        # The flashcard count and newest card change whenever the dashboard
+        # does: an unchanged dashboard is answered with a 304, and a page
+        # rendered at the same version is reused without reading it again
+        version = flashcard_version(services.supabase, user_email)
+        total_flashcards, newest = version
+        etag = dashboard_etag(user_email, version, current_app.extensions["assets"].version)
+        last_modified = to_local_time(newest)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return _dashboard_validators(Response(status=304), etag, last_modified)
+
+        page_key = (page, per_page, after, before)
+        sessions_html = services.dashboard_cache.get(user_email, page_key, version)
+        if sessions_html is not None:
+            return _dashboard_validators(
+                make_response(render_template("dashboard.html", sessions_html=sessions_html)), etag, last_modified)
+
+        # The session count and the page itself are independent, so they run concurrently
+        offset = 0 if after or before else (page - 1) * per_page
+        total_sessions, result = run_parallel(
+            lambda: count_rows(services.supabase, "generation_sessions", user_email),
+            lambda: fetch_session_page(services.supabase, user_email, per_page, after=after, before=before, offset=offset),
+        )
         total_pages = (total_sessions + per_page - 1) // per_page  # Ceiling division
         
         # Ensure page is within valid range
         if page > total_pages and total_pages > 0:
             page = total_pages
+            result = fetch_session_page(services.supabase, user_email, per_page, offset=(page - 1) * per_page)
         
-        # Get sessions for current page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        current_page_sessions = session_list[start_idx:end_idx]
-        
-        # Calculate total flashcards across all sessions (for statistics)
-        total_flashcards = sum(len(session_flashcards) for _, session_flashcards in session_list)
-        sessions_with_timestamps = sum(1 for timestamp, _ in session_list if timestamp is not None)
+        # Read only the sessions (and their flashcards) for this page
+        current_page_sessions = result["sessions"]
+        if not current_page_sessions and (after or before):
+            # Stale cursor: fall back to the first page
+            page = 1
+            result = fetch_session_page(services.supabase, user_email, per_page)
+            current_page_sessions = result["sessions"]
         
         # Pagination info
         pagination_info = {
@@ -339,14 +317,21 @@ def dashboard():
             'per_page': per_page,
             'total_sessions': total_sessions,
             'total_flashcards': total_flashcards,
-            'sessions_with_timestamps': sessions_with_timestamps,
-            'has_prev': page > 1,
-            'has_next': page < total_pages,
-            'prev_page': page - 1 if page > 1 else None,
-            'next_page': page + 1 if page < total_pages else None
+            'sessions_with_timestamps': total_sessions,
+            'has_prev': result["has_prev"],
+            'has_next': result["has_next"],
+            'prev_page': page - 1 if result["has_prev"] else None,
+            'next_page': page + 1 if result["has_next"] else None,
+            'prev_cursor': result["prev_cursor"],
+            'next_cursor': result["next_cursor"]
         }
-                
-    except Exception as e:
+        sessions_html = render_template("dashboard_sessions.html", sessions=current_page_sessions,
+                                        pagination=pagination_info)
+        services.dashboard_cache.put(user_email, page_key, version, sessions_html)
+        return _dashboard_validators(
+            make_response(render_template("dashboard.html", sessions_html=sessions_html)), etag, last_modified)
+
+    except Exception:
         current_page_sessions = []
         pagination_info = {
             'current_page': 1,
@@ -358,21 +343,191 @@ def dashboard():
             'has_prev': False,
             'has_next': False,
             'prev_page': None,
-            'next_page': None
+            'next_page': None,
+            'prev_cursor': None,
+            'next_cursor': None
         }
-        print("Supabase fetch error:", e)
+        logger.exception("Supabase fetch error")
     
-    return render_template("dashboard.html", 
-                         sessions=current_page_sessions, 
-                         pagination=pagination_info)
+    sessions_html = render_template("dashboard_sessions.html", sessions=current_page_sessions,
+                                    pagination=pagination_info)
+    return render_template("dashboard.html", sessions_html=sessions_html)
+
+
+def _dashboard_validators(response, etag, last_modified):
+    # private: the page is per user; no-cache: browsers revalidate on every view
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+@main.route("/export")
+def export():
+    """Download all of the user's flashcards as CSV, JSON Lines or an Anki import file"""
+    user_email = session.get("user_email")
+    if not user_email:
+        return jsonify({"status": "error", "message": "Not logged in."}), 401
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        return jsonify({"status": "error", "message": f"format must be one of {', '.join(FORMATS)}"}), 400
+
+    pages = iter_card_pages(services.supabase, user_email, page_size=int(os.getenv("EXPORT_PAGE_SIZE", 1000)))
+    try:
+        # Read the first page before answering, so a failing query still gets an error status
+        first = next(pages, [])
+    except Exception:
+        logger.exception("Supabase export error")
+        return jsonify({"status": "error", "message": "Failed to export flashcards. Please try again."}), 500
+
+    def all_pages():
+        yield first
+        try:
+            yield from pages
+        except Exception:
+            # Headers are already sent; the download ends early
+            logger.exception("Supabase export error")
+
+    body = serialize(all_pages(), fmt)
+    mimetype, extension = FORMATS[fmt]
+    headers = {
+        "Content-Disposition": f'attachment; filename="flashcards.{extension}"',
+        "Cache-Control": "private, no-store",
+        "Vary": "Accept-Encoding",
+    }
+    if request.accept_encodings["gzip"]:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(body), content_type=mimetype, headers=headers)
+
+@main.route("/jobs", methods=["POST"])
+def create_job():
+    """Queue notes for background generation; accepts several uploaded files or a JSON list of texts"""
+    user_email = session.get("user_email")
+    if not user_email:
+        return jsonify({"status": "error", "message": "Not logged in."}), 401
+
+    documents = [(f.filename or f"document-{i + 1}", f.stream)
+                 for i, f in enumerate(request.files.getlist("files")) if f]
+    if not documents and request.is_json:
+        for i, doc in enumerate((request.get_json(silent=True) or {}).get("documents") or []):
+            if isinstance(doc, dict):
+                name, text = doc.get("name") or f"document-{i + 1}", doc.get("text")
+            else:
+                name, text = f"document-{i + 1}", doc
+            if isinstance(text, str) and text.strip():
+                documents.append((str(name), text))
+    if not documents:
+        return jsonify({"status": "error", "message": "No documents provided"}), 400
+    max_documents = int(os.getenv("JOB_MAX_DOCUMENTS", 100))
+    if len(documents) > max_documents:
+        return jsonify({"status": "error", "message": f"At most {max_documents} documents per job"}), 400
+
+    # The quota is charged when the job's cards are stored; users already at their limit are turned away now
+    cached_quota = services.quota.check(user_email)
+    if cached_quota and cached_quota.exhausted:
+        QUOTA_REJECTIONS.inc(plan=cached_quota.plan or "unknown")
+        return jsonify(quota_response(cached_quota)), 403
+
+    try:
+        job_id = services.ingest_jobs.submit(user_email, documents)
+    except Exception:
+        logger.exception("Job submit error")
+        return jsonify({"status": "error", "message": "Could not queue your notes. Please try again."}), 500
+    status_url = url_for("main.job_status", job_id=job_id)
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": status_url}), 202, {"Location": status_url}
+
+@main.route("/jobs/<job_id>")
+def job_status(job_id):
+    user_email = session.get("user_email")
+    if not user_email:
+        return jsonify({"status": "error", "message": "Not logged in."}), 401
+    job = services.ingest_jobs.store.get(job_id)
+    if job is None or job.pop("email") != user_email:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify({"status": "ok", "job": job})
+
+@main.route("/api/search")
+def search():
+    """Search the user's flashcards: ?q=words[&page=1&per_page=20], each word matching as a prefix"""
+    user_email = session.get("user_email")
+    if not user_email:
+        return jsonify({"status": "error", "message": "Not logged in."}), 401
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"status": "error", "message": "No search query provided"}), 400
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"status": "error", "message": "page and per_page must be numbers"}), 400
+    try:
+        results, more = services.search.search(user_email, query, limit=per_page, offset=(page - 1) * per_page)
+    except Exception:
+        logger.exception("Flashcard search error")
+        return jsonify({"status": "error", "message": "Search failed. Please try again."}), 500
+    return jsonify({"status": "ok", "query": query, "results": results, "page": page, "per_page": per_page,
+                    "more": more})
+
+@main.route("/api/review/next")
+def review_next():
+    """The logged-in user's next due cards, oldest due first"""
+    user_email = session.get("user_email")
+    if not user_email:
+        return jsonify({"status": "error", "message": "Not logged in."}), 401
+    max_batch = int(os.getenv("REVIEW_MAX_BATCH", 100))
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), max_batch)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be a number"}), 400
+    try:
+        cards, more = next_due(services.supabase, user_email, limit)
+    except Exception:
+        logger.exception("Supabase review queue error")
+        return jsonify({"status": "error", "message": "Failed to load cards for review. Please try again."}), 500
+    return jsonify({"status": "ok", "cards": cards, "more": more})
+
+@main.route("/api/review/grade", methods=["POST"])
+def review_grade():
+    """Grade reviewed cards: {"id": 1, "grade": 4}, or {"grades": [...]} to send several at once"""
+    user_email = session.get("user_email")
+    if not user_email:
+        return jsonify({"status": "error", "message": "Not logged in."}), 401
+    data = request.get_json(silent=True) or {}
+    items = data.get("grades") if "grades" in data else [data]
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "error", "message": "No grades provided"}), 400
+    max_batch = int(os.getenv("REVIEW_MAX_BATCH", 100))
+    if len(items) > max_batch:
+        return jsonify({"status": "error", "message": f"At most {max_batch} grades per request"}), 400
+    grades = []
+    for item in items:
+        card_id = item.get("id") if isinstance(item, dict) else None
+        quality = parse_grade(item.get("grade")) if isinstance(item, dict) else None
+        if not isinstance(card_id, int) or isinstance(card_id, bool) or quality is None:
+            message = "Each grade needs a card id and a grade from 0 to 5 (or again, hard, good, easy)"
+            return jsonify({"status": "error", "message": message}), 400
+        grades.append((card_id, quality))
+
+    try:
+        result = grade_cards(services.supabase, user_email, grades)
+    except Exception:
+        logger.exception("Supabase review grade error")
+        return jsonify({"status": "error", "message": "Failed to save your review. Please try again."}), 500
+    return jsonify({
+        "status": "ok",
+        "scheduled": [dict(schedule, id=card_id) for card_id, schedule in result["scheduled"].items()],
+        "missing": result["missing"],
+    })
 
-@app.route("/payment")
+@main.route("/payment")
 def payment():
     return render_template("payment.html")
 
-@app.route("/create-payment", methods=["POST"])
+@main.route("/create-payment", methods=["POST"])
 def create_payment():
     """Create a new payment transaction"""
+    chapa = services.chapa
     if not chapa:
         return jsonify({"status": "error", "message": "Payment service not available"}), 503
     
@@ -394,8 +549,8 @@ def create_payment():
             email=email,
             first_name=first_name,
             last_name=last_name,
-            callback_url=url_for("payment_webhook", _external=True),
-            return_url=url_for("payment_success", _external=True),
+            callback_url=url_for("main.payment_webhook", _external=True),
+            return_url=url_for("main.payment_success", _external=True),
             customizations={
                 "title": "AI Study Buddy Premium",
                 "description": "Upgrade to premium features"
@@ -411,67 +566,67 @@ def create_payment():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route("/payment-webhook", methods=["POST"])
+@main.route("/payment-webhook", methods=["POST"])
 def payment_webhook():
     """Handle payment webhooks from Chapa"""
+    chapa = services.chapa
     if not chapa:
+        WEBHOOKS_RECEIVED.inc(outcome="unavailable")
         return jsonify({"status": "error", "message": "Payment service not available"}), 503
     
     try:
         # Get webhook signature
         signature = request.headers.get("Chapa-Signature")
         if not signature:
+            WEBHOOKS_RECEIVED.inc(outcome="missing_signature")
             return jsonify({"status": "error", "message": "Missing signature"}), 400
         
-        # Process webhook
-        payload = request.get_json()
-        result = chapa.process_webhook(payload, signature)
-        
-        # Update database based on payment status
-        if result["action"] == "payment_success":
-            # Update user subscription in database
-            tx_ref = result["tx_ref"]
-            try:
-                # You can store successful payments in your database
-                supabase.table("payments").insert({
-                    "tx_ref": tx_ref,
-                    "status": "success",
-                    "amount": result["amount"],
-                    "currency": result["currency"],
-                    "email": payload.get("email")
-                }).execute()
-            except Exception as e:
-                print(f"Failed to store payment: {e}")
+        # The signature covers the raw body, not a re-serialization of it
+        raw_body = request.get_data()
+        if not chapa.verify_webhook(raw_body, signature):
+            WEBHOOKS_RECEIVED.inc(outcome="invalid_signature")
+            return jsonify({"status": "error", "message": "Invalid webhook signature"}), 400
+        payload = request.get_json(force=True, silent=True)
+        if not isinstance(payload, dict) or not payload.get("tx_ref"):
+            WEBHOOKS_RECEIVED.inc(outcome="missing_tx_ref")
+            return jsonify({"status": "error", "message": "Missing transaction reference"}), 400
         
+        # Persist locally and ack; the webhook worker updates the database
+        is_new = services.webhook_queue.enqueue(raw_body, payload["tx_ref"])
+        services.webhook_worker.notify()
+        WEBHOOKS_RECEIVED.inc(outcome="queued" if is_new else "duplicate")
         return jsonify({"status": "success"})
         
     except Exception as e:
+        logger.exception("Webhook handling error")
+        WEBHOOKS_RECEIVED.inc(outcome="error")
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route("/verify-payment/<tx_ref>")
+@main.route("/verify-payment/<tx_ref>")
 def verify_payment(tx_ref):
     """Verify a payment transaction"""
+    chapa = services.chapa
     if not chapa:
         return jsonify({"status": "error", "message": "Payment service not available"}), 503
     
     try:
-        result = chapa.verify_payment(tx_ref)
+        result = services.payment_verifier.verify(tx_ref)
         return jsonify(result)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route("/payment-success")
+@main.route("/payment-success")
 def payment_success():
     """Payment success page"""
     tx_ref = request.args.get("tx_ref")
     return render_template("payment_success.html", tx_ref=tx_ref)
 
-@app.route("/payment-failed")
+@main.route("/payment-failed")
 def payment_failed():
     """Payment failed page"""
     return render_template("payment_failed.html")
 
-@app.route("/generate", methods=["POST"])
+@main.route("/generate", methods=["POST"])
 def generate():
     # Handle both form data and JSON requests
     notes = None
@@ -482,96 +637,133 @@ def generate():
     if not notes and request.is_json:
         json_data = request.get_json()
         notes = json_data.get("notes") or json_data.get("text")
+    # Uploaded files are streamed through the generator, never read whole
+    if not notes and request.files.get("file"):
+        notes = request.files["file"].stream
     if not notes:
         return jsonify({"status": "error", "message": "No notes or text provided"}), 400
 
-    # Enforce daily flashcard limit for basic plan
-    from flask import session
+    # Enforce the daily flashcard limit for the user's plan
     user_email = session.get("user_email")
     if not user_email:
         return jsonify({"status": "error", "message": "Not logged in."}), 401
 
-    from datetime import datetime, timedelta
-    import pytz
-    # Use UTC for consistency
-    now = datetime.utcnow()
-    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Query flashcards created today by this user
-    result = supabase.table("flashcards").select("created_at").eq("email", user_email).gte("created_at", start_of_day.isoformat()).lte("created_at", end_of_day.isoformat()).execute()
-    flashcards_today = len(result.data) if result.data else 0
-    DAILY_LIMIT = 10
-    if flashcards_today >= DAILY_LIMIT:
-        return jsonify({
-            "status": "limit",
-            "message": f"You have reached your daily limit of {DAILY_LIMIT} flashcards. Please upgrade your plan to continue generating more."
-        }), 403
+    # Users already known to be over their limit are rejected from cache
+    cached_quota = services.quota.check(user_email)
+    if cached_quota and cached_quota.exhausted:
+        QUOTA_REJECTIONS.inc(plan=cached_quota.plan or "unknown")
+        return jsonify(quota_response(cached_quota)), 403
 
-    # Create questions based on the input text
-    try:
-        text_sentences = [s.strip() for s in notes.split('.') if s.strip()]
-        questions = []
-        question_templates = [
-            "What is the main concept about: {}?",
-            "Explain the key point: {}",
-            "What does this statement mean: {}?",
-            "Summarize the following: {}",
-            "What are the important details about: {}?"
-        ]
-        for i, sentence in enumerate(text_sentences[:5]):  # Limit to 5 questions
-            if len(sentence) > 15:
-                template = question_templates[i % len(question_templates)]
-                question = template.format(sentence[:60] + "..." if len(sentence) > 60 else sentence)
-                answer = sentence
-                questions.append({"question": question, "answer": answer})
-        if not questions:
-            words = notes.split()
-            if len(words) > 20:
-                chunk_size = max(1, len(words) // 5)
-                for i in range(5):
-                    start = i * chunk_size
-                    end = start + chunk_size if i < 4 else len(words)
-                    chunk = " ".join(words[start:end])
-                    if len(chunk) > 20:
-                        question = f"What are the key points in this section: {chunk[:50]}..."
-                        questions.append({"question": question, "answer": chunk})
-            else:
-                questions = [{
-                    "question": "What are the key points from the provided notes?",
-                    "answer": notes[:300] + "..." if len(notes) > 300 else notes
-                }]
-            questions = questions[:5]
-    except Exception as e:
-        return jsonify({"status": "error", "message": f"Failed to generate questions: {e}"}), 500
+    # Identical notes reuse the cards generated the first time
+    hf_client = services.hf_client
+    cache_key = content_hash(notes, variant="hf:5" if hf_client else "local:5") if isinstance(notes, str) else None
+    questions = services.generation_cache.get(cache_key) if cache_key else None
 
-    # Only insert up to the remaining daily limit
-    remaining = DAILY_LIMIT - flashcards_today
-    questions_to_insert = questions[:remaining]
-    inserted = []
-    for q in questions_to_insert:
+    # Create questions based on the input text
+    if questions is None:
+        # The generator (and numpy) is loaded by the first /generate call
+        from flashcards.generator import generate_flashcards
         try:
-            res = supabase.table("flashcards").insert({
-                "question": q["question"],
-                "answer": q["answer"],
-                "email": user_email
-            }).execute()
-            if res.data:
-                inserted.append(res.data[0])
+            questions = generate_flashcards(
+                notes, top_n=5, question_writer=hf_client.generate_questions if hf_client else None)
         except Exception as e:
-            print("Supabase insert error:", e)
+            return jsonify({"status": "error", "message": f"Failed to generate questions: {e}"}), 500
+        if cache_key and questions:
+            services.generation_cache.put(cache_key, questions)
+
+    # Atomically reserve quota; only insert up to what was granted
+    try:
+        grant = services.quota.consume(user_email, len(questions))
+    except Exception:
+        logger.exception("Quota check error")
+        return jsonify({"status": "error", "message": "Could not check your daily limit. Please try again."}), 503
+    if grant.granted <= 0:
+        QUOTA_REJECTIONS.inc(plan=grant.plan or "unknown")
+        return jsonify(quota_response(grant)), 403
+    questions_to_insert = questions[:grant.granted]
+    try:
+        # Card text is stored once per distinct question/answer pair
+        body_hashes, session_id = run_parallel(
+            lambda: store_bodies(services.supabase, questions_to_insert),
+            lambda: create_session(services.supabase, user_email),
+        )
+    except Exception:
+        logger.exception("Supabase flashcard session error")
+        try:
+            services.quota.release(user_email, grant.granted)
+        except Exception:
+            logger.exception("Quota release error")
+        return jsonify({"status": "error", "message": "Failed to save flashcards. Please try again."}), 500
+    rows = [{"body_hash": body_hash, "email": user_email, "session_id": session_id, "insert_key": str(uuid.uuid4())}
+            for body_hash in body_hashes]
+    inserted = []
+    insert_errors = []
+    pending = bool(services.flashcard_buffer)
+    if pending:
+        # Write-behind: rows are persisted shortly after the response is sent
+        def when_written(future):
+            if future.exception() is not None:
+                failed = len(rows)
+                logger.error("Write-behind flashcard insert error", extra={"fields": {"error": str(future.exception())}})
+            else:
+                result = future.result()
+                index_new_cards(user_email, questions_to_insert, body_hashes, result.inserted)
+                failed = len(result.errors)
+                for error in result.errors:
+                    logger.error("Supabase insert error", extra={"fields": {"error": error["message"]}})
+            # Rows that were never stored should not count against the limit
+            if failed:
+                try:
+                    services.quota.release(user_email, failed)
+                    if failed == len(rows):
+                        delete_session(services.supabase, session_id)
+                except Exception:
+                    logger.exception("Quota release error")
+
+        services.flashcard_buffer.submit(rows).add_done_callback(when_written)
+    else:
+        insert_result = insert_flashcards(services.supabase, rows)
+        inserted = insert_result.inserted
+        index_new_cards(user_email, questions_to_insert, body_hashes, inserted)
+        insert_errors = [{"index": e["index"], "message": e["message"]} for e in insert_result.errors]
+        for error in insert_errors:
+            logger.error("Supabase insert error", extra={"fields": {"error": error["message"]}})
+        if insert_errors:
+            # Rows that were never stored should not count against the limit
+            try:
+                services.quota.release(user_email, len(insert_errors))
+                if not inserted:
+                    delete_session(services.supabase, session_id)
+            except Exception:
+                logger.exception("Quota release error")
+    services.dashboard_cache.invalidate(user_email)
 
     return jsonify({
         "status": "ok",
         "questions": questions_to_insert,
         "inserted": inserted,
-        "remaining": DAILY_LIMIT - (flashcards_today + len(inserted)),
-        "limit": DAILY_LIMIT
+        "errors": insert_errors,
+        # With write-behind the rows are still being written: inserted and errors stay empty, and the
+        # cards can be matched later by the insert_key each row is stored with
+        "pending": pending,
+        "insert_keys": [row["insert_key"] for row in rows],
+        "session_id": session_id,
+        "remaining": grant.remaining + len(insert_errors) if grant.remaining is not None else None,
+        "limit": grant.limit
     })
 
-if __name__ == "__main__":
-    import os
+def index_new_cards(user_email, cards, body_hashes, inserted):
+    """Add cards /generate just stored to the user's search index, if the backend keeps one"""
+    texts = dict(zip(body_hashes, cards))
+    try:
+        services.search.add(user_email, [dict(texts[row["body_hash"]], id=row["id"])
+                                         for row in inserted if row.get("body_hash") in texts])
+    except Exception:
+        logger.exception("Search index update error")
+
+app = create_app()
 
+if __name__ == "__main__":
     # Get the port assigned by Render, default to 5000 locally
     port = int(os.environ.get("PORT", 5000))
     
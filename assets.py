@@ -0,0 +1,276 @@
+"""
+Fingerprinted, precompressed static assets
+
+A build step copies every file in static/ to static/dist/ under a name
+that includes a hash of its content (style.css -> style.3f2a1b9c0d12.css),
+writes gzip and brotli variants of text assets next to it, and records the
+mapping in static/dist/manifest.json:
+
+    python -m assets build
+
+When the manifest exists, init_app() makes url_for('static', filename=...)
+emit the fingerprinted name, and serves those names with a year-long
+immutable Cache-Control, picking the .br or .gz variant the client accepts.
+Files are handed to the server as paths, so servers that implement
+wsgi.file_wrapper with sendfile (gunicorn does) send them without copying
+through Python; set USE_X_SENDFILE to let a fronting nginx or Apache send
+them instead. Without a build, static files are served as before.
+
+A build adds to static/dist/ rather than replacing it: files of the last
+few builds stay, and are still served, so a page rendered before a deploy
+keeps loading its assets. Older files are pruned by the build itself.
+
+Assets.version is a digest of the manifest and the templates, so responses
+validated by ETag (the dashboard) change whenever a deploy changes what
+they would render.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional
+
+from flask import request, send_file, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST = "manifest.json"
+# Every kept build's manifest, oldest first
+BUILDS = "builds.json"
+# Files of the last KEEP_BUILDS builds, and of any build in the last KEEP_DAYS, are kept
+KEEP_BUILDS = 3
+KEEP_DAYS = 7.0
+
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".xml", ".map"}
+# Encoding -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _compress(path: str) -> Dict[str, int]:
+    """Write .gz and .br variants of path where they are smaller; returns their sizes"""
+    with open(path, "rb") as f:
+        data = f.read()
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        variants[".br"] = brotli.compress(data, quality=11)
+    except ImportError:
+        logger.warning("brotli is not installed; skipping .br variants")
+    sizes = {}
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            sizes[suffix] = len(compressed)
+    return sizes
+
+
+def _load_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path: str, value) -> None:
+    # Written beside the target and renamed over it, so a worker never reads half a file
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "w") as f:
+        json.dump(value, f, indent=2, sort_keys=True)
+    os.replace(partial, path)
+
+
+def _prune(dist_dir: str, builds: List[dict]) -> int:
+    """Delete built files that no kept build refers to; returns how many were removed"""
+    kept = {MANIFEST, BUILDS}
+    for entry in builds:
+        for built in entry["manifest"].values():
+            kept.update([built] + [built + suffix for _, suffix in ENCODINGS])
+    removed = 0
+    for directory, subdirs, files in os.walk(dist_dir, topdown=False):
+        for name in files:
+            path = os.path.join(directory, name)
+            if os.path.relpath(path, dist_dir).replace(os.sep, "/") not in kept:
+                os.remove(path)
+                removed += 1
+        if directory != dist_dir and not os.listdir(directory):
+            os.rmdir(directory)
+    return removed
+
+
+def build(static_dir: str = STATIC_DIR, dist_dir: str = DIST_DIR, keep_builds: int = KEEP_BUILDS,
+          keep_days: float = KEEP_DAYS) -> Dict[str, str]:
+    """
+    Fingerprint and precompress every file in static_dir; returns the manifest
+
+    Files from earlier builds are left in place, so pages rendered before a
+    deploy (and workers still running the old code) keep finding the assets
+    they name. A file is deleted only once no build among the last
+    keep_builds, or newer than keep_days, refers to it.
+    """
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    for directory, subdirs, files in os.walk(static_dir):
+        subdirs[:] = [d for d in subdirs if os.path.join(directory, d) != dist_dir and not d.startswith(".")]
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            source = os.path.join(directory, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            stem, ext = os.path.splitext(logical)
+            built = f"{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(dist_dir, built)
+            manifest[logical] = built
+            # The name is the content hash: an existing file is already this one, and may be being served.
+            # New files are written under a temporary name and renamed, variants first, so the name
+            # only ever appears complete
+            if os.path.exists(target):
+                print(f"{logical:24} -> {built:32} unchanged")
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            partial = f"{target}.{os.getpid()}.tmp"
+            shutil.copy2(source, partial)
+            sizes = _compress(partial) if ext.lower() in COMPRESSIBLE else {}
+            for suffix in sizes:
+                os.replace(partial + suffix, target + suffix)
+            os.replace(partial, target)
+            print(f"{logical:24} -> {built:32} {os.path.getsize(source):8d}B"
+                  + "".join(f"  {suffix} {size}B" for suffix, size in sorted(sizes.items())))
+
+    now = time.time()
+    previous = os.path.join(dist_dir, MANIFEST)
+    if not os.path.exists(os.path.join(dist_dir, BUILDS)) and os.path.exists(previous):
+        # A dist/ built before the history was kept: its manifest is the one earlier build
+        history = [{"built_at": os.path.getmtime(previous), "manifest": _load_json(previous, {})}]
+    else:
+        history = _load_json(os.path.join(dist_dir, BUILDS), [])
+    builds = [entry for entry in history if entry["manifest"] != manifest]
+    builds.append({"built_at": now, "manifest": manifest})
+    builds = [entry for index, entry in enumerate(builds)
+              if index >= len(builds) - keep_builds or now - entry["built_at"] < keep_days * 86400]
+    _write_json(os.path.join(dist_dir, BUILDS), builds)
+    _write_json(os.path.join(dist_dir, MANIFEST), manifest)
+    removed = _prune(dist_dir, builds)
+    if removed:
+        print(f"{removed} files from older builds removed", file=sys.stderr)
+    return manifest
+
+
+def _digest_tree(directory: str) -> str:
+    """Hash of every file's path and content under directory"""
+    digest = hashlib.sha256()
+    for current, subdirs, files in os.walk(directory):
+        subdirs.sort()
+        for name in sorted(files):
+            path = os.path.join(current, name)
+            digest.update(os.path.relpath(path, directory).encode("utf-8") + b"\x00")
+            digest.update(_fingerprint(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+class Assets:
+    """Manifest lookups and the static view for built assets"""
+
+    def __init__(self, static_dir: str = STATIC_DIR, dist_dir: str = DIST_DIR, template_dir: str = None):
+        self.static_dir = static_dir
+        self.dist_dir = dist_dir
+        self.manifest: Dict[str, str] = {}
+        # fingerprinted name -> encodings with a precompressed variant on disk
+        self.variants: Dict[str, tuple] = {}
+        self.manifest = _load_json(os.path.join(dist_dir, MANIFEST), {})
+        if self.manifest:
+            # Names from earlier kept builds are still served, for pages rendered before the deploy
+            names = {built for entry in _load_json(os.path.join(dist_dir, BUILDS), [])
+                     for built in entry["manifest"].values()}
+            for built in names.union(self.manifest.values()):
+                file = os.path.join(dist_dir, built)
+                if os.path.exists(file):
+                    self.variants[built] = tuple((encoding, suffix) for encoding, suffix in ENCODINGS
+                                                 if os.path.exists(file + suffix))
+        # Changes whenever a deploy changes a template or a built asset
+        digest = hashlib.sha256(json.dumps(self.manifest, sort_keys=True).encode("utf-8"))
+        if template_dir and os.path.isdir(template_dir):
+            digest.update(_digest_tree(template_dir).encode("ascii"))
+        self.version = digest.hexdigest()[:16]
+
+    def url_defaults(self, endpoint: str, values: dict) -> None:
+        if endpoint == "static":
+            built = self.manifest.get(values.get("filename"))
+            if built:
+                values["filename"] = built
+
+    def _encoding(self, built: str) -> Optional[tuple]:
+        accepted = request.accept_encodings
+        for encoding, suffix in self.variants.get(built, ()):
+            if accepted[encoding]:
+                return encoding, suffix
+        return None
+
+    def serve(self, filename: str):
+        if filename not in self.variants:
+            # Unbuilt (or logical) names: served as Flask would, with its default caching
+            return send_from_directory(self.static_dir, filename)
+        path = os.path.join(self.dist_dir, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        chosen = self._encoding(filename)
+        if chosen is None:
+            response = send_file(path, mimetype=mimetype, conditional=True)
+        else:
+            encoding, suffix = chosen
+            response = send_file(path + suffix, mimetype=mimetype, conditional=True,
+                                 etag=f"{filename}{suffix}")
+            response.headers["Content-Encoding"] = encoding
+        if self.variants[filename]:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+def init_app(app) -> Assets:
+    template_dir = os.path.join(app.root_path, app.template_folder) if app.template_folder else None
+    assets = Assets(app.static_folder or STATIC_DIR, os.getenv("ASSET_DIST_DIR", DIST_DIR), template_dir)
+    app.extensions["assets"] = assets
+    if not assets.manifest:
+        return assets
+    app.url_defaults(assets.url_defaults)
+    # Replace Flask's static view; the /static/<path:filename> rule is kept
+    app.view_functions["static"] = assets.serve
+    if os.getenv("USE_X_SENDFILE", "").lower() in ("1", "true", "yes"):
+        app.config["USE_X_SENDFILE"] = True
+    return assets
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help=f"write {os.path.relpath(DIST_DIR, ROOT)} and its manifest")
+    build_parser.add_argument("--keep-builds", type=int, default=KEEP_BUILDS,
+                              help="keep the files of this many most recent builds (default %(default)s)")
+    build_parser.add_argument("--keep-days", type=float, default=KEEP_DAYS,
+                              help="and of every build newer than this many days (default %(default)s)")
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        manifest = build(keep_builds=max(1, args.keep_builds), keep_days=args.keep_days)
+        print(f"{len(manifest)} assets written to {os.path.relpath(DIST_DIR, ROOT)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Peak memory of exporting a large deck through /export
+
+Each run starts a fresh interpreter that serves GET /export through the
+test client against a stub that generates --cards flashcards on the fly
+(so the stub itself holds no deck), reads the streamed body chunk by
+chunk, and reports how far the process's peak RSS grew during the export.
+--naive instead loads the whole deck with one query and serializes it at
+once, for comparison. Exits non-zero if the streamed export grows peak RSS
+by more than --max-rss-mb or regresses against a saved baseline.
+
+Usage:
+    python benchmarks/bench_export.py [--cards 100000] [--formats csv,jsonl,anki] [--gzip] [--naive]
+    python benchmarks/bench_export.py --save instance/export_baseline.json
+    python benchmarks/bench_export.py --baseline instance/export_baseline.json [--tolerance 0.25]
+"""
+import argparse
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EMAIL = "bench@example.com"
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, stub):
+        self.stub = stub
+        self.after = 0
+        self.size = None
+
+    def select(self, *columns, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def gt(self, column, value):
+        self.after = value
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, size):
+        self.size = size
+        return self
+
+    def execute(self):
+        time.sleep(self.stub.latency)
+        end = self.stub.cards if self.size is None else min(self.stub.cards, self.after + self.size)
+        return _Response([self.stub.card(i) for i in range(self.after + 1, end + 1)])
+
+
+class StubClient:
+    """Answers flashcard_cards keyset queries with generated rows"""
+
+    def __init__(self, cards: int, latency: float):
+        self.cards = cards
+        self.latency = latency
+
+    def table(self, name):
+        return _Query(self)
+
+    @staticmethod
+    def card(i):
+        return {
+            "id": i,
+            "question": f"Which process, described in study note {i}, converts light energy into chemical energy?",
+            "answer": f"Photosynthesis (note {i}): chlorophyll absorbs light, water is split, and the Calvin "
+                      f"cycle fixes carbon dioxide into sugars.",
+            "created_at": "2025-01-01T12:00:00.000000+00:00",
+            "session_id": f"00000000-0000-4000-8000-{i // 10:012d}",
+        }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def child(spec):
+    import app
+    from flashcards.export import serialize
+    from telemetry.tracing import TracedClient
+
+    stub = StubClient(spec["cards"], spec["latency"])
+    app.services.supabase = TracedClient(stub)
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session["user_email"] = EMAIL
+    client.get("/export?format=jsonl").close()  # warm up imports and the first request
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    size = lines = 0
+    if spec["naive"]:
+        rows = stub.table("flashcard_cards").select("*").eq("email", EMAIL).execute().data
+        body = "".join(serialize([rows], spec["format"])).encode("utf-8")
+        lines = body.count(b"\n")
+        size = len(gzip.compress(body, 6) if spec["gzip"] else body)
+    else:
+        response = client.get(f"/export?format={spec['format']}",
+                              headers={"Accept-Encoding": "gzip"} if spec["gzip"] else {})
+        assert response.status_code == 200, response.status_code
+        assert (response.headers.get("Content-Encoding") == "gzip") == spec["gzip"]
+        decompressor = zlib.decompressobj(31) if spec["gzip"] else None
+        for chunk in response.response:
+            size += len(chunk)
+            lines += (decompressor.decompress(chunk) if decompressor else chunk).count(b"\n")
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "rss_growth_mb": peak_rss_mb() - before,
+        "seconds": elapsed,
+        "bytes": size,
+        "lines": lines,
+    }))
+
+
+def run(spec):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+                         cwd=ROOT, env=dict(os.environ, CHAPA_SECRET_KEY="", LOG_LEVEL="WARNING"),
+                         capture_output=True, text=True)
+    if out.returncode:
+        sys.exit(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--formats", default="csv,jsonl,anki")
+    parser.add_argument("--gzip", action="store_true", help="request Content-Encoding: gzip")
+    parser.add_argument("--naive", action="store_true", help="also measure loading the whole deck at once")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every page query")
+    parser.add_argument("--max-rss-mb", type=float, default=32, help="fail if a streamed export grows peak RSS more")
+    parser.add_argument("--save", help="write this run's results to a JSON file")
+    parser.add_argument("--baseline", help="fail if worse than this saved result by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child))
+        return
+
+    # Header lines each format writes before the cards
+    header_lines = {"csv": 1, "jsonl": 0, "anki": 3}
+    modes = ["stream", "naive"] if args.naive else ["stream"]
+    results = {}
+    failures = []
+    print(f"{'format':8} {'mode':7} {'cards':>8} {'MB out':>8} {'seconds':>8} {'peak RSS growth':>16}")
+    for fmt in args.formats.split(","):
+        for mode in modes:
+            result = run({"cards": args.cards, "format": fmt, "gzip": args.gzip,
+                          "naive": mode == "naive", "latency": args.latency})
+            print(f"{fmt:8} {mode:7} {args.cards:8} {result['bytes'] / 2 ** 20:8.1f} "
+                  f"{result['seconds']:8.2f} {result['rss_growth_mb']:14.1f}MB")
+            if result["lines"] != args.cards + header_lines[fmt]:
+                failures.append(f"{fmt} {mode}: {result['lines']} lines for {args.cards} cards")
+            if mode == "stream":
+                results[fmt] = {"rss_growth_mb": round(result["rss_growth_mb"], 1),
+                                "seconds": round(result["seconds"], 3)}
+                if result["rss_growth_mb"] > args.max_rss_mb:
+                    failures.append(f"{fmt}: peak RSS grew {result['rss_growth_mb']:.1f}MB "
+                                    f"(limit {args.max_rss_mb:.1f}MB)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for fmt, result in results.items():
+            before = baseline.get(fmt)
+            if not before:
+                continue
+            # Allow a few MB of allocator noise on top of the relative tolerance
+            if result["rss_growth_mb"] > before["rss_growth_mb"] * (1 + args.tolerance) + 4:
+                failures.append(f"{fmt}: peak RSS growth {result['rss_growth_mb']}MB vs {before['rss_growth_mb']}MB")
+            if result["seconds"] > before["seconds"] * (1 + args.tolerance):
+                failures.append(f"{fmt}: {result['seconds']}s vs {before['seconds']}s")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
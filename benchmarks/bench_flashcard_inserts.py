@@ -0,0 +1,135 @@
+"""
+Compare per-row and batched flashcard insert latency against a local stub
+
+The stub mimics the supabase-py call chain used by app.py
+(client.table(...).insert(...).execute()) and sleeps for a fixed round-trip
+time per execute(), so the numbers show how many round trips each write
+path costs rather than how fast a real database is.
+
+Usage:
+    python benchmarks/bench_flashcard_inserts.py [--rtt-ms 40] [--requests 200] [--concurrency 16]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flashcards.store import insert_flashcards, WriteBehindBuffer
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Insert:
+    def __init__(self, stub, rows):
+        self.stub = stub
+        self.rows = rows if isinstance(rows, list) else [rows]
+
+    def execute(self):
+        time.sleep(self.stub.rtt)
+        with self.stub.lock:
+            self.stub.round_trips += 1
+            stored = []
+            for row in self.rows:
+                self.stub.next_id += 1
+                stored.append(dict(row, id=self.stub.next_id))
+        return _Response(stored)
+
+
+class _Table:
+    def __init__(self, stub):
+        self.stub = stub
+
+    def insert(self, rows):
+        return _Insert(self.stub, rows)
+
+
+class StubClient:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self.next_id = 0
+
+    def table(self, name):
+        return _Table(self)
+
+
+def _rows(n, email):
+    return [{"question": f"Q{i}", "answer": f"A{i}", "email": email} for i in range(n)]
+
+
+def per_row(client, rows):
+    for row in rows:
+        client.table("flashcards").insert(row).execute()
+
+
+def batched(client, rows):
+    insert_flashcards(client, rows)
+
+
+def run(label, write, rtt, requests, concurrency, cards):
+    client = StubClient(rtt)
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        write(client, _rows(cards, f"user{i}@example.com"))
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    report(label, latencies, elapsed, client.round_trips)
+
+
+def run_write_behind(rtt, requests, concurrency, cards):
+    client = StubClient(rtt)
+    buffer = WriteBehindBuffer(client, max_rows=200, max_delay=0.01)
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        buffer.submit(_rows(cards, f"user{i}@example.com")).result()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    buffer.close()
+    report("write-behind (awaited)", latencies, elapsed, client.round_trips)
+
+
+def report(label, latencies, elapsed, round_trips):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    print(f"{label:<24} p50={p50:8.1f}ms  p99={p99:8.1f}ms  "
+          f"throughput={len(latencies) / elapsed:8.1f} req/s  round_trips={round_trips}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="simulated round-trip time per execute()")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cards", type=int, default=5, help="flashcards per /generate call")
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000
+
+    run("per-row", per_row, rtt, args.requests, args.concurrency, args.cards)
+    run("batched", batched, rtt, args.requests, args.concurrency, args.cards)
+    run_write_behind(rtt, args.requests, args.concurrency, args.cards)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Flashcard generation engine over inputs from 1 KB to 10 MB
+
+Reports wall time, throughput and peak traced memory for each input size.
+Peak memory should stay roughly flat once the input is larger than a few
+chunks, because the engine never holds the whole text.
+
+Usage:
+    python benchmarks/bench_generator.py [--sizes 1K,100K,1M,10M]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flashcards.generator import generate_flashcards
+
+VOCABULARY = """photosynthesis chlorophyll mitochondria energy cell membrane protein enzyme glucose oxygen
+carbon dioxide nucleus ribosome respiration diffusion osmosis gene chromosome evolution species revolution
+empire treaty parliament economy inflation market supply demand equation velocity acceleration force mass
+gravity momentum electron proton neutron atom molecule reaction catalyst""".split()
+FILLER = "the a of to in is that and for with as by on are this from".split()
+
+
+def _size(text):
+    units = {"K": 1024, "M": 1024 * 1024}
+    return int(float(text[:-1]) * units[text[-1].upper()]) if text[-1].upper() in units else int(text)
+
+
+def write_notes(path, size, seed=0):
+    """Write deterministic pseudo-lecture text of roughly size bytes to path"""
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as out:
+        while written < size:
+            words = [rng.choice(VOCABULARY) if rng.random() < 0.4 else rng.choice(FILLER)
+                     for _ in range(rng.randint(6, 28))]
+            sentence = " ".join(words).capitalize() + ". "
+            out.write(sentence)
+            written += len(sentence)
+
+
+def run(label, path, size, top_n):
+    with open(path, encoding="utf-8") as stream:
+        start = time.perf_counter()
+        cards = generate_flashcards(stream, top_n=top_n)
+        elapsed = time.perf_counter() - start
+
+    # Separate run for memory: tracing allocations distorts timings
+    with open(path, encoding="utf-8") as stream:
+        tracemalloc.start()
+        generate_flashcards(stream, top_n=top_n)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:>6}: {elapsed * 1000:9.1f}ms  {size / elapsed / 1e6:6.2f} MB/s  "
+          f"peak={peak / 1024:8.1f} KiB  cards={len(cards)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1K,10K,100K,1M,10M")
+    parser.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in args.sizes.split(","):
+            size = _size(label)
+            path = os.path.join(tmp, f"notes_{label}.txt")
+            write_notes(path, size)
+            run(label, path, size, args.top_n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Login throughput against concurrency: inline KDF vs the hashing pool
+
+Simulates concurrent logins by verifying a password from N threads, once
+with check_password_hash called inline (the old request-thread behaviour)
+and once through PasswordHasher. Inline verification is serialized by the
+GIL; the process pool scales with CPU cores and rejects work beyond its
+queue limit instead of letting latency grow without bound.
+
+Usage:
+    python benchmarks/bench_password_hashing.py [--logins 64] [--concurrency 1,2,4,8,16]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from users.passwords import HasherBusy, PasswordHasher
+
+
+def run(label, verify, logins, concurrency):
+    latencies = []
+    rejected = 0
+
+    def login(_):
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            verify()
+        except HasherBusy:
+            rejected += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000 if latencies else 0
+    print(f"{label:<8} c={concurrency:<3} {len(latencies) / elapsed:7.1f} logins/s  "
+          f"p99={p99:8.1f}ms  rejected={rejected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--method", default="scrypt:32768:8:1")
+    parser.add_argument("--max-queue", type=int, default=32)
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash("correct horse battery staple", method=args.method)
+    hasher = PasswordHasher(method=args.method, max_queue=args.max_queue)
+    hasher.verify(pwhash, "warm up the pool")
+    print(f"method={args.method} workers={hasher.workers} max_queue={args.max_queue}")
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        run("inline", lambda: check_password_hash(pwhash, "correct horse battery staple"), args.logins, concurrency)
+        run("pool", lambda: hasher.verify(pwhash, "correct horse battery staple"), args.logins, concurrency)
+    hasher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Review queue latency on decks of growing size
+
+For every size in --decks, loads one user's deck (and --other-cards cards
+of other users) into a local SQLite database with the flashcards schema,
+the flashcard_cards view and the (email, due_at) index, points the app at
+it through a small adapter for the query builder calls the review queue
+makes, and times GET /api/review/next and POST /api/review/grade through
+the test client: each pop fetches --batch due cards and grades them all
+in one request. Half of every deck is due, spread over the last month.
+
+Pops walk the index, so their latency should not grow with the deck;
+--no-index drops it to show the per-user scan and sort it replaces. Exits
+non-zero if the median pop on the largest deck is more than --max-ratio
+times the one on the smallest, or if a run regresses against a baseline.
+
+Usage:
+    python benchmarks/bench_review.py [--decks 1000,10000,100000] [--pops 40] [--batch 10] [--no-index]
+    python benchmarks/bench_review.py --save instance/review_baseline.json
+    python benchmarks/bench_review.py --baseline instance/review_baseline.json [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FLASHCARDS_SCHEMA, SQLiteClient
+
+EMAIL = "bench@example.com"
+
+INDEX = "CREATE INDEX idx_flashcards_email_due_at ON flashcards(email, due_at)"
+
+
+def build_deck(path, cards, other_cards, index, rng):
+    db = sqlite3.connect(path)
+    db.executescript(FLASHCARDS_SCHEMA)
+    if index:
+        db.execute(INDEX)
+    now = datetime.now(timezone.utc)
+    bodies = [(f"{i:064x}", f"Question {i}?", f"Answer {i}.") for i in range(1000)]
+    db.executemany("INSERT INTO card_bodies VALUES (?, ?, ?)", bodies)
+
+    def rows(emails):
+        for i, email in enumerate(emails):
+            # Half the deck is overdue by up to a month, half due within the next one
+            due = now + timedelta(seconds=rng.uniform(-30, 30) * 86400)
+            yield email, bodies[i % len(bodies)][0], now.isoformat(), due.isoformat(timespec="microseconds")
+
+    insert = "INSERT INTO flashcards (email, body_hash, created_at, due_at) VALUES (?, ?, ?, ?)"
+    db.executemany(insert, rows([EMAIL] * cards))
+    db.executemany(insert, rows(f"user{i % 500}@bench.local" for i in range(other_cards)))
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_deck(app_module, cards, args, workdir, rng):
+    path = os.path.join(workdir, f"deck-{cards}.sqlite3")
+    build_deck(path, cards, args.other_cards, not args.no_index, rng)
+    stub = SQLiteClient(path)
+    from telemetry.tracing import TracedClient
+    app_module.services.supabase = TracedClient(stub)
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user_email"] = EMAIL
+    client.get(f"/api/review/next?limit={args.batch}")  # warm up
+
+    next_times, grade_times = [], []
+    stub.calls.clear()
+    for _ in range(args.pops):
+        start = time.perf_counter()
+        response = client.get(f"/api/review/next?limit={args.batch}")
+        next_times.append(time.perf_counter() - start)
+        due = response.get_json()["cards"]
+        assert response.status_code == 200 and len(due) == args.batch, response.get_data(as_text=True)
+
+        grades = [{"id": card["id"], "grade": rng.choice(("again", "hard", "good", "easy"))} for card in due]
+        start = time.perf_counter()
+        response = client.post("/api/review/grade", json={"grades": grades})
+        grade_times.append(time.perf_counter() - start)
+        assert response.status_code == 200 and not response.get_json()["missing"], response.get_data(as_text=True)
+
+    query = stub.table("flashcard_cards").select("id").eq("email", EMAIL) \
+        .lte("due_at", datetime.now(timezone.utc).isoformat()).order("due_at").limit(args.batch + 1)
+    plan = stub.db.execute("EXPLAIN QUERY PLAN " + query.sql(), query.params).fetchall()
+    return {
+        "next_p50_ms": round(statistics.median(next_times) * 1000, 3),
+        "next_p99_ms": round(percentile(next_times, 0.99) * 1000, 3),
+        "grade_p50_ms": round(statistics.median(grade_times) * 1000, 3),
+        "grade_p99_ms": round(percentile(grade_times, 0.99) * 1000, 3),
+        "queries_per_pop": sum(stub.calls.values()) / args.pops,
+        "plan": "; ".join(row[-1] for row in plan),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--decks", default="1000,10000,100000", help="comma-separated deck sizes")
+    parser.add_argument("--other-cards", type=int, default=50_000, help="cards belonging to other users")
+    parser.add_argument("--pops", type=int, default=40)
+    parser.add_argument("--batch", type=int, default=10, help="cards fetched and graded per pop")
+    parser.add_argument("--no-index", action="store_true", help="drop the (email, due_at) index")
+    parser.add_argument("--max-ratio", type=float, default=2.0,
+                        help="fail if the largest deck's median pop is this many times the smallest's")
+    parser.add_argument("--save", help="write this run's results to a JSON file")
+    parser.add_argument("--baseline", help="fail if worse than this saved result by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.update({"CHAPA_SECRET_KEY": "", "LOG_LEVEL": "WARNING"})
+    import app
+
+    rng = random.Random(args.seed)
+    decks = sorted(int(size) for size in args.decks.split(","))
+    if args.pops * args.batch > min(decks) // 2:
+        sys.exit(f"--pops x --batch must not exceed the due half of the smallest deck ({min(decks) // 2})")
+
+    results = {}
+    print(f"{'cards':>8} {'next p50':>9} {'p99':>8} {'grade p50':>10} {'p99':>8} {'queries/pop':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for cards in decks:
+            result = run_deck(app, cards, args, workdir, rng)
+            results[str(cards)] = result
+            print(f"{cards:8} {result['next_p50_ms']:7.2f}ms {result['next_p99_ms']:6.2f}ms "
+                  f"{result['grade_p50_ms']:8.2f}ms {result['grade_p99_ms']:6.2f}ms {result['queries_per_pop']:12.1f}")
+    print(f"query plan: {results[str(decks[-1])]['plan']}")
+
+    failures = []
+    smallest, largest = results[str(decks[0])], results[str(decks[-1])]
+    for key in ("next_p50_ms", "grade_p50_ms"):
+        ratio = largest[key] / smallest[key]
+        if len(decks) > 1 and ratio > args.max_ratio:
+            failures.append(f"{key}: {largest[key]}ms at {decks[-1]} cards is {ratio:.1f}x "
+                            f"{smallest[key]}ms at {decks[0]} cards (limit {args.max_ratio}x)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for cards, result in results.items():
+            before = baseline.get(cards)
+            if not before:
+                continue
+            for key in ("next_p50_ms", "grade_p50_ms"):
+                if result[key] > before[key] * (1 + args.tolerance):
+                    failures.append(f"{cards} cards: {key} {result[key]}ms vs {before[key]}ms")
+            if result["queries_per_pop"] > before["queries_per_pop"]:
+                failures.append(f"{cards} cards: {result['queries_per_pop']} queries per pop "
+                                f"vs {before['queries_per_pop']}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
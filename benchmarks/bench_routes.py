@@ -0,0 +1,289 @@
+"""
+Per-route load test against local Supabase, SMTP and Chapa stand-ins
+
+Runs scripted workloads through the real app (routes, stores, caches,
+quota, outbox, webhook queue) with Supabase replaced by FakeSupabase and
+SMTP/Chapa pointed at local fake servers, each adding --latency seconds
+per call. For every route it reports throughput, latency percentiles and
+upstream calls per request. Save a run with --save and compare a later
+one with --baseline: the run fails if throughput drops or p99 grows by
+more than --tolerance, or if any route makes more upstream calls per
+request than before.
+
+Usage:
+    python benchmarks/bench_routes.py [--requests 200] [--concurrency 8] [--latency 0.02]
+        [--routes login,dashboard,generate,webhook,verify_payment,signup,search,review_next,review_grade]
+    python benchmarks/bench_routes.py --save instance/routes_baseline.json
+    python benchmarks/bench_routes.py --baseline instance/routes_baseline.json [--tolerance 0.25]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeChapaServer, FakeSMTPServer, FakeSupabase
+
+WEBHOOK_SECRET = "bench-webhook-secret"
+PASSWORD = "correct horse battery staple"
+
+WORDS = (
+    "cell membrane protein energy enzyme glucose oxygen carbon nucleus mitochondria "
+    "photosynthesis respiration chlorophyll molecule reaction gradient transport signal "
+    "receptor pathway hormone tissue organ evolution selection mutation population"
+).split()
+
+
+def make_notes(rng, sentences=8):
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+
+def configure_environment(smtp, chapa, workdir):
+    # Point the app at the stand-ins; tunables can still be set by the caller
+    os.environ.update({
+        "SMTP_SERVER": smtp.host,
+        "SMTP_PORT": str(smtp.port),
+        "SMTP_USER": "bench@example.com",
+        "SMTP_PASSWORD": "bench",
+        "SMTP_STARTTLS": "false",
+        "CHAPA_BASE_URL": chapa.base_url,
+        "CHAPA_SECRET_KEY": "bench-secret",
+        "CHAPA_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_QUEUE_PATH": os.path.join(workdir, "webhooks.sqlite3"),
+        "HUGGINGFACE_API_KEY": "",
+    })
+    os.environ.setdefault("QUOTA_BACKEND", "supabase")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def seed(db, users, sessions_per_user, cards_per_session, password_hash):
+    emails = [f"user{i}@bench.local" for i in range(users)]
+    db.seed("users", [{"name": f"User {i}", "email": email, "password": password_hash, "verified": True,
+                       "avatar": None, "subscription_status": "pro"} for i, email in enumerate(emails)])
+    now = datetime.now(timezone.utc)
+    bodies = [{"hash": hashlib.sha256(str(i).encode()).hexdigest(), "question": f"Question {i}?",
+               "answer": f"Answer {i}."} for i in range(200)]
+    db.seed("card_bodies", bodies)
+    for email in emails:
+        for s in range(sessions_per_user):
+            session_id = str(uuid.uuid4())
+            created_at = (now - timedelta(minutes=s)).isoformat()
+            db.seed("generation_sessions", [{"id": session_id, "email": email, "created_at": created_at}])
+            db.seed("flashcards", [{"email": email, "session_id": session_id, "created_at": created_at,
+                                    "body_hash": bodies[(s * cards_per_session + c) % len(bodies)]["hash"]}
+                                   for c in range(cards_per_session)])
+    return emails
+
+
+def build_workloads(emails, rng, repeat_ratio):
+    notes_seen = []
+    tx_refs = [f"bench-verify-{i}" for i in range(50)]
+    signup_ids = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def login(client, i):
+        return client.post("/api/login", json={"email": emails[i % len(emails)], "password": PASSWORD})
+
+    def dashboard(client, i):
+        return client.get(f"/dashboard?page={i % 3 + 1}")
+
+    def generate(client, i):
+        with lock:
+            if notes_seen and rng.random() < repeat_ratio:
+                notes = rng.choice(notes_seen)
+            else:
+                notes = make_notes(rng)
+                notes_seen.append(notes)
+        return client.post("/generate", json={"notes": notes})
+
+    def webhook(client, i):
+        body = json.dumps({"tx_ref": f"bench-webhook-{uuid.uuid4().hex}", "status": "success",
+                           "amount": "10.00", "currency": "USD", "email": emails[i % len(emails)]}).encode()
+        signature = hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        return client.post("/payment-webhook", data=body, content_type="application/json",
+                           headers={"Chapa-Signature": signature})
+
+    def verify_payment(client, i):
+        return client.get(f"/verify-payment/{tx_refs[i % len(tx_refs)]}")
+
+    def signup(client, i):
+        with lock:
+            n = next(signup_ids)
+        return client.post("/api/signup", json={"name": "New User", "email": f"new{n}@bench.local",
+                                                "password": PASSWORD})
+
+    def search(client, i):
+        return client.get(f"/api/search?q={rng.choice(['question', 'answer', 'quest 1', 'ans'])}"
+                          f"&page={i % 2 + 1}")
+
+    def review_next(client, i):
+        return client.get("/api/review/next?limit=10")
+
+    def review_grade(client, i):
+        cards = client.get("/api/review/next?limit=5").get_json()["cards"]
+        return client.post("/api/review/grade", json={"grades": [{"id": card["id"], "grade": rng.randint(2, 5)}
+                                                                 for card in cards]})
+
+    return {"login": login, "dashboard": dashboard, "generate": generate, "webhook": webhook,
+            "verify_payment": verify_payment, "signup": signup, "search": search, "review_next": review_next,
+            "review_grade": review_grade}
+
+
+def settle(services, timeout=30.0):
+    """Wait for background work (mail, webhooks, write-behind) started by a workload"""
+    deadline = time.time() + timeout
+    if services.flashcard_buffer:
+        services.flashcard_buffer.flush()
+    idle_polls = 0
+    last_sent = None
+    # Idle means empty queues and no mail sent since the last poll, since a
+    # batch taken off the outbox queue is still being delivered
+    while time.time() < deadline and idle_polls < 3:
+        outbox = services.__dict__.get("outbox")
+        queue = services.__dict__.get("webhook_queue")
+        stats = outbox.stats() if outbox is not None else {}
+        sent = stats.get("sent", 0) + stats.get("failed", 0)
+        busy = stats.get("queue_depth") or stats.get("retry_depth") or sent != last_sent
+        pending = queue is not None and any(queue.stats().get(state) for state in ("pending", "processing"))
+        idle_polls = 0 if busy or pending else idle_polls + 1
+        last_sent = sent
+        time.sleep(0.1)
+
+
+def run(name, call, flask_app, emails, requests_total, concurrency):
+    local = threading.local()
+    latencies = []
+    errors = 0
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = flask_app.test_client()
+            with local.client.session_transaction() as session:
+                session["user_email"] = emails[threading.get_ident() % len(emails)]
+        return local.client
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        response = call(client(), i)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+    return {"requests": requests_total, "req_s": round(requests_total / elapsed, 1), "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95), "p99_ms": percentile(0.99), "errors": errors}
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for route, result in results.items():
+        before = baseline.get(route)
+        if not before:
+            continue
+        if result["req_s"] < before["req_s"] * (1 - tolerance):
+            failures.append(f"{route}: {result['req_s']} req/s, baseline {before['req_s']}")
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            failures.append(f"{route}: p99 {result['p99_ms']}ms, baseline {before['p99_ms']}ms")
+        for call, per_request in result["upstream"].items():
+            if per_request > before["upstream"].get(call, 0) + 0.01:
+                failures.append(f"{route}: {call} {per_request}/request, baseline "
+                                f"{before['upstream'].get(call, 0)}/request")
+        if result["errors"] > before["errors"]:
+            failures.append(f"{route}: {result['errors']} errors, baseline {before['errors']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--routes",
+                        default="login,dashboard,generate,webhook,verify_payment,signup,search,review_next,review_grade")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every upstream call")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=30, help="seeded generation sessions per user")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="share of /generate calls with repeated notes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results to a JSON file")
+    parser.add_argument("--baseline", help="fail on regressions against a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-routes-")
+    smtp = FakeSMTPServer(latency=args.latency).start()
+    chapa = FakeChapaServer(latency=args.latency).start()
+    configure_environment(smtp, chapa, workdir)
+
+    from werkzeug.security import generate_password_hash
+
+    import app as app_module
+    from telemetry.tracing import TracedClient
+
+    services = app_module.services
+    db = FakeSupabase(latency=args.latency, jitter=args.jitter)
+    services.supabase = TracedClient(db)
+    emails = seed(db, args.users, args.sessions, 5,
+                  generate_password_hash(PASSWORD, method=services.passwords.method))
+    db.reset_calls()
+
+    rng = random.Random(args.seed)
+    workloads = build_workloads(emails, rng, args.repeat_ratio)
+    results = {}
+    print(f"{'route':<15}{'reqs':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}  upstream calls/request")
+    for route in args.routes.split(","):
+        result = run(route, workloads[route], app_module.app, emails, args.requests, args.concurrency)
+        settle(services)
+        calls = {name: count for name, count in db.reset_calls().items()}
+        calls.update({f"smtp.{name}": count for name, count in smtp.reset_calls().items()})
+        calls.update({f"chapa.{name}": count for name, count in chapa.reset_calls().items()})
+        result["upstream"] = {name: round(count / args.requests, 3) for name, count in sorted(calls.items())}
+        results[route] = result
+        upstream = ", ".join(f"{name} {per:g}" for name, per in result["upstream"].items()) or "none"
+        print(f"{route:<15}{result['requests']:>6}{result['req_s']:>9.1f}{result['p50_ms']:>8.1f}ms"
+              f"{result['p95_ms']:>7.1f}ms{result['p99_ms']:>7.1f}ms{result['errors']:>8}  {upstream}")
+
+    if "webhook" in results:
+        print(f"webhook queue: {services.webhook_queue.stats()}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    smtp.stop()
+    chapa.stop()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Search latency on a large deck with the in-process index
+
+Loads a --cards deck for one user (and --other-cards cards of other users)
+into a local SQLite database with the flashcards schema, runs the app with
+SEARCH_BACKEND=local against it, and times GET /api/search through the
+test client: the first search (which builds the user's index), then a mix
+of one-word, two-word, prefix and second-page queries drawn from the
+deck's Zipf-distributed vocabulary. It also checks that cards /generate
+stores are searchable straight away. Exits non-zero if p99 search latency
+exceeds --max-ms or regresses against a saved baseline.
+
+Usage:
+    python benchmarks/bench_search.py [--cards 100000] [--queries 500] [--max-ms 50]
+    python benchmarks/bench_search.py --save instance/search_baseline.json
+    python benchmarks/bench_search.py --baseline instance/search_baseline.json [--tolerance 0.25]
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FLASHCARDS_SCHEMA, SQLiteClient
+
+EMAIL = "bench@example.com"
+SYLLABLES = ("ab ac al an ar as bi bo ca ce chlo ci co cy de di do du e en er fi fo ge gi gly go hy "
+             "in io ka la le li lo lu ma me mi mo mu na ne ni no nu o pa pe phi pho po pro ra re ri ro "
+             "sa se si so sta su syn ta te ter thy ti to tri u va ve vi vo xy za ze zo").split()
+
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def sentence(rng, vocab, cum_weights, length):
+    return " ".join(rng.choices(vocab, cum_weights=cum_weights, k=length)).capitalize()
+
+
+def build_deck(path, cards, other_cards, vocab, cum_weights, rng):
+    db = sqlite3.connect(path)
+    db.executescript(FLASHCARDS_SCHEMA)
+    now = datetime.now(timezone.utc).isoformat()
+
+    def rows(emails):
+        for email in emails:
+            question = f"What is {sentence(rng, vocab, cum_weights, rng.randint(4, 9))}?"
+            answer = sentence(rng, vocab, cum_weights, rng.randint(10, 24)) + "."
+            body_hash = hashlib.sha256(f"{question}\n{answer}".encode()).hexdigest()
+            yield body_hash, question, answer, email, now
+
+    for batch in (rows([EMAIL] * cards), rows(f"user{i % 500}@bench.local" for i in range(other_cards))):
+        batch = list(batch)
+        db.executemany("INSERT OR IGNORE INTO card_bodies VALUES (?, ?, ?)", [row[:3] for row in batch])
+        db.executemany("INSERT INTO flashcards (body_hash, email, created_at, due_at) VALUES (?, ?, ?, ?)",
+                       [(row[0], row[3], row[4], row[4]) for row in batch])
+    db.commit()
+    db.close()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def queries(rng, vocab, cum_weights, count):
+    """(kind, query string, page) tuples"""
+    for i in range(count):
+        kind = ("word", "two words", "prefix", "page 2")[i % 4]
+        first, second = rng.choices(vocab, cum_weights=cum_weights, k=2)
+        if kind == "word":
+            yield kind, first, 1
+        elif kind == "two words":
+            yield kind, f"{first} {second}", 1
+        elif kind == "prefix":
+            yield kind, first[:max(3, len(first) - 2)], 1
+        else:
+            yield kind, first, 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--other-cards", type=int, default=20_000, help="cards belonging to other users")
+    parser.add_argument("--vocabulary", type=int, default=20_000, help="distinct words in the generated deck")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-ms", type=float, default=50, help="fail if p99 search latency is higher")
+    parser.add_argument("--save", help="write this run's results to a JSON file")
+    parser.add_argument("--baseline", help="fail if worse than this saved result by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.update({"CHAPA_SECRET_KEY": "", "LOG_LEVEL": "WARNING", "SEARCH_BACKEND": "local"})
+    import app
+    from telemetry.tracing import TracedClient
+
+    rng = random.Random(args.seed)
+    vocab = vocabulary(rng, args.vocabulary)
+    rng.shuffle(vocab)
+    # Zipf: the n-th most common word is n times rarer than the first
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocab) + 1)))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "deck.sqlite3")
+        start = time.perf_counter()
+        build_deck(path, args.cards, args.other_cards, vocab, cum_weights, rng)
+        print(f"deck of {args.cards} cards written in {time.perf_counter() - start:.1f}s")
+        stub = SQLiteClient(path)
+        app.services.supabase = TracedClient(stub)
+        client = app.app.test_client()
+        with client.session_transaction() as session:
+            session["user_email"] = EMAIL
+
+        start = time.perf_counter()
+        response = client.get(f"/api/search?q={vocab[0]}")
+        first_search = time.perf_counter() - start
+        assert response.status_code == 200 and response.get_json()["results"], response.get_data(as_text=True)
+        index = app.services.search._indexes.get(EMAIL)
+        postings_mb = sum(postings.buffer_info()[1] * postings.itemsize for postings in index.postings.values()) / 2 ** 20
+        print(f"first search (builds the index): {first_search:.2f}s, {len(index.terms)} terms, "
+              f"{postings_mb:.1f}MB of postings")
+
+        timings = {}
+        hits = 0
+        stub.calls.clear()
+        for kind, query, page in queries(rng, vocab, cum_weights, args.queries):
+            start = time.perf_counter()
+            response = client.get("/api/search", query_string={"q": query, "page": page})
+            timings.setdefault(kind, []).append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text=True)
+            hits += bool(response.get_json()["results"])
+        queries_per_search = sum(stub.calls.values()) / args.queries
+
+        # Cards stored by /generate are added to the index as they are inserted
+        marker = "zzqxmarker"
+        cards = [{"question": f"What is {marker} {i}?", "answer": f"The {marker} answer {i}."} for i in range(5)]
+        hashes = [hashlib.sha256(json.dumps(card).encode()).hexdigest() for card in cards]
+        with stub.db:
+            stub.db.executemany("INSERT INTO card_bodies VALUES (?, ?, ?)",
+                                [(h, c["question"], c["answer"]) for h, c in zip(hashes, cards)])
+            inserted = [{"id": stub.db.execute(
+                "INSERT INTO flashcards (body_hash, email, due_at) VALUES (?, ?, '') RETURNING id",
+                (h, EMAIL)).fetchone()[0], "body_hash": h} for h in hashes]
+        start = time.perf_counter()
+        app.index_new_cards(EMAIL, cards, hashes, inserted)
+        index_seconds = time.perf_counter() - start
+        found = len(client.get(f"/api/search?q={marker}").get_json()["results"])
+
+    print(f"{'query':10} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    all_timings = [t for samples in timings.values() for t in samples]
+    for kind, samples in list(timings.items()) + [("all", all_timings)]:
+        print(f"{kind:10} {len(samples):6} {statistics.median(samples) * 1000:6.2f}ms "
+              f"{percentile(samples, 0.95) * 1000:6.2f}ms {percentile(samples, 0.99) * 1000:6.2f}ms")
+    print(f"{hits}/{args.queries} queries had results, {queries_per_search:.1f} upstream queries per search")
+    print(f"indexing 5 new cards: {index_seconds * 1000:.2f}ms, {found}/5 found by the next search")
+
+    results = {
+        "p50_ms": round(statistics.median(all_timings) * 1000, 3),
+        "p99_ms": round(percentile(all_timings, 0.99) * 1000, 3),
+        "first_search_s": round(first_search, 3),
+        "queries_per_search": queries_per_search,
+    }
+    failures = []
+    if results["p99_ms"] > args.max_ms:
+        failures.append(f"p99 {results['p99_ms']}ms exceeds {args.max_ms}ms")
+    if found != len(cards):
+        failures.append(f"only {found} of {len(cards)} newly stored cards were searchable")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ("p50_ms", "p99_ms", "first_search_s"):
+            if key in baseline and results[key] > baseline[key] * (1 + args.tolerance):
+                failures.append(f"{key}: {results[key]} vs {baseline[key]}")
+        if results["queries_per_search"] > baseline.get("queries_per_search", results["queries_per_search"]):
+            failures.append(f"{results['queries_per_search']} upstream queries per search "
+                            f"vs {baseline['queries_per_search']}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
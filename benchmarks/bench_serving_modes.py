@@ -0,0 +1,185 @@
+"""
+Requests/sec and p99 latency: built-in server (app.run) vs gunicorn.conf.py
+
+Starts the app twice, once with the built-in threaded server and once
+under the preforked gunicorn profile, and drives both with the same
+workload: log in, load the dashboard, generate flashcards. Each server runs
+against FakeSupabase (benchmarks/fakes.py), seeded with verified users on an
+unlimited plan, adding --latency seconds per call, so no external service
+is needed. Pass --dev-url/--gunicorn-url with --email/--password instead to
+benchmark servers started by hand (e.g. against a staging project or behind
+a real proxy).
+
+Usage:
+    python benchmarks/bench_serving_modes.py [--requests 400] [--concurrency 1,8,32,64] [--latency 0.02]
+        [--routes login,dashboard,generate]
+    python benchmarks/bench_serving_modes.py --dev-url http://... --gunicorn-url http://... \
+        --email bench@example.com --password secret
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERS = 20
+
+NOTES = (
+    "Photosynthesis converts light energy into chemical energy stored in glucose. "
+    "Chlorophyll in the chloroplasts absorbs mostly blue and red light. "
+    "The light-dependent reactions take place in the thylakoid membranes. "
+    "The Calvin cycle fixes carbon dioxide in the stroma of the chloroplast. "
+    "Oxygen is released as a by-product when water molecules are split."
+)
+
+
+def application():
+    """The real app on a seeded FakeSupabase; also the gunicorn app factory"""
+    from bench_routes import PASSWORD, seed
+    from fakes import FakeSupabase
+    from werkzeug.security import generate_password_hash
+
+    import app as app_module
+    from telemetry.tracing import TracedClient
+
+    db = FakeSupabase(latency=float(os.getenv("BENCH_LATENCY", 0)))
+    seed(db, USERS, sessions_per_user=10, cards_per_session=10,
+         password_hash=generate_password_hash(PASSWORD, method=app_module.services.passwords.method))
+    app_module.services.supabase = TracedClient(db)
+    return app_module.app
+
+
+def launch(mode, port, latency, workdir):
+    env = dict(os.environ, BENCH_LATENCY=str(latency), CHAPA_SECRET_KEY="", HUGGINGFACE_API_KEY="",
+               LOG_LEVEL="WARNING", SHARED_STATE_PATH=os.path.join(workdir, f"state-{mode}.sqlite3"),
+               JOB_STORE_PATH=os.path.join(workdir, f"jobs-{mode}.sqlite3"),
+               WEBHOOK_QUEUE_PATH=os.path.join(workdir, f"webhooks-{mode}.sqlite3"))
+    if mode == "dev":
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+               "--bind", f"127.0.0.1:{port}", "--pythonpath", os.path.join(ROOT, "benchmarks"),
+               "--log-level", "warning", "bench_serving_modes:application()"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(url + "/", timeout=1)
+            # Give every gunicorn worker time to boot before timing starts
+            time.sleep(2 if mode == "gunicorn" else 0)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"{mode} server did not start on port {port}")
+
+
+def make_calls(url, email, password):
+    logins = iter(range(10 ** 9))
+
+    def login(http):
+        if email:
+            credentials = {"email": email, "password": password}
+        else:
+            credentials = {"email": f"user{next(logins) % USERS}@bench.local", "password": password}
+        return http.post(url + "/api/login", json=credentials, timeout=60)
+
+    def dashboard(http):
+        return http.get(url + "/dashboard", timeout=60)
+
+    def generate(http):
+        return http.post(url + "/generate", json={"notes": NOTES}, timeout=60)
+
+    return {"login": login, "dashboard": dashboard, "generate": generate}
+
+
+def run(label, url, route, call, login, requests_total, concurrency):
+    latencies = []
+    errors = 0
+    sessions = []
+    for _ in range(concurrency):
+        http = requests.Session()
+        if route != "login":
+            login(http)
+        sessions.append(http)
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            response = call(sessions[i % concurrency])
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        if not ok:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000 if latencies else 0
+    print(f"{label:<8} {route:<10} c={concurrency:<3} {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50={p50:8.1f}ms  p99={p99:8.1f}ms  errors={errors}")
+    for http in sessions:
+        http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--email", help="account to log in as on servers given by --dev-url/--gunicorn-url")
+    parser.add_argument("--password")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--routes", default="login,dashboard,generate")
+    parser.add_argument("--dev-url", help="benchmark an already running built-in server")
+    parser.add_argument("--gunicorn-url", help="benchmark an already running gunicorn server")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every Supabase call")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        application().run(host="127.0.0.1", port=args.port, threaded=True)
+        return
+    if (args.dev_url or args.gunicorn_url) and not (args.email and args.password):
+        parser.error("--email and --password are required with --dev-url/--gunicorn-url")
+    if not args.email:
+        from bench_routes import PASSWORD
+        args.password = PASSWORD
+
+    procs = []
+    targets = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for offset, (mode, url) in enumerate((("dev", args.dev_url), ("gunicorn", args.gunicorn_url))):
+                if not url:
+                    proc, url = launch(mode, args.port + offset, args.latency, workdir)
+                    procs.append(proc)
+                targets.append((mode, url.rstrip("/")))
+
+            for route in args.routes.split(","):
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    for mode, url in targets:
+                        calls = make_calls(url, args.email, args.password)
+                        run(mode, url, route, calls[route], calls["login"], args.requests, concurrency)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold start: app import time and time to first request
+
+Each run starts a fresh interpreter, imports app, and serves GET / through
+the test client, timing both steps. The run also records which heavy
+dependencies were loaded along the way; those should only be imported
+by the requests that need them. Exits non-zero if the median cold start
+exceeds the budget or a saved baseline by more than --tolerance, or if a
+deferred dependency is imported at startup, so it can gate deploys.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 7] [--max-import-ms 500] [--max-first-request-ms 700]
+    python benchmarks/bench_startup.py --save-baseline instance/startup_baseline.json
+    python benchmarks/bench_startup.py --baseline instance/startup_baseline.json [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use by the routes that need them, never at startup
+DEFERRED = ("supabase", "numpy", "requests", "smtplib", "payments.chapa", "mail.outbox")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/")
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (served - start) * 1000,
+    "status": response.status_code,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (DEFERRED,)
+
+
+def cold_start():
+    # Keep the webhook resume thread from importing payments mid-measurement
+    env = dict(os.environ, CHAPA_SECRET_KEY="")
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--max-import-ms", type=float, default=500)
+    parser.add_argument("--max-first-request-ms", type=float, default=700)
+    parser.add_argument("--baseline", help="fail if slower than this saved result by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", help="write the medians of this run to a JSON file")
+    args = parser.parse_args()
+
+    cold_start()  # populate __pycache__ so every measured run sees the same state
+    runs = [cold_start() for _ in range(args.runs)]
+    result = {
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "first_request_ms": round(statistics.median(r["first_request_ms"] for r in runs), 1),
+    }
+    loaded = sorted({m for r in runs for m in r["loaded"]})
+    print(f"import            median {result['import_ms']:7.1f}ms  "
+          f"min {min(r['import_ms'] for r in runs):7.1f}ms")
+    print(f"first request     median {result['first_request_ms']:7.1f}ms  "
+          f"min {min(r['first_request_ms'] for r in runs):7.1f}ms")
+    print(f"loaded at startup {', '.join(loaded) or 'none of ' + ', '.join(DEFERRED)}")
+
+    failures = []
+    if any(r["status"] != 200 for r in runs):
+        failures.append("GET / did not return 200")
+    if loaded:
+        failures.append(f"deferred dependencies imported at startup: {', '.join(loaded)}")
+    limits = {"import_ms": args.max_import_ms, "first_request_ms": args.max_first_request_ms}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in limits:
+            limits[key] = min(limits[key], baseline[key] * (1 + args.tolerance))
+    for key, limit in limits.items():
+        if result[key] > limit:
+            failures.append(f"{key} {result[key]:.1f}ms exceeds {limit:.1f}ms")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Webhook ingestion throughput for a burst of Chapa events
+
+Measures the acknowledgement path (WebhookQueue.enqueue from concurrent
+request threads, including redelivered duplicates) and then how fast a
+WebhookWorker drains the queue into a stub payments table that sleeps for
+a fixed round-trip time per upsert.
+
+Usage:
+    python benchmarks/bench_webhook_ingest.py [--events 5000] [--concurrency 32] [--rtt-ms 40]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payments.webhooks import WebhookQueue, WebhookWorker
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Upsert:
+    def __init__(self, stub, rows):
+        self.stub = stub
+        self.rows = rows if isinstance(rows, list) else [rows]
+
+    def execute(self):
+        time.sleep(self.stub.rtt)
+        with self.stub.lock:
+            self.stub.round_trips += 1
+            for row in self.rows:
+                self.stub.payments[row["tx_ref"]] = row
+        return _Response(self.rows)
+
+
+class _Table:
+    def __init__(self, stub):
+        self.stub = stub
+
+    def upsert(self, rows, on_conflict=None):
+        return _Upsert(self.stub, rows)
+
+
+class StubClient:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self.payments = {}
+
+    def table(self, name):
+        return _Table(self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="fraction of events redelivered")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rtt-ms", type=float, default=40.0)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    bodies = [json.dumps({"tx_ref": f"tx_{i}", "status": "success", "amount": "9.99",
+                          "currency": "USD", "email": f"user{i}@example.com"}).encode()
+              for i in range(args.events)]
+    bodies += bodies[:int(args.events * args.duplicates)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WebhookQueue(os.path.join(tmp, "webhooks.sqlite3"))
+        latencies = []
+
+        def ack(body):
+            start = time.perf_counter()
+            queue.enqueue(body, None)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(ack, bodies))
+        ack_elapsed = time.perf_counter() - start
+        latencies.sort()
+        print(f"ack:   {len(bodies)} deliveries in {ack_elapsed:.2f}s "
+              f"({len(bodies) / ack_elapsed:.0f}/s)  p50={statistics.median(latencies) * 1000:.2f}ms  "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms  queued={queue.stats()}")
+
+        client = StubClient(args.rtt_ms / 1000)
+        worker = WebhookWorker(queue, client, batch_size=args.batch_size)
+        start = time.perf_counter()
+        while worker.process_batch():
+            pass
+        drain_elapsed = time.perf_counter() - start
+        print(f"drain: {len(client.payments)} payments in {drain_elapsed:.2f}s "
+              f"({len(client.payments) / drain_elapsed:.0f}/s)  round_trips={client.round_trips}  "
+              f"state={queue.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Throughput of the preforked gunicorn profile as worker processes are added
+
+Starts gunicorn with gunicorn.conf.py once per count in --workers, serving
+the real app with Supabase replaced by FakeSupabase (seeded in the master
+before it forks, adding --latency seconds per call), and drives /dashboard
+from --client-procs load-generating processes for --duration seconds. It
+reports requests/s, p50/p99 and the speedup over one worker; on the
+largest count it also:
+
+- sends SIGHUP halfway through a second run and counts failed requests,
+  which a graceful reload should keep at zero;
+- posts /generate concurrently for a free-plan user, so requests land on
+  different workers, and checks that the cards granted add up to exactly
+  the daily limit (QUOTA_BACKEND=local on SQLite shared state).
+
+The load generator runs on the same host, so leave it cores to run on:
+scaling is only meaningful up to about half the CPUs. Exits non-zero if
+the largest count's speedup is below --min-efficiency times its worker
+count, if a reload drops requests, if the quota is over- or under-granted,
+or if throughput regresses against a saved baseline.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--duration 5] [--client-procs 4] [--latency 0]
+    python benchmarks/bench_workers.py --save instance/workers_baseline.json
+    python benchmarks/bench_workers.py --baseline instance/workers_baseline.json [--tolerance 0.25]
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET_KEY = "bench-workers-secret"
+USERS = 20
+QUOTA_EMAIL = "quota@bench.local"
+
+
+def serve():
+    """gunicorn app factory: the real app on a seeded FakeSupabase"""
+    from bench_routes import seed
+    from fakes import FakeSupabase
+
+    import app
+    from telemetry.tracing import TracedClient
+
+    db = FakeSupabase(latency=float(os.getenv("BENCH_LATENCY", 0)))
+    seed(db, USERS, sessions_per_user=10, cards_per_session=10, password_hash="unused")
+    db.seed("users", [{"name": "Quota", "email": QUOTA_EMAIL, "password": "unused", "verified": True,
+                       "avatar": None, "subscription_status": "free"}])
+    app.services.supabase = TracedClient(db)
+    return app.app
+
+
+def session_cookie(email):
+    from flask import Flask
+    from flask.sessions import SecureCookieSessionInterface
+    signer = Flask("bench")
+    signer.secret_key = SECRET_KEY
+    return "session=" + SecureCookieSessionInterface().get_signing_serializer(signer).dumps({"user_email": email})
+
+
+def launch(workers, port, workdir, args):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(args.threads),
+        FLASK_SECRET_KEY=SECRET_KEY,
+        BENCH_LATENCY=str(args.latency),
+        QUOTA_BACKEND="local",
+        SHARED_STATE_BACKEND="sqlite",
+        SHARED_STATE_PATH=os.path.join(workdir, f"state-{workers}.sqlite3"),
+        JOB_STORE_PATH=os.path.join(workdir, "jobs.sqlite3"),
+        WEBHOOK_QUEUE_PATH=os.path.join(workdir, "webhooks.sqlite3"),
+        # Render every request, as for a user whose cards just changed
+        DASHBOARD_CACHE_TTL="0",
+        CHAPA_SECRET_KEY="",
+        HUGGINGFACE_API_KEY="",
+        LOG_LEVEL="WARNING",
+    )
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+           "--bind", f"127.0.0.1:{port}", "--pythonpath", os.path.join(ROOT, "benchmarks"),
+           "--log-level", "warning", "bench_workers:serve()"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                # Give every worker time to boot before timing starts
+                time.sleep(1 + 0.2 * workers)
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"gunicorn with {workers} workers did not start on port {port}")
+
+
+def drive(port, cookies, threads, duration):
+    """One load-generating process: threads looping over keep-alive connections until the deadline"""
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def get(conn, cookie):
+        conn.request("GET", "/dashboard?page=1", headers={"Cookie": cookie})
+        response = conn.getresponse()
+        response.read()
+        return response.status == 200
+
+    def loop(cookie):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                try:
+                    ok = get(conn, cookie)
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # A worker shutting down closes its idle keep-alive connections; like any
+                    # HTTP client, resend the (idempotent) request on a new connection
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    ok = get(conn, cookie)
+            except (OSError, http.client.HTTPException):
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - start)
+            else:
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    workers = [threading.Thread(target=loop, args=(cookies[i % len(cookies)],)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, errors[0]
+
+
+def load(port, cookies, args, during=None):
+    """Run --client-procs load generators at once; during(), if given, is called halfway through"""
+    with ProcessPoolExecutor(args.client_procs) as pool:
+        start = time.perf_counter()
+        futures = [pool.submit(drive, port, cookies[i::args.client_procs] or cookies, args.client_threads,
+                               args.duration) for i in range(args.client_procs)]
+        if during:
+            time.sleep(args.duration / 2)
+            during()
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    latencies = sorted(t for samples, _ in results for t in samples)
+    errors = sum(failed for _, failed in results)
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000, 2)
+        if latencies else None,
+        "errors": errors,
+    }
+
+
+def quota_granted(port, requests):
+    """Cards granted to the free-plan user by concurrent /generate calls"""
+    cookie = session_cookie(QUOTA_EMAIL)
+    notes = ("Mitochondria produce most of the cell's energy as ATP. The inner membrane is folded into cristae. "
+             "Glycolysis happens in the cytoplasm before pyruvate enters the mitochondria. "
+             "Oxidative phosphorylation uses an electrochemical gradient across the inner membrane.")
+
+    def post(_):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        conn.request("POST", "/generate", body=json.dumps({"notes": notes}),
+                     headers={"Cookie": cookie, "Content-Type": "application/json"})
+        response = conn.getresponse()
+        body = json.loads(response.read())
+        return len(body.get("questions", [])) if response.status == 200 else 0
+
+    with ThreadPoolExecutor(requests) as pool:
+        return sum(pool.map(post, range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    default_workers = sorted({1 << i for i in range(cpus.bit_length()) if 1 << i <= max(1, cpus // 2)})
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)),
+                        help="comma-separated worker counts (default: powers of two up to half the CPUs)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker (GUNICORN_THREADS)")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of load per worker count")
+    parser.add_argument("--client-procs", type=int, default=max(1, cpus // 2), help="load-generating processes")
+    parser.add_argument("--client-threads", type=int, default=8, help="connections per load-generating process")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every Supabase call")
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--min-efficiency", type=float, default=0.6,
+                        help="fail if the largest count's speedup is below this times its worker count")
+    parser.add_argument("--save", help="write this run's results to a JSON file")
+    parser.add_argument("--baseline", help="fail if worse than this saved result by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    counts = sorted(int(count) for count in args.workers.split(","))
+    cookies = [session_cookie(f"user{i}@bench.local") for i in range(USERS)]
+    from flashcards.quota import PLAN_LIMITS
+
+    results = {}
+    print(f"{cpus} CPUs; /dashboard, {args.client_procs}x{args.client_threads} connections, {args.duration}s per run")
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50':>9} {'p99':>9} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in counts:
+            proc = launch(count, args.port, workdir, args)
+            try:
+                result = load(args.port, cookies, args)
+                if count == counts[-1]:
+                    reload = load(args.port, cookies, args, during=lambda: proc.send_signal(signal.SIGHUP))
+                    result["reload_rps"], result["reload_errors"] = reload["rps"], reload["errors"]
+                    result["quota_granted"] = quota_granted(args.port, 4 * count + 8)
+            finally:
+                proc.send_signal(signal.SIGTERM)
+                proc.wait(timeout=60)
+            result["speedup"] = round(result["rps"] / results[str(counts[0])]["rps"], 2) if results else 1.0
+            results[str(count)] = result
+            print(f"{count:7} {result['rps']:9.1f} {result['speedup']:7.2f}x {result['p50_ms']:7.2f}ms "
+                  f"{result['p99_ms']:7.2f}ms {result['errors']:7}")
+
+    largest = results[str(counts[-1])]
+    limit = PLAN_LIMITS["free"]
+    print(f"SIGHUP under load at {counts[-1]} workers: {largest['reload_rps']} req/s, "
+          f"{largest['reload_errors']} failed requests")
+    print(f"concurrent /generate on {counts[-1]} workers granted {largest['quota_granted']} cards "
+          f"(daily limit {limit})")
+
+    failures = []
+    ideal = counts[-1] / counts[0]
+    if largest["speedup"] < args.min_efficiency * ideal:
+        failures.append(f"{counts[-1]} workers ran {largest['speedup']}x one worker's throughput "
+                        f"(expected at least {args.min_efficiency * ideal:.2f}x)")
+    if largest["reload_errors"]:
+        failures.append(f"{largest['reload_errors']} requests failed during a graceful reload")
+    if largest["quota_granted"] != limit:
+        failures.append(f"{largest['quota_granted']} cards granted across workers, daily limit is {limit}")
+    for count, result in results.items():
+        if result["errors"]:
+            failures.append(f"{count} workers: {result['errors']} failed requests")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for count, result in results.items():
+            before = baseline.get(count)
+            if before and result["rps"] < before["rps"] * (1 - args.tolerance):
+                failures.append(f"{count} workers: {result['rps']} req/s vs {before['rps']}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
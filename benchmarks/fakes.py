@@ -0,0 +1,689 @@
+"""
+Local stand-ins for Supabase (PostgREST), SMTP and Chapa
+
+Used by the benchmarks to exercise the real routes without any external
+service. Each fake injects a configurable latency per call and counts the
+calls it receives, so a workload can report upstream calls per request.
+
+FakeSupabase implements the subset of the supabase-py query builder the
+app uses: table().select/insert/upsert/update/delete with eq, neq, gt,
+gte, lt, lte, like, in_, or_, order, limit and range, exact counts, the
+flashcard_cards view, the column defaults of database_schema.sql, and the
+consume_daily_quota(), apply_reviews() and search_flashcards() functions
+(the last matching words and prefixes as Postgres does, without stemming). SQLiteClient answers the few calls the review queue and search
+make from a real SQLite database, for benchmarks whose point is how a
+query scales with an index on decks too large to filter in Python.
+"""
+import datetime
+import itertools
+import json
+import random
+import re
+import socketserver
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FakeAPIError(Exception):
+    """Raised where PostgREST would return an error response"""
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _coerce(value: str, like: Any) -> Any:
+    """Convert a filter value from a query string to the type of a stored value"""
+    if isinstance(like, bool):
+        return value == "true"
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    return value
+
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+def _split_top_level(expr: str) -> List[str]:
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(expr):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append(expr[start:i])
+            start = i + 1
+    parts.append(expr[start:])
+    return parts
+
+
+def _parse_logic(expr: str, combine=any) -> Callable[[Dict[str, Any]], bool]:
+    """Parse a PostgREST or=(...)/and(...) filter body into a row predicate"""
+    predicates = []
+    for part in _split_top_level(expr):
+        nested = re.match(r"^(and|or)\((.*)\)$", part)
+        if nested:
+            predicates.append(_parse_logic(nested.group(2), all if nested.group(1) == "and" else any))
+            continue
+        column, op, value = part.split(".", 2)
+        value = value[1:-1] if value.startswith('"') and value.endswith('"') else value
+        predicates.append(_column_predicate(column, op, value, from_text=True))
+    return lambda row: combine(predicate(row) for predicate in predicates)
+
+
+def _column_predicate(column: str, op: str, value: Any, from_text: bool = False):
+    compare = _OPS[op]
+
+    def predicate(row):
+        current = row.get(column)
+        if current is None:
+            return op == "neq" and value is not None
+        return compare(current, _coerce(value, current) if from_text else value)
+
+    return predicate
+
+
+class _Query:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.columns = "*"
+        self.payload: Any = None
+        self.options: Dict[str, Any] = {}
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.offset = 0
+        self.row_limit: Optional[int] = None
+        self.count: Optional[str] = None
+        self.head = False
+
+    def select(self, *columns, count=None, head=False):
+        self.op = "select"
+        self.columns = ",".join(columns) or "*"
+        self.count = count
+        self.head = head
+        return self
+
+    def insert(self, json, count=None, returning="representation", **_):
+        self.op, self.payload, self.count = "insert", json, count
+        self.options = {"returning": returning}
+        return self
+
+    def upsert(self, json, on_conflict="", ignore_duplicates=False, returning="representation", count=None, **_):
+        self.op, self.payload, self.count = "upsert", json, count
+        self.options = {"on_conflict": on_conflict, "ignore_duplicates": ignore_duplicates, "returning": returning}
+        return self
+
+    def update(self, json, count=None, returning="representation", **_):
+        self.op, self.payload, self.count = "update", json, count
+        self.options = {"returning": returning}
+        return self
+
+    def delete(self, count=None, returning="representation", **_):
+        self.op, self.count = "delete", count
+        self.options = {"returning": returning}
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append(_column_predicate(column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def like(self, column, pattern):
+        regex = re.compile("^" + ".*".join(re.escape(part) for part in pattern.split("%")) + "$", re.DOTALL)
+        self.filters.append(lambda row: isinstance(row.get(column), str) and bool(regex.match(row[column])))
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, filters, reference_table=None):
+        self.filters.append(_parse_logic(filters))
+        return self
+
+    def order(self, column, desc=False, nullsfirst=False, foreign_table=None):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size, foreign_table=None):
+        self.row_limit = size
+        return self
+
+    def range(self, start, end, foreign_table=None):
+        self.offset = start
+        self.row_limit = end - start + 1
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.db._call(f"{self.table}.{self.op}")
+        with self.db.lock:
+            return getattr(self, "_" + self.op)()
+
+    def _matching(self, rows):
+        return [row for row in rows if all(predicate(row) for predicate in self.filters)]
+
+    def _result(self, rows, total=None):
+        if self.options.get("returning") == "minimal":
+            data = []
+        else:
+            data = [dict(row) for row in rows]
+        return FakeResponse(data, total if total is not None else (len(rows) if self.count else None))
+
+    def _select(self):
+        rows = self.db._rows(self.table)
+        matched = self._matching(rows)
+        for column, desc in reversed(self.ordering):
+            matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        total = len(matched) if self.count else None
+        end = None if self.row_limit is None else self.offset + self.row_limit
+        matched = matched[self.offset:end]
+        if self.head:
+            return FakeResponse([], total)
+        if self.columns.strip() != "*":
+            columns = [c.strip() for c in self.columns.split(",")]
+            matched = [{c: row.get(c) for c in columns} for row in matched]
+        else:
+            matched = [dict(row) for row in matched]
+        return FakeResponse(matched, total)
+
+    def _insert(self):
+        rows = [self.db._new_row(self.table, row) for row in self._payload_rows()]
+        return self._result(rows)
+
+    def _upsert(self):
+        keys = [k.strip() for k in (self.options["on_conflict"] or "id").split(",")]
+        table = self.db.tables[self.table]
+        written = []
+        for row in self._payload_rows():
+            existing = next((r for r in table if all(r.get(k) == row.get(k) for k in keys)), None)
+            if existing is None:
+                written.append(self.db._new_row(self.table, row))
+            elif not self.options["ignore_duplicates"]:
+                existing.update(row)
+                written.append(existing)
+        return self._result(written)
+
+    def _update(self):
+        matched = self._matching(self.db.tables[self.table])
+        for row in matched:
+            row.update(self.payload)
+        return self._result(matched)
+
+    def _delete(self):
+        table = self.db.tables[self.table]
+        matched = self._matching(table)
+        removed = {id(row) for row in matched}
+        table[:] = [row for row in table if id(row) not in removed]
+        return self._result(matched)
+
+    def _payload_rows(self):
+        return self.payload if isinstance(self.payload, list) else [self.payload]
+
+
+class _Rpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: Dict[str, Any]):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        self.db._call(f"rpc.{self.name}")
+        with self.db.lock:
+            return FakeResponse(self.db.functions[self.name](**self.params))
+
+
+class FakeSupabase:
+    """
+    In-memory stand-in for the Supabase client
+
+    Every execute() sleeps for latency (+ up to jitter) seconds outside the
+    lock, like a network round trip, then applies the query atomically.
+    """
+
+    # Unique columns other than id; inserting a duplicate raises FakeAPIError
+    UNIQUE = {"users": ("email",), "payments": ("tx_ref",), "card_bodies": ("hash",),
+              "generation_cache": ("content_hash",)}
+
+    # Column defaults from database_schema.sql; columns in NOW_COLUMNS default to the insert time
+    DEFAULTS = {
+        "flashcards": {"interval_days": 0.0, "ease": 2.5, "reps": 0, "lapses": 0, "reviewed_at": None},
+        "payments": {"status": "pending"},
+        "users": {"verified": False, "subscription_status": "free"},
+    }
+    NOW_COLUMNS = {"flashcards": ("due_at",), "payments": ("updated_at",), "users": ("updated_at",)}
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.lock = threading.RLock()
+        self.calls: Counter = Counter()
+        self._ids = itertools.count(1)
+        self.views = {"flashcard_cards": self._flashcard_cards}
+        self.functions = {"consume_daily_quota": self._consume_daily_quota,
+                          "apply_reviews": self._apply_reviews,
+                          "search_flashcards": self._search_flashcards}
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def from_(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any] = None) -> _Rpc:
+        return _Rpc(self, name, params or {})
+
+    def seed(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert rows directly, without latency or call counting"""
+        with self.lock:
+            return [self._new_row(table, row) for row in rows]
+
+    def reset_calls(self) -> Counter:
+        """Return the call counts so far and start counting from zero"""
+        with self.lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def _call(self, name: str) -> None:
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        with self.lock:
+            self.calls[name] += 1
+
+    def _rows(self, table: str) -> List[Dict[str, Any]]:
+        if table in self.views:
+            return self.views[table]()
+        return self.tables[table]
+
+    def _new_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        for column in self.UNIQUE.get(table, ()):
+            if any(r.get(column) == row.get(column) for r in self.tables[table]):
+                raise FakeAPIError(f'duplicate key value violates unique constraint "{table}_{column}_key"')
+        row.setdefault("id", next(self._ids))
+        row.setdefault("created_at", _now())
+        for column in self.NOW_COLUMNS.get(table, ()):
+            row.setdefault(column, row["created_at"])
+        for column, value in self.DEFAULTS.get(table, {}).items():
+            row.setdefault(column, value)
+        self.tables[table].append(row)
+        return row
+
+    def _flashcard_cards(self) -> List[Dict[str, Any]]:
+        bodies = {body["hash"]: body for body in self.tables["card_bodies"]}
+        rows = []
+        for card in self.tables["flashcards"]:
+            body = bodies.get(card.get("body_hash"), {})
+            rows.append(dict(card, question=body.get("question", card.get("question")),
+                             answer=body.get("answer", card.get("answer"))))
+        return rows
+
+    def _consume_daily_quota(self, p_email, p_day, p_amount, p_limits, p_default_plan="free"):
+        user = next((u for u in self.tables["users"] if u.get("email") == p_email), {})
+        plan = user.get("subscription_status") or p_default_plan
+        if plan not in p_limits:
+            plan = p_default_plan
+        limit = int(p_limits[plan])
+        counter = next((q for q in self.tables["daily_quota"]
+                        if q["email"] == p_email and q["day"] == p_day), None)
+        if counter is None:
+            counter = {"email": p_email, "day": p_day, "used": 0}
+            self.tables["daily_quota"].append(counter)
+        used = counter["used"]
+        if p_amount < 0:
+            granted = max(p_amount, -used)
+        elif limit < 0:
+            granted = p_amount
+        else:
+            granted = max(0, min(p_amount, limit - used))
+        counter["used"] = used + granted
+        return [{"granted": granted, "used": counter["used"], "quota_limit": limit, "plan": plan}]
+
+    def _apply_reviews(self, p_email, p_reviews):
+        reviews = {review["id"]: review for review in p_reviews}
+        updated = 0
+        for card in self.tables["flashcards"]:
+            review = reviews.get(card.get("id"))
+            if review and card.get("email") == p_email:
+                card.update({column: value for column, value in review.items() if column != "id"})
+                updated += 1
+        return updated
+
+    def _search_flashcards(self, p_email, p_query, p_limit=20, p_offset=0):
+        from flashcards.search import words
+
+        # "term:*" matches words starting with term, a bare term whole words only; all must match
+        terms = [(term[:-2], True) if term.endswith(":*") else (term, False) for term in p_query.split(" & ")]
+
+        def hits(card_words):
+            return sum(1 for word in card_words for term, prefix in terms
+                       if word == term or (prefix and word.startswith(term)))
+
+        matches = []
+        for card in self._flashcard_cards():
+            if card.get("email") != p_email:
+                continue
+            question, answer = words(card.get("question") or ""), words(card.get("answer") or "")
+            if not all(any(word == term or (prefix and word.startswith(term)) for word in question + answer)
+                       for term, prefix in terms):
+                continue
+            # ts_rank_cd's default weights: 1.0 for the question (A), 0.4 for the answer (B)
+            rank = hits(question) + 0.4 * hits(answer)
+            matches.append({"id": card["id"], "question": card["question"], "answer": card["answer"],
+                            "session_id": card.get("session_id"), "created_at": card.get("created_at"),
+                            "rank": rank})
+        matches.sort(key=lambda row: (-row["rank"], -row["id"]))
+        return matches[p_offset:p_offset + p_limit]
+
+
+# flashcards, card_bodies and the flashcard_cards view, for SQLiteClient
+FLASHCARDS_SCHEMA = """
+CREATE TABLE card_bodies (hash TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL);
+CREATE TABLE flashcards (
+    id INTEGER PRIMARY KEY,
+    question TEXT,
+    answer TEXT,
+    email TEXT NOT NULL,
+    session_id TEXT,
+    body_hash TEXT REFERENCES card_bodies(hash),
+    created_at TEXT,
+    due_at TEXT NOT NULL,
+    interval_days REAL NOT NULL DEFAULT 0,
+    ease REAL NOT NULL DEFAULT 2.5,
+    reps INTEGER NOT NULL DEFAULT 0,
+    lapses INTEGER NOT NULL DEFAULT 0,
+    reviewed_at TEXT
+);
+CREATE VIEW flashcard_cards AS
+SELECT f.id, f.email, f.session_id, f.created_at, f.body_hash,
+       COALESCE(b.question, f.question) AS question,
+       COALESCE(b.answer, f.answer) AS answer,
+       f.due_at, f.interval_days, f.ease, f.reps, f.lapses
+FROM flashcards f
+LEFT JOIN card_bodies b ON b.hash = f.body_hash;
+CREATE INDEX idx_flashcards_email ON flashcards(email);
+"""
+
+
+class _SQLiteQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.columns = "*"
+        self.where = []
+        self.params = []
+        self.ordering = ""
+        self.size = None
+
+    def select(self, *columns, **kwargs):
+        self.columns = ", ".join(columns) or "*"
+        return self
+
+    def _filter(self, clause, *params):
+        self.where.append(clause)
+        self.params.extend(params)
+        return self
+
+    def eq(self, column, value):
+        return self._filter(f"{column} = ?", value)
+
+    def gt(self, column, value):
+        return self._filter(f"{column} > ?", value)
+
+    def lte(self, column, value):
+        return self._filter(f"{column} <= ?", value)
+
+    def in_(self, column, values):
+        values = list(values)
+        return self._filter(f"{column} IN ({', '.join('?' * len(values))})", *values)
+
+    def order(self, column, desc=False):
+        self.ordering = f" ORDER BY {column}{' DESC' if desc else ''}"
+        return self
+
+    def limit(self, size):
+        self.size = size
+        return self
+
+    def sql(self):
+        sql = f"SELECT {self.columns} FROM {self.table}"
+        if self.where:
+            sql += " WHERE " + " AND ".join(self.where)
+        sql += self.ordering
+        if self.size is not None:
+            sql += f" LIMIT {int(self.size)}"
+        return sql
+
+    def execute(self):
+        self.client.calls[f"{self.table}.select"] += 1
+        rows = self.client.db.execute(self.sql(), self.params).fetchall()
+        return FakeResponse([dict(row) for row in rows])
+
+
+class _SQLiteRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        assert self.name == "apply_reviews", self.name
+        self.client.calls["rpc.apply_reviews"] += 1
+        with self.client.db:
+            self.client.db.executemany(
+                "UPDATE flashcards SET due_at = ?, interval_days = ?, ease = ?, reps = ?, lapses = ?, "
+                "reviewed_at = ? WHERE id = ? AND email = ?",
+                [(r["due_at"], r["interval_days"], r["ease"], r["reps"], r["lapses"], r["reviewed_at"],
+                  r["id"], self.params["p_email"]) for r in self.params["p_reviews"]])
+        return FakeResponse(len(self.params["p_reviews"]))
+
+
+class SQLiteClient:
+    """The table()/rpc() calls of the review queue and search, answered by SQLite"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.calls = Counter()
+
+    def table(self, name):
+        return _SQLiteQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return _SQLiteRpc(self, name, params or {})
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self) -> None:
+        server: FakeSMTPServer = self.server.owner
+        server._count("connections")
+        self.reply("220 fake-smtp ESMTP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-fake-smtp")
+                self.reply("250-AUTH PLAIN")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 fake-smtp")
+            elif verb == "AUTH":
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                if server.latency:
+                    time.sleep(server.latency)
+                server._count("messages")
+                self.reply("250 OK queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class FakeSMTPServer:
+    """Threaded SMTP sink on 127.0.0.1 that accepts AUTH PLAIN and counts messages"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        self.host, self.port = self._server.server_address
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+
+    def start(self) -> "FakeSMTPServer":
+        threading.Thread(target=self._server.serve_forever, name="fake-smtp", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_calls(self) -> Counter:
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+
+class _ChapaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def respond(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        server: FakeChapaServer = self.server.owner
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/transaction/verify/"):
+            server._count("transaction/verify")
+            tx_ref = path.rsplit("/", 1)[1]
+            self.respond(200, {"status": "success", "data": server.transaction(tx_ref)})
+        elif path == "/banks":
+            server._count("banks")
+            self.respond(200, {"status": "success", "data": [{"id": 1, "name": "Test Bank"}]})
+        else:
+            self.respond(404, {"status": "failed", "message": "Not found"})
+
+    def do_POST(self) -> None:
+        server: FakeChapaServer = self.server.owner
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/transaction/initialize":
+            server._count("transaction/initialize")
+            tx_ref = payload.get("tx_ref")
+            self.respond(200, {"status": "success",
+                               "data": {"checkout_url": f"https://checkout.example/{tx_ref}"}})
+        else:
+            self.respond(404, {"status": "failed", "message": "Not found"})
+
+
+class FakeChapaServer:
+    """
+    Threaded HTTP stand-in for the Chapa API (initialize, verify, banks)
+
+    Every transaction verifies as successful; statuses can be overridden
+    per tx_ref through the statuses dict.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.statuses: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _ChapaHandler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        host, port = self._server.server_address
+        self.base_url = f"http://{host}:{port}"
+
+    def _count(self, name: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] += 1
+
+    def transaction(self, tx_ref: str) -> Dict[str, Any]:
+        return {"tx_ref": tx_ref, "status": self.statuses.get(tx_ref, "success"), "amount": "10.00",
+                "currency": "USD", "email": "bench@example.com", "first_name": "Bench",
+                "last_name": "User", "created_at": _now()}
+
+    def start(self) -> "FakeChapaServer":
+        threading.Thread(target=self._server.serve_forever, name="fake-chapa", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_calls(self) -> Counter:
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
@@ -0,0 +1,132 @@
+"""Generic in-process caching helpers shared by the app's subsystems"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a TTL per entry
+
+    An entry stored with ttl=None never expires but can still be evicted
+    once the cache holds more than max_entries keys.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: Optional[float] = 300.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Any = _MISSING) -> None:
+        if ttl is _MISSING:
+            ttl = self.default_ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def cached_call(cache: TTLCache, flight: SingleFlight, key: Hashable, loader: Callable[[], Any],
+                ttl_for: Callable[[Any], Any]) -> Any:
+    """
+    Return a cached value or load it once for all concurrent callers
+
+    Args:
+        cache: Cache to read and fill
+        flight: Single-flight group collapsing concurrent loads
+        key: Cache key
+        loader: Function producing the value on a miss
+        ttl_for: Maps a loaded value to its TTL in seconds, None to keep it
+            forever, or False to not cache it at all
+
+    Returns:
+        The cached or freshly loaded value
+    """
+
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    def load():
+        # Another caller may have filled the cache while we waited to lead
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        ttl = ttl_for(value)
+        if ttl is not False:
+            cache.set(key, value, ttl)
+        return value
+
+    return flight.do(key, load)
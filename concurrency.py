@@ -0,0 +1,53 @@
+"""Fan-out helper for running independent upstream calls concurrently"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("UPSTREAM_FANOUT_THREADS", 32)),
+                thread_name_prefix="upstream",
+            )
+        return _executor
+
+
+def run_parallel(*calls: Callable[[], Any]) -> List[Any]:
+    """
+    Run zero-argument callables concurrently and return their results in order
+
+    The first call runs in the calling thread, the rest on a shared pool, so
+    a single call costs nothing extra. If any call raises, the first
+    exception (in argument order) is re-raised after all calls finish.
+    Only pass calls that do not need the Flask request context.
+    """
+
+    if not calls:
+        return []
+    # Each call gets a copy of the caller's context, so spans recorded on
+    # the pool are attributed to the current request's trace
+    futures = [_pool().submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    results: List[Any] = []
+    first_error: Optional[BaseException] = None
+    try:
+        results.append(calls[0]())
+    except BaseException as e:
+        first_error = e
+        results.append(None)
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BaseException as e:
+            first_error = first_error or e
+            results.append(None)
+    if first_error is not None:
+        raise first_error
+    return results
@@ -31,7 +31,7 @@ CREATE TABLE IF NOT EXISTS users (
     name VARCHAR(100),
     email VARCHAR(255) UNIQUE NOT NULL,
     password VARCHAR(255) NOT NULL,
-    avatar TEXT,
+    avatar TEXT, -- avatar store key (users/avatars.py) or an image URL; never image data
     verified BOOLEAN DEFAULT FALSE,
     first_name VARCHAR(100),
     last_name VARCHAR(100),
@@ -42,11 +42,208 @@ CREATE TABLE IF NOT EXISTS users (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Generation sessions: one row per /generate call, referenced by its flashcards
+CREATE TABLE IF NOT EXISTS generation_sessions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    email VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS session_id UUID REFERENCES generation_sessions(id) ON DELETE SET NULL;
+
+-- Backfill sessions for flashcards created before session ids existed,
+-- grouping by minute like the old dashboard did
+INSERT INTO generation_sessions (email, created_at)
+SELECT DISTINCT email, date_trunc('minute', created_at)
+FROM flashcards
+WHERE session_id IS NULL AND created_at IS NOT NULL;
+
+UPDATE flashcards f SET session_id = s.id
+FROM generation_sessions s
+WHERE f.session_id IS NULL
+  AND s.email = f.email
+  AND s.created_at = date_trunc('minute', f.created_at);
+
+-- Deduplicated card text: one row per distinct question/answer pair.
+-- New flashcards rows reference it by body_hash instead of copying the text.
+CREATE TABLE IF NOT EXISTS card_bodies (
+    hash CHAR(64) PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL
+);
+
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS body_hash CHAR(64) REFERENCES card_bodies(hash);
+ALTER TABLE flashcards ALTER COLUMN question DROP NOT NULL;
+ALTER TABLE flashcards ALTER COLUMN answer DROP NOT NULL;
+
+-- Client-generated key per inserted row (flashcards/store.py): a retried
+-- insert whose first response was lost upserts on it instead of storing the
+-- card twice
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS insert_key UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_flashcards_insert_key ON flashcards(insert_key);
+
+-- Spaced-repetition schedule per card (flashcards/review.py). Existing and
+-- new cards start out due now with the SM-2 defaults.
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS due_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS interval_days REAL NOT NULL DEFAULT 0;
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS ease REAL NOT NULL DEFAULT 2.5;
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS reps INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS lapses INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS reviewed_at TIMESTAMP WITH TIME ZONE;
+
+-- Read path for flashcards: resolves card text for both old and new rows
+CREATE OR REPLACE VIEW flashcard_cards AS
+SELECT f.id, f.email, f.session_id, f.created_at, f.body_hash,
+       COALESCE(b.question, f.question) AS question,
+       COALESCE(b.answer, f.answer) AS answer,
+       f.due_at, f.interval_days, f.ease, f.reps, f.lapses
+FROM flashcards f
+LEFT JOIN card_bodies b ON b.hash = f.body_hash;
+
+-- Full-text search (flashcards/search.py): each card's question (weight A) and
+-- answer (weight B) as a tsvector, filled by a trigger when the row is written.
+-- Card bodies never change under a hash, so the vector never goes stale.
+ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS search TSVECTOR;
+
+CREATE OR REPLACE FUNCTION flashcards_search_vector()
+RETURNS TRIGGER AS $$
+DECLARE
+    card_question TEXT := NEW.question;
+    card_answer TEXT := NEW.answer;
+BEGIN
+    IF NEW.body_hash IS NOT NULL THEN
+        SELECT b.question, b.answer INTO card_question, card_answer
+        FROM card_bodies b WHERE b.hash = NEW.body_hash;
+    END IF;
+    NEW.search := setweight(to_tsvector('english', COALESCE(card_question, '')), 'A')
+               || setweight(to_tsvector('english', COALESCE(card_answer, '')), 'B');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS flashcards_search ON flashcards;
+CREATE TRIGGER flashcards_search
+    BEFORE INSERT OR UPDATE OF body_hash, question, answer ON flashcards
+    FOR EACH ROW EXECUTE FUNCTION flashcards_search_vector();
+
+-- Backfill cards stored before the column existed
+UPDATE flashcards f
+SET search = setweight(to_tsvector('english', COALESCE(c.question, '')), 'A')
+          || setweight(to_tsvector('english', COALESCE(c.answer, '')), 'B')
+FROM flashcard_cards c
+WHERE c.id = f.id AND f.search IS NULL;
+
+-- A page of a user's cards matching a tsquery, best match first.
+-- Fetch one row more than a page to learn whether another page follows.
+CREATE OR REPLACE FUNCTION search_flashcards(
+    p_email TEXT,
+    p_query TEXT,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE(id INTEGER, question TEXT, answer TEXT, session_id UUID,
+              created_at TIMESTAMP WITH TIME ZONE, rank REAL) AS $$
+    SELECT f.id, COALESCE(b.question, f.question), COALESCE(b.answer, f.answer),
+           f.session_id, f.created_at, ts_rank_cd(f.search, q) AS rank
+    FROM flashcards f
+    CROSS JOIN to_tsquery('english', p_query) q
+    LEFT JOIN card_bodies b ON b.hash = f.body_hash
+    WHERE f.email = p_email AND f.search @@ q
+    ORDER BY rank DESC, f.id DESC
+    LIMIT p_limit OFFSET p_offset;
+$$ LANGUAGE sql STABLE;
+
+-- Cards generated for a given normalized input, shared by all workers
+CREATE TABLE IF NOT EXISTS generation_cache (
+    content_hash CHAR(64) PRIMARY KEY,
+    cards JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Daily flashcard quota counters, one row per user per UTC day
+CREATE TABLE IF NOT EXISTS daily_quota (
+    email VARCHAR(255) NOT NULL,
+    day DATE NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (email, day)
+);
+
+-- Atomically check and increment a user's daily quota.
+-- p_limits maps subscription_status to a daily limit (-1 = unlimited).
+-- A negative p_amount gives back previously reserved quota.
+CREATE OR REPLACE FUNCTION consume_daily_quota(
+    p_email TEXT,
+    p_day DATE,
+    p_amount INTEGER,
+    p_limits JSONB,
+    p_default_plan TEXT DEFAULT 'free'
+)
+RETURNS TABLE(granted INTEGER, used INTEGER, quota_limit INTEGER, plan TEXT) AS $$
+DECLARE
+    current_used INTEGER;
+BEGIN
+    SELECT COALESCE(u.subscription_status, p_default_plan) INTO plan
+    FROM users u WHERE u.email = p_email;
+    IF plan IS NULL OR NOT (p_limits ? plan) THEN
+        plan := p_default_plan;
+    END IF;
+    quota_limit := (p_limits ->> plan)::INTEGER;
+
+    INSERT INTO daily_quota AS q (email, day, used) VALUES (p_email, p_day, 0)
+    ON CONFLICT (email, day) DO NOTHING;
+    SELECT q.used INTO current_used FROM daily_quota q
+    WHERE q.email = p_email AND q.day = p_day FOR UPDATE;
+
+    IF p_amount < 0 THEN
+        granted := GREATEST(p_amount, -current_used);
+    ELSIF quota_limit < 0 THEN
+        granted := p_amount;
+    ELSE
+        granted := GREATEST(0, LEAST(p_amount, quota_limit - current_used));
+    END IF;
+
+    UPDATE daily_quota q SET used = q.used + granted
+    WHERE q.email = p_email AND q.day = p_day;
+    used := current_used + granted;
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Store a batch of graded reviews in one statement. p_reviews is a JSON array of
+-- {id, due_at, interval_days, ease, reps, lapses, reviewed_at}; only p_email's cards change.
+CREATE OR REPLACE FUNCTION apply_reviews(p_email TEXT, p_reviews JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE flashcards f
+        SET due_at = r.due_at, interval_days = r.interval_days, ease = r.ease,
+            reps = r.reps, lapses = r.lapses, reviewed_at = r.reviewed_at
+        FROM jsonb_to_recordset(p_reviews) AS r(
+            id INTEGER, due_at TIMESTAMPTZ, interval_days REAL, ease REAL,
+            reps INTEGER, lapses INTEGER, reviewed_at TIMESTAMPTZ)
+        WHERE f.id = r.id AND f.email = p_email
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER FROM updated;
+$$ LANGUAGE sql;
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_flashcards_created_at ON flashcards(created_at);
 CREATE INDEX IF NOT EXISTS idx_payments_tx_ref ON payments(tx_ref);
 CREATE INDEX IF NOT EXISTS idx_payments_email ON payments(email);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_flashcards_email ON flashcards(email);
+-- Newest card per user, the dashboard's version for conditional GETs
+CREATE INDEX IF NOT EXISTS idx_flashcards_email_created_at ON flashcards(email, created_at DESC);
+-- Keyset pages of a user's cards for /export
+CREATE INDEX IF NOT EXISTS idx_flashcards_email_id ON flashcards(email, id);
+-- The review queue: a user's next due cards without scanning their deck
+CREATE INDEX IF NOT EXISTS idx_flashcards_email_due_at ON flashcards(email, due_at);
+-- Full-text search within one user's cards; btree_gin lets email share the GIN index
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+CREATE INDEX IF NOT EXISTS idx_flashcards_search ON flashcards USING GIN (email, search);
+CREATE INDEX IF NOT EXISTS idx_flashcards_session_id ON flashcards(session_id);
+CREATE INDEX IF NOT EXISTS idx_flashcards_body_hash ON flashcards(body_hash);
+CREATE INDEX IF NOT EXISTS idx_generation_sessions_keyset ON generation_sessions(email, created_at DESC, id DESC);
 
 -- Function to update the updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -0,0 +1,95 @@
+"""
+Content-addressed deduplication for flashcard generation
+
+Identical notes (after whitespace and case normalization) map to the same
+content hash. Generated cards are cached under that hash in an in-process
+LRU/TTL tier backed by the generation_cache table, so repeat submissions
+skip generation entirely. Card text is stored once per distinct
+question/answer pair in card_bodies; flashcards rows only reference it by
+hash, so repeated content adds small rows rather than duplicate text.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from caching import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Bump when generator output changes so stale cached cards are not reused
+GENERATOR_VERSION = "1"
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def content_hash(text: str, variant: str = "") -> str:
+    """Hash of normalized notes, scoped to the generator version and options"""
+    digest = hashlib.sha256(f"{GENERATOR_VERSION}:{variant}:".encode("utf-8"))
+    digest.update(normalize(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def card_hash(card: Dict[str, str]) -> str:
+    return hashlib.sha256(f"{card['question']}\x00{card['answer']}".encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier cache of generated cards keyed by content hash
+
+    The first tier is in-process; misses fall through to the
+    generation_cache table, which every worker shares and which survives
+    restarts. Errors from the second tier are logged and treated as misses.
+    """
+
+    def __init__(self, client, max_entries: int = 2048, ttl: float = 6 * 60 * 60, table: str = "generation_cache"):
+        self.client = client
+        self.table = table
+        self.local = TTLCache(max_entries=max_entries, default_ttl=ttl)
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        cards = self.local.get(key)
+        if cards is not None:
+            return cards
+        try:
+            rows = self.client.table(self.table).select("cards").eq("content_hash", key).limit(1).execute().data
+        except Exception as e:
+            logger.warning("Generation cache read error", extra={"fields": {"error": str(e)}})
+            return None
+        if not rows:
+            return None
+        cards = rows[0]["cards"]
+        self.local.set(key, cards)
+        return cards
+
+    def put(self, key: str, cards: List[Dict[str, str]]) -> None:
+        self.local.set(key, cards)
+        try:
+            self.client.table(self.table).upsert(
+                {"content_hash": key, "cards": cards}, on_conflict="content_hash", ignore_duplicates=True
+            ).execute()
+        except Exception as e:
+            logger.warning("Generation cache write error", extra={"fields": {"error": str(e)}})
+
+
+def store_bodies(client, cards: List[Dict[str, str]]) -> List[str]:
+    """
+    Make sure every card's text exists in card_bodies
+
+    Uses one upsert that ignores bodies already stored.
+
+    Returns:
+        The body hash of each card, in order
+    """
+
+    hashes = [card_hash(card) for card in cards]
+    bodies: Dict[str, Dict[str, Any]] = {}
+    for body_hash, card in zip(hashes, cards):
+        bodies[body_hash] = {"hash": body_hash, "question": card["question"], "answer": card["answer"]}
+    if bodies:
+        client.table("card_bodies").upsert(
+            list(bodies.values()), on_conflict="hash", ignore_duplicates=True, returning="minimal"
+        ).execute()
+    return hashes
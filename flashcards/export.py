@@ -0,0 +1,70 @@
+"""
+Streaming export of a user's flashcards
+
+Cards are read in pages of page_size with a keyset condition on id, and
+each page is serialized and handed to the response before the next one is
+read, so memory use depends on the page size and not on the deck size.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "jsonl": ("application/x-ndjson; charset=utf-8", "jsonl"),
+    # Anki's "Import File" reads tab-separated text; the header lines set up the note fields
+    "anki": ("text/tab-separated-values; charset=utf-8", "txt"),
+}
+
+_COLUMNS = ("question", "answer", "created_at", "session_id")
+
+
+def iter_card_pages(client, email: str, page_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """Yield a user's flashcards in id order, one page per request"""
+    last_id = 0
+    while True:
+        rows = client.table("flashcard_cards").select("id, question, answer, created_at, session_id") \
+            .eq("email", email).gt("id", last_id).order("id").limit(page_size).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def _csv_page(rows: List[Dict[str, Any]], columns, **fmtparams) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, **fmtparams)
+    writer.writerows([row.get(column) for column in columns] for row in rows)
+    return buffer.getvalue()
+
+
+def serialize(pages: Iterable[List[Dict[str, Any]]], fmt: str) -> Iterator[str]:
+    """Serialize pages of cards into chunks of the chosen format, one chunk per page"""
+    if fmt == "csv":
+        yield _csv_page([dict(zip(_COLUMNS, _COLUMNS))], _COLUMNS)
+        for rows in pages:
+            yield _csv_page(rows, _COLUMNS)
+    elif fmt == "jsonl":
+        for rows in pages:
+            yield "".join(json.dumps({column: row.get(column) for column in _COLUMNS}, ensure_ascii=False) + "\n"
+                          for row in rows)
+    elif fmt == "anki":
+        yield "#separator:tab\n#html:false\n#columns:Front\tBack\n"
+        for rows in pages:
+            yield _csv_page(rows, ("question", "answer"), delimiter="\t", lineterminator="\n")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def gzip_stream(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """Encode and gzip a stream of text chunks without buffering the whole body"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,255 @@
+"""
+Streaming flashcard generation engine
+
+Text is consumed as a stream of chunks, split into sentences incrementally
+and scored in batches with hashed TF-IDF/keyword statistics held in fixed
+size NumPy arrays. Only a bounded pool of candidate sentences is kept, so
+memory stays flat no matter how large the notes are; the pool is rescored
+with the final statistics at the end and the best sentences become cards.
+"""
+import heapq
+import io
+import logging
+import re
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUESTION_TEMPLATES = [
+    "What is the main concept about: {}?",
+    "Explain the key point: {}",
+    "What does this statement mean: {}?",
+    "Summarize the following: {}",
+    "What are the important details about: {}?"
+]
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers him his how i if in into is it its itself just me more most my no nor not now
+of off on once only or other our ours out over own same she should so some such than that the their
+theirs them then there these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours
+""".split())
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9'-]*")
+
+TextSource = Union[str, bytes, io.IOBase, Iterable[str]]
+
+
+def iter_chunks(source: TextSource, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """Yield text chunks from a string, a (text or binary) file object or an iterable of strings"""
+    if isinstance(source, bytes):
+        source = source.decode("utf-8", errors="replace")
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        return
+    if hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode("utf-8", errors="replace")
+            yield chunk
+        return
+    for chunk in source:
+        yield chunk.decode("utf-8", errors="replace") if isinstance(chunk, bytes) else chunk
+
+
+def iter_sentences(chunks: Iterable[str], max_chars: int = 600) -> Iterator[str]:
+    """
+    Split a stream of chunks into sentences without joining the whole text
+
+    Only the unfinished tail of the previous chunk is carried over. Runs of
+    text longer than max_chars without a sentence break are cut at a word
+    boundary so a single run-on paragraph cannot grow the buffer unbounded.
+    """
+
+    carry = ""
+    for chunk in chunks:
+        carry += chunk
+        parts = _SENTENCE_END.split(carry)
+        carry = parts.pop()
+        for part in parts:
+            yield from _bounded(part, max_chars)
+        while len(carry) > max_chars:
+            cut = carry.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            yield carry[:cut].strip()
+            carry = carry[cut:]
+    if carry.strip():
+        yield from _bounded(carry, max_chars)
+
+
+def _bounded(text: str, max_chars: int) -> Iterator[str]:
+    text = " ".join(text.split())
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        yield text[:cut]
+        text = text[cut:].lstrip()
+    if text:
+        yield text
+
+
+class SentenceScorer:
+    """
+    Single-pass TF-IDF/keyword scorer over a sentence stream
+
+    Terms are hashed into n_buckets slots. For every bucket it tracks the
+    number of sentences containing it (document frequency) and the total
+    number of occurrences (collection frequency). A term's weight is
+    idf * log(1 + cf): frequent across the notes but not in every
+    sentence, which is what makes it a keyword. A sentence scores the sum
+    of its distinct term weights, normalized by sqrt(length).
+    """
+
+    def __init__(self, top_n: int = 5, pool_size: int = None, n_buckets: int = 1 << 16,
+                 batch_size: int = 512, min_chars: int = 16):
+        self.top_n = top_n
+        self.pool_size = pool_size or max(64, top_n * 16)
+        self.mask = n_buckets - 1
+        self.batch_size = batch_size
+        self.min_chars = min_chars
+        self.df = np.zeros(n_buckets, dtype=np.float64)
+        self.cf = np.zeros(n_buckets, dtype=np.float64)
+        self.n_sentences = 0
+        # Min-heap of (provisional score, position, sentence, term ids)
+        self._pool: List[Tuple[float, int, str, np.ndarray]] = []
+        self._batch: List[Tuple[int, str]] = []
+
+    def feed(self, sentences: Iterable[str]) -> "SentenceScorer":
+        for position, sentence in enumerate(sentences, start=self.n_sentences):
+            self.n_sentences = position + 1
+            if len(sentence) < self.min_chars:
+                continue
+            self._batch.append((position, sentence))
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+        self._flush()
+        return self
+
+    def _terms(self, sentence: str) -> np.ndarray:
+        mask = self.mask
+        # crc32, not hash(): str hashes are salted per process, and every worker must score alike
+        return np.array([zlib.crc32(t.encode()) & mask for t in _TOKEN.findall(sentence.lower())
+                         if len(t) > 2 and t not in STOPWORDS], dtype=np.int64)
+
+    def _weights(self) -> np.ndarray:
+        n = max(1, self.n_sentences)
+        return (np.log((n + 1) / (self.df + 1)) + 1.0) * np.log1p(self.cf)
+
+    def _distinct(self, term_lists: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Flatten term lists into (sentence index, distinct term) pairs plus sentence lengths"""
+        lengths = np.fromiter((len(terms) for terms in term_lists), dtype=np.int64, count=len(term_lists))
+        if not lengths.sum():
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, lengths
+        owners = np.repeat(np.arange(len(term_lists), dtype=np.int64), lengths)
+        keys = np.unique(owners * (self.mask + 1) + np.concatenate(term_lists))
+        return keys // (self.mask + 1), keys & self.mask, lengths
+
+    def _score(self, owners: np.ndarray, terms: np.ndarray, lengths: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        sums = np.bincount(owners, weights=weights[terms], minlength=len(lengths))
+        return sums / np.sqrt(np.maximum(lengths, 1))
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        term_lists = [self._terms(sentence) for _, sentence in self._batch]
+        owners, terms, lengths = self._distinct(term_lists)
+        if len(terms):
+            self.cf += np.bincount(np.concatenate(term_lists), minlength=len(self.cf))
+            self.df += np.bincount(terms, minlength=len(self.df))
+        scores = self._score(owners, terms, lengths, self._weights())
+        pool = self._pool
+        for (position, sentence), sentence_terms, score in zip(self._batch, term_lists, scores.tolist()):
+            item = (score, -position, sentence, sentence_terms)
+            if len(pool) < self.pool_size:
+                heapq.heappush(pool, item)
+            elif item[:2] > pool[0][:2]:
+                heapq.heapreplace(pool, item)
+        self._batch = []
+
+    def top(self) -> List[str]:
+        """Best top_n sentences under the final statistics, in reading order"""
+        if not self._pool:
+            return []
+        owners, terms, lengths = self._distinct([item[3] for item in self._pool])
+        scores = self._score(owners, terms, lengths, self._weights())
+        ranked = sorted(zip(scores, self._pool), key=lambda pair: (-pair[0], -pair[1][1]))
+        best = sorted((item for _, item in ranked[:self.top_n]), key=lambda item: -item[1])
+        return [item[2] for item in best]
+
+
+def make_question(sentence: str, index: int) -> str:
+    template = QUESTION_TEMPLATES[index % len(QUESTION_TEMPLATES)]
+    return template.format(sentence[:60] + "..." if len(sentence) > 60 else sentence)
+
+
+def generate_flashcards(source: TextSource, top_n: int = 5, chunk_size: int = 64 * 1024,
+                        question_writer: Callable[[List[str]], List[Optional[str]]] = None) -> List[Dict[str, str]]:
+    """
+    Generate up to top_n flashcards from notes in a single streaming pass
+
+    Args:
+        source: Notes as a string, bytes, file object or iterable of chunks
+        top_n: Maximum number of flashcards
+        chunk_size: Characters read from the source at a time
+        question_writer: Optional model-backed writer returning one question
+            (or None) per sentence; sentences without one use the templates
+
+    Returns:
+        List of {"question", "answer"} dictionaries
+    """
+
+    head: List[str] = []
+    head_len = 0
+
+    def remember_head(chunks: Iterable[str]) -> Iterator[str]:
+        # Keep the first few hundred characters for the short-notes fallback
+        nonlocal head_len
+        for chunk in chunks:
+            if head_len < 2000:
+                head.append(chunk[:2000 - head_len])
+                head_len += len(head[-1])
+            yield chunk
+
+    scorer = SentenceScorer(top_n=top_n)
+    scorer.feed(iter_sentences(remember_head(iter_chunks(source, chunk_size))))
+    sentences = scorer.top()
+    if sentences:
+        written: List[Optional[str]] = [None] * len(sentences)
+        if question_writer:
+            try:
+                written = question_writer(sentences)
+            except Exception as e:
+                logger.warning("Question model error", extra={"fields": {"error": str(e)}})
+        return [{"question": written[i] or make_question(sentence, i), "answer": sentence}
+                for i, sentence in enumerate(sentences)]
+
+    notes = "".join(head).strip()
+    if not notes:
+        return []
+    words = notes.split()
+    questions = []
+    if len(words) > 20:
+        chunk_words = max(1, len(words) // top_n)
+        for i in range(top_n):
+            start = i * chunk_words
+            end = start + chunk_words if i < top_n - 1 else len(words)
+            chunk = " ".join(words[start:end])
+            if len(chunk) > 20:
+                questions.append({"question": f"What are the key points in this section: {chunk[:50]}...", "answer": chunk})
+    if not questions:
+        questions = [{
+            "question": "What are the key points from the provided notes?",
+            "answer": notes[:300] + "..." if len(notes) > 300 else notes
+        }]
+    return questions[:top_n]
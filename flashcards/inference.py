@@ -0,0 +1,166 @@
+"""
+Batched, cached client for Hugging Face question generation
+
+Sentences from one or many /generate requests are collected for a short
+window and sent to the Inference API as a single batched call. Results are
+cached by content hash, concurrent calls are capped to respect rate limits,
+and any sentence the model does not answer in time is left to the local
+rule-based templates.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from caching import TTLCache
+from telemetry.tracing import span
+
+
+class InferenceClient:
+    """
+    Micro-batching Hugging Face Inference API client
+
+    Args:
+        api_url: Model endpoint, e.g. https://api-inference.huggingface.co/models/<model>
+        headers: Request headers including the Authorization bearer token
+        prompt: Format string applied to each sentence before sending
+        batch_window: Seconds to wait for more sentences before sending a batch
+        max_batch: Maximum sentences per model call
+        max_concurrency: Maximum model calls in flight at once
+        timeout: Seconds a caller waits for results before falling back
+        cache_size: Number of generated questions kept in the LRU cache
+        cache_ttl: Seconds a generated question stays cached
+    """
+
+    def __init__(self, api_url: str, headers: Dict[str, str], prompt: str = "generate question: {}",
+                 batch_window: float = 0.02, max_batch: int = 16, max_concurrency: int = 2,
+                 timeout: float = 8.0, cache_size: int = 4096, cache_ttl: float = 24 * 60 * 60):
+        self.api_url = api_url
+        self.prompt = prompt
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.cache = TTLCache(max_entries=cache_size, default_ttl=cache_ttl)
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_concurrency))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=max_concurrency))
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="hf-inference")
+        self._pending: Dict[str, tuple] = {}
+        self._cond = threading.Condition()
+        self._oldest: Optional[float] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="hf-batcher", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def key(sentence: str) -> str:
+        return hashlib.sha256(" ".join(sentence.split()).encode("utf-8")).hexdigest()
+
+    def generate_questions(self, sentences: List[str], timeout: float = None) -> List[Optional[str]]:
+        """
+        Generate one question per sentence
+
+        Returns a list aligned with sentences; an entry is None when the
+        model failed or did not answer within the timeout.
+        """
+
+        results: List[Optional[str]] = [None] * len(sentences)
+        futures: Dict[int, Future] = {}
+        for index, sentence in enumerate(sentences):
+            cached = self.cache.get(self.key(sentence))
+            if cached is not None:
+                results[index] = cached
+            else:
+                futures[index] = self._submit(sentence)
+
+        if futures:
+            wait(futures.values(), timeout=self.timeout if timeout is None else timeout)
+            for index, future in futures.items():
+                if future.done() and not future.exception():
+                    results[index] = future.result()
+        return results
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._pool.shutdown(wait=False)
+        self.session.close()
+
+    def _submit(self, sentence: str) -> Future:
+        key = self.key(sentence)
+        with self._cond:
+            # Identical sentences already waiting share one slot in the batch
+            if key in self._pending:
+                return self._pending[key][1]
+            future: Future = Future()
+            self._pending[key] = (sentence, future)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.max_batch:
+                        break
+                    if self._oldest is not None:
+                        remaining = self.batch_window - (time.monotonic() - self._oldest)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    for _, future in self._pending.values():
+                        future.cancel()
+                    return
+                keys = list(self._pending)[:self.max_batch]
+                batch = [(key, *self._pending.pop(key)) for key in keys]
+                self._oldest = time.monotonic() if self._pending else None
+            self._pool.submit(self._call, batch)
+
+    def _call(self, batch: List[tuple]) -> None:
+        inputs = [self.prompt.format(sentence) for _, sentence, _ in batch]
+        try:
+            with span("huggingface", "generate"):
+                response = self.session.post(
+                    self.api_url,
+                    json={"inputs": inputs, "options": {"wait_for_model": False}},
+                    timeout=(3.05, self.timeout),
+                )
+                response.raise_for_status()
+            outputs = self._parse(response.json(), len(batch))
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (key, _, future), question in zip(batch, outputs):
+            if question:
+                self.cache.set(key, question)
+                future.set_result(question)
+            else:
+                future.set_exception(ValueError("Empty model output"))
+
+    @staticmethod
+    def _parse(data: Any, expected: int) -> List[Optional[str]]:
+        """Normalize text2text-generation output to one string per input"""
+        if isinstance(data, dict) and data.get("error"):
+            raise RuntimeError(data["error"])
+        outputs: List[Optional[str]] = []
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, list):
+                item = item[0] if item else {}
+            text = item.get("generated_text") if isinstance(item, dict) else None
+            outputs.append(text.strip() if text else None)
+        if len(outputs) != expected:
+            raise RuntimeError(f"Expected {expected} outputs, got {len(outputs)}")
+        return outputs
@@ -0,0 +1,449 @@
+"""
+Background bulk ingestion of notes
+
+POST /jobs spools the uploaded documents to local disk, records a job in a
+local SQLite database and returns its id straight away; GET /jobs/<id>
+reports progress. An IngestRunner thread claims queued jobs and runs the
+generator on every document of a job in a process pool, so large uploads
+use all CPUs without holding a request thread or the GIL. When all
+documents are done the job's cards are stored like /generate stores them,
+but in bulk: the daily quota is consumed once for the whole job, then one
+request creates the sessions (one per document), one stores the card
+bodies and the flashcard rows are inserted in batches.
+
+No broker is needed; several app processes can share one job database,
+and a job left running by a process that died is picked up again once it
+has been idle for stale_after seconds.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flashcards.dedup import store_bodies
+from flashcards.sessions import create_sessions, delete_session
+from flashcards.store import insert_flashcards
+from telemetry.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+INGEST_JOBS = counter("ingest_jobs_total", "Bulk ingestion jobs finished, by outcome", ["outcome"])
+
+DEFAULT_DB_PATH = os.getenv("JOB_STORE_PATH", os.path.join("instance", "jobs.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    documents INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    cards_generated INTEGER NOT NULL DEFAULT 0,
+    cards_inserted INTEGER NOT NULL DEFAULT 0,
+    quota_limited INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_state ON ingest_jobs(state, created_at);
+CREATE TABLE IF NOT EXISTS ingest_documents (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    cards INTEGER,
+    error TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+# A document is either text or a readable (text or binary) file object
+Document = Tuple[str, Any]
+
+
+class JobStore:
+    """
+    Local job state in SQLite, with uploaded documents spooled next to it
+
+    Same connection setup as the webhook queue: one connection per thread,
+    WAL mode so status polls do not block the runner.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self.spool = os.path.splitext(os.path.abspath(path))[0]
+        os.makedirs(self.spool, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create(self, email: str, documents: List[Document]) -> str:
+        """Spool documents to disk and queue a job for them; returns the job id"""
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.spool, job_id)
+        os.makedirs(directory)
+        rows = []
+        try:
+            for position, (name, source) in enumerate(documents):
+                path = os.path.join(directory, f"{position}.txt")
+                if isinstance(source, str):
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(source)
+                else:
+                    with open(path, "wb") as f:
+                        shutil.copyfileobj(source, f)
+                rows.append((job_id, position, name, path))
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO ingest_jobs (id, email, documents, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, email, len(rows), now, now))
+            conn.executemany("INSERT INTO ingest_documents (job_id, position, name, path) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return job_id
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """Mark the oldest queued job as running and return it"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            job = conn.execute("SELECT * FROM ingest_jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if job is not None:
+                conn.execute("UPDATE ingest_jobs SET state = 'running', updated_at = ? WHERE id = ?",
+                             (time.time(), job["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job
+
+    def documents(self, job_id: str) -> List[sqlite3.Row]:
+        return self._conn().execute(
+            "SELECT * FROM ingest_documents WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+
+    def document_done(self, job_id: str, position: int, cards: int) -> None:
+        conn = self._conn()
+        conn.execute("UPDATE ingest_documents SET state = 'done', cards = ? WHERE job_id = ? AND position = ?",
+                     (cards, job_id, position))
+        conn.execute("UPDATE ingest_jobs SET processed = processed + 1, cards_generated = cards_generated + ?, "
+                     "updated_at = ? WHERE id = ?", (cards, time.time(), job_id))
+
+    def document_failed(self, job_id: str, position: int, error: str) -> None:
+        conn = self._conn()
+        conn.execute("UPDATE ingest_documents SET state = 'failed', error = ? WHERE job_id = ? AND position = ?",
+                     (error, job_id, position))
+        conn.execute("UPDATE ingest_jobs SET failed = failed + 1, updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def heartbeat(self, job_id: str) -> None:
+        """Record that the job's runner is still working on it, so requeue_stale() leaves it alone"""
+        self._conn().execute("UPDATE ingest_jobs SET updated_at = ? WHERE id = ? AND state IN ('running', 'storing')",
+                             (time.time(), job_id))
+
+    def set_state(self, job_id: str, state: str) -> None:
+        self._conn().execute("UPDATE ingest_jobs SET state = ?, updated_at = ? WHERE id = ?",
+                             (state, time.time(), job_id))
+
+    def finish(self, job_id: str, state: str, cards_inserted: int = 0, quota_limited: bool = False,
+               error: Optional[str] = None) -> None:
+        now = time.time()
+        self._conn().execute(
+            "UPDATE ingest_jobs SET state = ?, cards_inserted = ?, quota_limited = ?, error = ?, updated_at = ?, "
+            "finished_at = ? WHERE id = ?", (state, cards_inserted, int(quota_limited), error, now, now, job_id))
+        shutil.rmtree(os.path.join(self.spool, job_id), ignore_errors=True)
+
+    def requeue_stale(self, older_than: float = 600) -> int:
+        """
+        Queue again jobs whose runner stopped reporting progress
+
+        Jobs that were already storing their cards are failed instead, so
+        their cards are never inserted (or their quota consumed) twice.
+        """
+
+        conn = self._conn()
+        cutoff = time.time() - older_than
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stale = [row["id"] for row in conn.execute(
+                "SELECT id FROM ingest_jobs WHERE state = 'running' AND updated_at < ?", (cutoff,))]
+            conn.executemany("UPDATE ingest_documents SET state = 'pending', cards = NULL, error = NULL "
+                             "WHERE job_id = ?", [(job_id,) for job_id in stale])
+            conn.executemany("UPDATE ingest_jobs SET state = 'queued', processed = 0, failed = 0, cards_generated = 0 "
+                             "WHERE id = ?", [(job_id,) for job_id in stale])
+            interrupted = conn.execute(
+                "UPDATE ingest_jobs SET state = 'failed', error = 'Interrupted while storing cards', finished_at = ? "
+                "WHERE state = 'storing' AND updated_at < ?", (time.time(), cutoff)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(stale) + interrupted
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job state and per-document results, or None for an unknown id"""
+        job = self._conn().execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        result = {key: job[key] for key in job.keys()}
+        result["quota_limited"] = bool(job["quota_limited"])
+        result["document_results"] = [
+            {"name": row["name"], "state": row["state"], "cards": row["cards"], "error": row["error"]}
+            for row in self.documents(job_id)
+        ]
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) AS n FROM ingest_jobs GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+
+def has_unfinished_jobs(path: str = DEFAULT_DB_PATH) -> bool:
+    """True if the job database at path has queued or running jobs"""
+    if not os.path.exists(path):
+        return False
+    try:
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            return conn.execute("SELECT 1 FROM ingest_jobs WHERE state IN ('queued', 'running', 'storing') "
+                                "LIMIT 1").fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def _generate_document(path: str, top_n: int) -> List[Dict[str, str]]:
+    # Runs in a pool process, which imports the generator (and numpy) on first use
+    from flashcards.generator import generate_flashcards
+    with open(path, "rb") as f:
+        return generate_flashcards(f, top_n=top_n)
+
+
+class IngestRunner:
+    """
+    Processes queued ingestion jobs one at a time, documents in parallel
+
+    Args:
+        store: JobStore to claim jobs from
+        client: Supabase client the cards are stored with
+        quota: QuotaService charged once per job for the cards it stores
+        workers: Generator processes; defaults to the CPU count
+        cards_per_document: Cards generated per document, as /generate does per request
+        question_writer: Optional model-backed question writer (see
+            InferenceClient.generate_questions), called in this process
+        on_finished: Called with the user's email after cards are stored
+        insert_batch: Flashcard rows per insert request
+    """
+
+    def __init__(self, store: JobStore, client, quota, workers: int = None, cards_per_document: int = 5,
+                 question_writer: Callable[[List[str]], List[Optional[str]]] = None,
+                 on_finished: Callable[[str], None] = None, insert_batch: int = 500,
+                 poll_interval: float = 1.0, stale_after: float = 600):
+        self.store = store
+        self.client = client
+        self.quota = quota
+        self.workers = workers or os.cpu_count() or 1
+        self.cards_per_document = cards_per_document
+        self.question_writer = question_writer
+        self.on_finished = on_finished
+        self.insert_batch = insert_batch
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "IngestRunner":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingest-runner", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, email: str, documents: List[Document]) -> str:
+        """Queue a job and wake the runner; returns the job id"""
+        job_id = self.store.create(email, documents)
+        self._wake.set()
+        return job_id
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Created on the first job so importing the app does not fork workers
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _run(self) -> None:
+        next_stale_check = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_stale_check:
+                    self.store.requeue_stale(self.stale_after)
+                    next_stale_check = time.monotonic() + self.stale_after / 4
+                job = self.store.claim()
+            except Exception:
+                logger.exception("Job store error")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                with self._heartbeat(job["id"]):
+                    self._process(job)
+            except Exception as e:
+                logger.exception("Ingestion job failed", extra={"fields": {"job_id": job["id"]}})
+                self.store.finish(job["id"], "failed", error=str(e))
+                INGEST_JOBS.inc(outcome="failed")
+
+    @contextmanager
+    def _heartbeat(self, job_id: str):
+        """
+        Keep the job's updated_at fresh while it is processed
+
+        Every worker process runs requeue_stale(), and a single document can
+        take longer than stale_after in the pool, so progress alone would
+        not show that the job is still being worked on.
+        """
+
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.stale_after / 4):
+                try:
+                    self.store.heartbeat(job_id)
+                except Exception:
+                    logger.exception("Job store error")
+
+        thread = threading.Thread(target=beat, name="ingest-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _process(self, job: sqlite3.Row) -> None:
+        job_id = job["id"]
+        documents = self.store.documents(job_id)
+        futures = {self._executor().submit(_generate_document, doc["path"], self.cards_per_document): doc
+                   for doc in documents}
+        cards_by_position: Dict[int, List[Dict[str, str]]] = {}
+        for future in as_completed(futures):
+            doc = futures[future]
+            try:
+                cards = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._pool = None
+                self.store.document_failed(job_id, doc["position"], str(e) or type(e).__name__)
+                continue
+            cards_by_position[doc["position"]] = cards
+            self.store.document_done(job_id, doc["position"], len(cards))
+        per_document = [cards for _, cards in sorted(cards_by_position.items()) if cards]
+
+        if self.question_writer and per_document:
+            sentences = [card["answer"] for cards in per_document for card in cards]
+            try:
+                written = list(self.question_writer(sentences))
+                if len(written) != len(sentences):
+                    raise ValueError(f"{len(written)} questions written for {len(sentences)} sentences")
+            except Exception as e:
+                logger.warning("Question model error", extra={"fields": {"error": str(e)}})
+            else:
+                # Applied only once every card has its question, so a short answer never leaves a job half rewritten
+                questions = iter(written)
+                for cards in per_document:
+                    for card in cards:
+                        card["question"] = next(questions) or card["question"]
+
+        self.store.set_state(job_id, "storing")
+        inserted, quota_limited = self._store_cards(job["email"], per_document)
+        self.store.finish(job_id, "done", inserted, quota_limited)
+        INGEST_JOBS.inc(outcome="quota_limited" if quota_limited else "done")
+        logger.info("Ingestion job finished", extra={"fields": {
+            "job_id": job_id, "documents": len(documents), "cards_inserted": inserted}})
+
+    def _discard(self, email: str, cards: int, session_ids: List[str]) -> None:
+        """Give back the quota for cards that were not stored and remove sessions left without any"""
+        self.quota.release(email, cards)
+        for session_id in session_ids:
+            try:
+                delete_session(self.client, session_id)
+            except Exception:
+                logger.exception("Could not remove empty session", extra={"fields": {"session_id": session_id}})
+
+    def _store_cards(self, email: str, per_document: List[List[Dict[str, str]]]) -> Tuple[int, bool]:
+        """Charge the quota for the job's cards and store as many as it allows"""
+        total = sum(len(cards) for cards in per_document)
+        if not total:
+            return 0, False
+        grant = self.quota.consume(email, total)
+        remaining = grant.granted
+        granted_cards: List[List[Dict[str, str]]] = []
+        for cards in per_document:
+            if remaining <= 0:
+                break
+            granted_cards.append(cards[:remaining])
+            remaining -= len(granted_cards[-1])
+        quota_limited = grant.granted < total
+        if not granted_cards:
+            return 0, quota_limited
+
+        session_ids: List[str] = []
+        try:
+            session_ids = create_sessions(self.client, email, len(granted_cards))
+            body_hashes = store_bodies(self.client, [card for cards in granted_cards for card in cards])
+        except Exception:
+            self._discard(email, grant.granted, session_ids)
+            raise
+        hashes = iter(body_hashes)
+        rows = [{"body_hash": next(hashes), "email": email, "session_id": session_id}
+                for session_id, cards in zip(session_ids, granted_cards) for _ in cards]
+        inserted = 0
+        unstored: List[Dict[str, Any]] = []
+        start = 0
+        try:
+            for start in range(0, len(rows), self.insert_batch):
+                result = insert_flashcards(self.client, rows[start:start + self.insert_batch])
+                inserted += len(result.inserted)
+                unstored.extend(error["row"] for error in result.errors)
+            start = len(rows)
+        finally:
+            # A batch that raised leaves it and every later batch unwritten
+            unstored.extend(rows[start:])
+            if unstored:
+                logger.error("Supabase insert error", extra={"fields": {"failed_rows": len(unstored)}})
+                stored = Counter(row["session_id"] for row in rows)
+                stored.subtract(row["session_id"] for row in unstored)
+                # Rows that were never stored should not count against the limit
+                self._discard(email, len(unstored), [session_id for session_id in session_ids
+                                                     if stored[session_id] <= 0])
+            if self.on_finished and len(unstored) < len(rows):
+                self.on_finished(email)
+        return inserted, quota_limited
@@ -0,0 +1,188 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from shared_state import MemoryState
+
+# Daily flashcard allowance per users.subscription_status. None means unlimited.
+PLAN_LIMITS: Dict[str, Optional[int]] = {
+    "free": 10,
+    "basic": 10,
+    "premium": 100,
+    "pro": None,
+}
+DEFAULT_PLAN = "free"
+UNLIMITED = -1
+# Seconds a day's counter is kept in shared state
+COUNTER_TTL = 2 * 24 * 60 * 60
+
+
+def utc_day() -> str:
+    """Current UTC day in ISO format, the key quota counters reset on"""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class QuotaGrant:
+    """Result of a check-and-increment against a user's daily quota"""
+
+    def __init__(self, granted: int, used: int, limit: Optional[int], plan: str):
+        self.granted = granted
+        self.used = used
+        self.limit = limit
+        self.plan = plan
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.limit is None:
+            return None
+        return max(0, self.limit - self.used)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.limit is not None and self.used >= self.limit
+
+
+class SupabaseQuotaBackend:
+    """
+    Shared quota counters stored in Postgres
+
+    Uses the consume_daily_quota() function from database_schema.sql, which
+    looks up the user's plan, applies the limit and increments the counter
+    in a single statement, so every worker sees the same count and
+    concurrent requests cannot both pass the limit.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def consume(self, email: str, day: str, amount: int, limits: Dict[str, Optional[int]]) -> QuotaGrant:
+        params = {
+            "p_email": email,
+            "p_day": day,
+            "p_amount": amount,
+            "p_limits": {plan: UNLIMITED if limit is None else limit for plan, limit in limits.items()},
+            "p_default_plan": DEFAULT_PLAN,
+        }
+        result = self.client.rpc("consume_daily_quota", params).execute()
+        row = result.data[0] if isinstance(result.data, list) else result.data
+        limit = row["quota_limit"]
+        return QuotaGrant(
+            granted=row["granted"],
+            used=row["used"],
+            limit=None if limit == UNLIMITED else limit,
+            plan=row["plan"],
+        )
+
+
+class LocalQuotaBackend:
+    """
+    Quota counters in shared state, for deployments without the Postgres function
+
+    With SQLiteState the counts are shared by every worker process on the
+    host; with MemoryState they are per process. Plans are looked up through
+    plan_lookup (email -> subscription_status) when one is given.
+    """
+
+    def __init__(self, state, plan_lookup=None):
+        self.state = state
+        self.plan_lookup = plan_lookup
+
+    def consume(self, email: str, day: str, amount: int, limits: Dict[str, Optional[int]]) -> QuotaGrant:
+        plan = (self.plan_lookup(email) if self.plan_lookup else None) or DEFAULT_PLAN
+        limit = limits.get(plan, limits[DEFAULT_PLAN])
+        key = f"quota:{email}:{day}"
+        # Increment first, then hand back what went over: concurrent requests
+        # from any worker may briefly see each other's excess, but never both
+        # pass the limit. Counters outlive their day by one to cover clock skew.
+        used = self.state.incr(key, amount, ttl=COUNTER_TTL)
+        if amount < 0:
+            excess = min(0, used)
+        elif limit is None:
+            excess = 0
+        else:
+            excess = min(amount, max(0, used - limit))
+        if excess:
+            used = self.state.incr(key, -excess)
+        return QuotaGrant(granted=amount - excess, used=max(0, used), limit=limit, plan=plan)
+
+
+class QuotaService:
+    """
+    Per-user daily flashcard quota with a short-lived cache in shared state
+
+    consume() is an atomic check-and-increment on the backend: one round
+    trip. The last known state for each user is cached for ttl seconds so
+    check() can reject users that already hit their limit without touching
+    the backend at all. The cache lives in shared state, so invalidate()
+    after a payment reaches every worker.
+    """
+
+    def __init__(self, backend, limits: Dict[str, Optional[int]] = None, ttl: float = 60.0, state=None):
+        self.backend = backend
+        self.limits = dict(limits or PLAN_LIMITS)
+        self.ttl = ttl
+        self.state = state if state is not None else MemoryState()
+
+    def check(self, email: str) -> Optional[QuotaGrant]:
+        """Return the cached quota state for email, or None if unknown or stale"""
+        cached = self.state.get(f"quota-cache:{email}")
+        if not cached or cached["day"] != utc_day():
+            return None
+        return QuotaGrant(granted=cached["granted"], used=cached["used"], limit=cached["limit"], plan=cached["plan"])
+
+    def consume(self, email: str, amount: int) -> QuotaGrant:
+        """
+        Reserve up to amount flashcards from today's allowance
+
+        Args:
+            email: User email
+            amount: Number of flashcards wanted
+
+        Returns:
+            QuotaGrant whose granted field is how many may be created
+        """
+
+        cached = self.check(email)
+        if cached and cached.exhausted and amount > 0:
+            return QuotaGrant(granted=0, used=cached.used, limit=cached.limit, plan=cached.plan)
+
+        day = utc_day()
+        grant = self.backend.consume(email, day, amount, self.limits)
+        self.state.set(f"quota-cache:{email}", {
+            "day": day, "granted": grant.granted, "used": grant.used, "limit": grant.limit, "plan": grant.plan,
+        }, ttl=self.ttl)
+        return grant
+
+    def release(self, email: str, amount: int) -> None:
+        """Give back reserved flashcards that were never stored"""
+        if amount > 0:
+            self.consume(email, -amount)
+
+    def invalidate(self, email: str) -> None:
+        """Forget cached state, e.g. after the user's plan changes"""
+        self.state.delete(f"quota-cache:{email}")
+
+
+def plan_lookup_from_supabase(client):
+    """Build a plan_lookup callable for LocalQuotaBackend"""
+
+    def lookup(email: str) -> Optional[str]:
+        result = client.table("users").select("subscription_status").eq("email", email).limit(1).execute()
+        return result.data[0].get("subscription_status") if result.data else None
+
+    return lookup
+
+
+def create_quota_service(client, backend: str = "supabase", ttl: float = 60.0, state=None) -> QuotaService:
+    """Create the quota service for the configured backend ("supabase" or "local")"""
+    state = state if state is not None else MemoryState()
+    if backend == "local":
+        return QuotaService(LocalQuotaBackend(state, plan_lookup_from_supabase(client)), ttl=ttl, state=state)
+    return QuotaService(SupabaseQuotaBackend(client), ttl=ttl, state=state)
+
+
+def quota_response(grant: QuotaGrant) -> Dict[str, Any]:
+    """JSON body returned by /generate when the daily limit is reached"""
+    return {
+        "status": "limit",
+        "message": f"You have reached your daily limit of {grant.limit} flashcards. Please upgrade your plan to continue generating more."
+    }
@@ -0,0 +1,139 @@
+"""
+Spaced-repetition review queue
+
+Every flashcard carries its own schedule: when it is next due and the SM-2
+state (interval, ease factor, successful repetitions, lapses) that grading
+updates. next_due() answers "the next N due cards for this user" with one
+query that walks the (email, due_at) index from its oldest entry, so a pop
+costs the same on a ten-card deck as on a hundred-thousand-card one.
+grade_cards() applies a batch of grades with one read of the graded cards and
+one apply_reviews() call, however many cards the batch holds.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from telemetry.metrics import counter
+
+REVIEWS = counter("reviews_total", "Flashcards graded, by outcome", ["outcome"])
+
+# SM-2 quality scale: 0-2 is a failed recall, 3-5 a successful one
+MIN_GRADE, MAX_GRADE, PASSING_GRADE = 0, 5, 3
+GRADE_NAMES = {"again": 1, "hard": 3, "good": 4, "easy": 5}
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+# A forgotten card comes back in the same study session
+RELEARN_DELAY = timedelta(minutes=10)
+
+SCHEDULE_COLUMNS = ("due_at", "interval_days", "ease", "reps", "lapses")
+
+
+def parse_grade(value: Any) -> Optional[int]:
+    """A 0-5 grade from a number or one of GRADE_NAMES, or None if invalid"""
+    if isinstance(value, str):
+        value = GRADE_NAMES.get(value.lower(), value)
+        try:
+            value = int(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, int) or not MIN_GRADE <= value <= MAX_GRADE:
+        return None
+    return value
+
+
+def schedule(card: Dict[str, Any], grade: int, now: datetime) -> Dict[str, Any]:
+    """
+    The next schedule of a card after one SM-2 review
+
+    Args:
+        card: Current schedule columns (missing values mean a new card)
+        grade: Recall quality, 0-5
+        now: Time of the review
+
+    Returns:
+        New values for SCHEDULE_COLUMNS and reviewed_at
+    """
+
+    ease = card.get("ease") or INITIAL_EASE
+    interval = card.get("interval_days") or 0
+    reps = card.get("reps") or 0
+    lapses = card.get("lapses") or 0
+
+    if grade < PASSING_GRADE:
+        reps, interval, lapses = 0, 0, lapses + 1
+        due_at = now + RELEARN_DELAY
+    else:
+        if reps == 0:
+            interval = 1
+        elif reps == 1:
+            interval = 6
+        else:
+            interval = round(interval * ease, 2)
+        reps += 1
+        due_at = now + timedelta(days=interval)
+    ease = max(MIN_EASE, ease + 0.1 - (MAX_GRADE - grade) * (0.08 + (MAX_GRADE - grade) * 0.02))
+
+    return {
+        "due_at": due_at.isoformat(),
+        "interval_days": interval,
+        "ease": round(ease, 4),
+        "reps": reps,
+        "lapses": lapses,
+        "reviewed_at": now.isoformat(),
+    }
+
+
+def next_due(client, email: str, limit: int = 10, now: Optional[datetime] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    The user's cards that are due, oldest due first
+
+    Returns:
+        Up to limit cards, and whether more are due
+    """
+
+    now = now or datetime.now(timezone.utc)
+    # One extra row tells whether the queue continues without counting it
+    rows = client.table("flashcard_cards") \
+        .select("id, question, answer, session_id, due_at, interval_days, ease, reps, lapses") \
+        .eq("email", email).lte("due_at", now.isoformat()).order("due_at").limit(limit + 1).execute().data or []
+    return rows[:limit], len(rows) > limit
+
+
+def grade_cards(client, email: str, grades: List[Tuple[int, int]], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Grade several of a user's cards with two queries
+
+    Grades for the same card are applied in order. Cards that do not exist
+    or belong to another user are reported in missing and left alone.
+
+    Args:
+        client: Supabase client
+        email: Owner of the cards
+        grades: (card id, 0-5 grade) pairs
+        now: Time of the review
+
+    Returns:
+        Dict with the new schedule per card id ("scheduled") and the ids
+        that were not found ("missing")
+    """
+
+    now = now or datetime.now(timezone.utc)
+    ids = list(dict.fromkeys(card_id for card_id, _ in grades))
+    rows = client.table("flashcards").select("id, " + ", ".join(SCHEDULE_COLUMNS)) \
+        .eq("email", email).in_("id", ids).execute().data or []
+    cards = {row["id"]: row for row in rows}
+
+    scheduled: Dict[int, Dict[str, Any]] = {}
+    for card_id, quality in grades:
+        card = cards.get(card_id)
+        if card is None:
+            continue
+        card.update(schedule(card, quality, now))
+        scheduled[card_id] = {column: card[column] for column in SCHEDULE_COLUMNS}
+        REVIEWS.inc(outcome="pass" if quality >= PASSING_GRADE else "lapse")
+
+    if scheduled:
+        client.rpc("apply_reviews", {
+            "p_email": email,
+            "p_reviews": [dict(cards[card_id], id=card_id) for card_id in scheduled],
+        }).execute()
+    return {"scheduled": scheduled, "missing": [card_id for card_id in ids if card_id not in cards]}
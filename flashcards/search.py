@@ -0,0 +1,239 @@
+"""
+Full-text search over a user's flashcards
+
+A query is split into words and every word must match the start of a word
+in the card's question or answer, so "photo cell" finds "Photosynthesis
+happens in plant cells". Matches in the question rank above matches in the
+answer. Two backends answer queries:
+
+SupabaseSearchBackend calls search_flashcards() in Postgres. It matches
+against the flashcards.search tsvector, which a trigger fills as cards are
+inserted and a GIN index on (email, search) serves, so new cards are
+searchable as soon as they are stored.
+
+LocalSearchBackend keeps an inverted index per user in process. It is
+built from the user's cards on their first search and updated as
+/generate stores cards; only the page of results is read back from
+Supabase. It is meant for development and single-worker deployments,
+since every worker holds its own indexes.
+"""
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from caching import SingleFlight, TTLCache, cached_call
+from flashcards.export import iter_card_pages
+
+logger = logging.getLogger(__name__)
+
+# Runs of letters and digits; a possessive or contracted "'s"/"'t" is dropped, not made a word
+_WORD = re.compile(r"([^\W_]+)(?:['’][st]\b)?")
+# Dropped from cards and queries, like Postgres' english configuration does
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how in is it its of on or that the this to was "
+    "were what when where which who why will with".split()
+)
+MAX_QUERY_WORDS = 8
+# Shorter query words match whole words only; a one-letter prefix matches most of a deck
+MIN_PREFIX = 3
+QUESTION_WEIGHT = 2
+# BM25 term frequency saturation
+K1 = 1.2
+
+RESULT_COLUMNS = "id, question, answer, session_id, created_at"
+
+Results = Tuple[List[Dict[str, Any]], bool]
+
+
+def words(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def parse_query(query: str) -> List[str]:
+    """The distinct words of a query, at most MAX_QUERY_WORDS of them"""
+    return list(dict.fromkeys(words(query or "")))[:MAX_QUERY_WORDS]
+
+
+class SupabaseSearchBackend:
+    """Search with Postgres full-text search (search_flashcards() in database_schema.sql)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def search(self, email: str, query: str, limit: int = 20, offset: int = 0) -> Results:
+        terms = parse_query(query)
+        if not terms:
+            return [], False
+        params = {
+            "p_email": email,
+            # Words are letters and digits only, so they cannot inject tsquery operators
+            "p_query": " & ".join(f"{term}:*" if len(term) >= MIN_PREFIX else term for term in terms),
+            "p_limit": limit + 1,
+            "p_offset": offset,
+        }
+        rows = self.client.rpc("search_flashcards", params).execute().data or []
+        return rows[:limit], len(rows) > limit
+
+    def add(self, email: str, cards: Iterable[Dict[str, Any]]) -> None:
+        """Nothing to do: the trigger on flashcards indexes new rows"""
+
+    def invalidate(self, email: str) -> None:
+        pass
+
+
+class _UserIndex:
+    """
+    One user's cards as term -> postings
+
+    Cards are numbered in the order they are added. A term's postings are
+    an append-only array of (card number, weight) pairs, which queries read
+    through numpy without copying.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, array] = {}
+        # All terms, sorted, for prefix lookups
+        self.terms: List[str] = []
+        # Card number -> card id
+        self.card_ids = array("q")
+        self._known = set()
+        self.lock = threading.Lock()
+
+    def add(self, cards: Iterable[Dict[str, Any]]) -> None:
+        with self.lock:
+            new_terms = []
+            for card in cards:
+                if card["id"] in self._known:
+                    continue
+                self._known.add(card["id"])
+                number = len(self.card_ids)
+                self.card_ids.append(card["id"])
+                weights = Counter()
+                for term in words(card.get("question") or ""):
+                    weights[term] += QUESTION_WEIGHT
+                for term in words(card.get("answer") or ""):
+                    weights[term] += 1
+                for term, weight in weights.items():
+                    postings = self.postings.get(term)
+                    if postings is None:
+                        postings = self.postings[term] = array("i")
+                        new_terms.append(term)
+                    postings.append(number)
+                    postings.append(weight)
+            if len(new_terms) > 64:
+                self.terms = sorted(self.postings)
+            else:
+                for term in new_terms:
+                    insort(self.terms, term)
+
+    def _expand(self, term: str) -> List[str]:
+        if len(term) < MIN_PREFIX:
+            return [term] if term in self.postings else []
+        start = bisect_left(self.terms, term)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(term):
+            end += 1
+        return self.terms[start:end]
+
+    def top(self, terms: List[str], count: int) -> List[Tuple[int, float]]:
+        """
+        The count best (card id, score) pairs of the cards matching all terms
+
+        Scores are BM25-style; equal scores put the newer card first.
+        """
+
+        import numpy as np
+        with self.lock:
+            cards = len(self.card_ids)
+            score = np.zeros(cards)
+            matching = np.ones(cards, dtype=bool)
+            for term in terms:
+                found = np.zeros(cards, dtype=bool)
+                for expansion in self._expand(term):
+                    pairs = np.frombuffer(self.postings[expansion], dtype=np.int32).reshape(-1, 2)
+                    numbers, weights = pairs[:, 0], pairs[:, 1]
+                    idf = math.log(1 + (cards - len(numbers) + 0.5) / (len(numbers) + 0.5))
+                    score += np.bincount(numbers, weights=idf * weights * (K1 + 1) / (weights + K1),
+                                         minlength=cards)
+                    found[numbers] = True
+                matching &= found
+            candidates = np.flatnonzero(matching)
+            if len(candidates) > count:
+                # Keep the top count scores, and every card tied with the last of them
+                threshold = np.partition(score[candidates], len(candidates) - count)[len(candidates) - count]
+                candidates = candidates[score[candidates] >= threshold]
+            card_ids = np.frombuffer(self.card_ids, dtype=np.int64)[candidates]
+            order = np.lexsort((-card_ids, -score[candidates]))[:count]
+            return [(int(card_ids[i]), float(score[candidates[i]])) for i in order]
+
+
+class LocalSearchBackend:
+    """
+    In-process inverted indexes of users' flashcards
+
+    Args:
+        client: Supabase client the cards are read from
+        max_users: Users whose indexes are kept; the least recently
+            searched are dropped first
+        ttl: Seconds before an index is rebuilt, which picks up cards
+            stored by other workers
+        page_size: Cards read per query while building an index
+    """
+
+    def __init__(self, client, max_users: int = 64, ttl: float = 3600.0, page_size: int = 1000):
+        self.client = client
+        self.ttl = ttl
+        self.page_size = page_size
+        self._indexes = TTLCache(max_users, ttl)
+        self._flight = SingleFlight()
+
+    def _build(self, email: str) -> _UserIndex:
+        start = time.perf_counter()
+        index = _UserIndex()
+        for rows in iter_card_pages(self.client, email, page_size=self.page_size):
+            index.add(rows)
+        logger.info("Built search index", extra={"fields": {
+            "email": email, "cards": len(index.card_ids), "terms": len(index.terms),
+            "seconds": round(time.perf_counter() - start, 3)}})
+        return index
+
+    def _index(self, email: str) -> _UserIndex:
+        return cached_call(self._indexes, self._flight, email, lambda: self._build(email), lambda index: self.ttl)
+
+    def search(self, email: str, query: str, limit: int = 20, offset: int = 0) -> Results:
+        terms = parse_query(query)
+        if not terms:
+            return [], False
+        ranked = self._index(email).top(terms, offset + limit + 1)
+        page = ranked[offset:offset + limit]
+        if not page:
+            return [], False
+        rows = self.client.table("flashcard_cards").select(RESULT_COLUMNS).eq("email", email) \
+            .in_("id", [card_id for card_id, _ in page]).execute().data or []
+        by_id = {row["id"]: row for row in rows}
+        # Cards deleted since the index was built are skipped
+        results = [dict(by_id[card_id], rank=round(score, 4)) for card_id, score in page if card_id in by_id]
+        return results, len(ranked) > offset + limit
+
+    def add(self, email: str, cards: Iterable[Dict[str, Any]]) -> None:
+        """Index newly stored cards (dicts with id, question and answer) if the user has an index"""
+        index = self._indexes.get(email)
+        if index is not None:
+            index.add(cards)
+
+    def invalidate(self, email: str) -> None:
+        """Drop a user's index; the next search rebuilds it"""
+        self._indexes.delete(email)
+
+
+def create_search(client, backend: str = "supabase", max_users: int = 64, ttl: float = 3600.0):
+    """Create the search backend for the configured backend ("supabase" or "local")"""
+    if backend == "local":
+        return LocalSearchBackend(client, max_users=max_users, ttl=ttl)
+    return SupabaseSearchBackend(client)
@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from caching import TTLCache
+
+EAT_TZ = timezone(timedelta(hours=3))  # East African Time UTC+3
+
+
+def create_session(client, email: str) -> str:
+    """
+    Record a new generation session and return its id
+
+    Every /generate call creates one session; the flashcards it inserts
+    carry the session id so the dashboard can group them without
+    comparing timestamps.
+    """
+
+    session_id = str(uuid.uuid4())
+    client.table("generation_sessions").insert({"id": session_id, "email": email}).execute()
+    return session_id
+
+
+def create_sessions(client, email: str, count: int) -> List[str]:
+    """Record count sessions with one request and return their ids"""
+    session_ids = [str(uuid.uuid4()) for _ in range(count)]
+    if session_ids:
+        client.table("generation_sessions").insert(
+            [{"id": session_id, "email": email} for session_id in session_ids], returning="minimal").execute()
+    return session_ids
+
+
+def delete_session(client, session_id: str) -> None:
+    """Remove a session that ended up with no stored flashcards"""
+    client.table("generation_sessions").delete().eq("id", session_id).execute()
+
+
+def encode_cursor(session: Dict[str, Any]) -> str:
+    return f"{session['created_at']}|{session['id']}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Parse a cursor from the client into (created_at, session id)
+
+    Both parts go into a PostgREST filter string, so they are returned
+    re-serialized from the parsed values; anything that is not a timestamp
+    and a UUID is rejected with None.
+    """
+
+    if not cursor or "|" not in cursor:
+        return None
+    created_at, session_id = cursor.rsplit("|", 1)
+    try:
+        return datetime.fromisoformat(created_at.replace('Z', '+00:00')).isoformat(), str(uuid.UUID(session_id))
+    except ValueError:
+        return None
+
+
+def to_local_time(value: Any) -> Optional[datetime]:
+    """Parse a Supabase timestamp and convert it to East African Time"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(EAT_TZ)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value.astimezone(EAT_TZ)
+    return None
+
+
+def count_rows(client, table: str, email: str) -> int:
+    """Exact row count for a user without transferring any rows"""
+    result = client.table(table).select("id", count="exact", head=True).eq("email", email).execute()
+    return result.count or 0
+
+
+def flashcard_version(client, email: str) -> Tuple[int, Optional[str]]:
+    """
+    A user's flashcard count and the created_at of their newest card
+
+    Together they change whenever the dashboard's content does, so they
+    serve as its version. Read with one request on the (email, created_at)
+    index.
+    """
+
+    result = client.table("flashcards").select("created_at", count="exact").eq("email", email) \
+        .order("created_at", desc=True).limit(1).execute()
+    return result.count or 0, (result.data[0]["created_at"] if result.data else None)
+
+
+def dashboard_etag(email: str, version: Tuple[int, Optional[str]], build: str = "") -> str:
+    # The email is included so a browser shared by two accounts never revalidates one user's page for the other;
+    # build (Assets.version) so a deploy that changes the templates or assets invalidates every cached page
+    count, newest = version
+    return hashlib.sha256(f"{email}\x00{count}\x00{newest}\x00{build}".encode("utf-8")).hexdigest()[:32]
+
+
+class DashboardCache:
+    """
+    Rendered dashboard pages per user, tagged with the version they show
+
+    A page is only reused while the user's flashcard version is unchanged,
+    so cards inserted through another worker are never hidden; /generate
+    also drops the user's pages in this process with invalidate(). Each
+    user keeps at most max_pages pages.
+    """
+
+    def __init__(self, max_users: int = 1024, max_pages: int = 16, ttl: float = 300.0):
+        self.max_pages = max_pages
+        self.users = TTLCache(max_entries=max_users, default_ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, email: str, page_key: Hashable, version: Tuple[int, Optional[str]]) -> Any:
+        pages = self.users.get(email)
+        entry = pages.get(page_key) if pages else None
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, email: str, page_key: Hashable, version: Tuple[int, Optional[str]], value: Any) -> None:
+        with self._lock:
+            pages = self.users.get(email)
+            if pages is None or any(stored != version for stored, _ in pages.values()):
+                pages = {}
+                self.users.set(email, pages)
+            pages.pop(page_key, None)
+            while len(pages) >= self.max_pages:
+                pages.pop(next(iter(pages)))
+            pages[page_key] = (version, value)
+
+    def invalidate(self, email: str) -> None:
+        self.users.delete(email)
+
+
+def fetch_session_page(client, email: str, per_page: int, after: Optional[str] = None,
+                       before: Optional[str] = None, offset: int = 0) -> Dict[str, Any]:
+    """
+    Read one page of a user's generation sessions with their flashcards
+
+    Sessions are ordered newest first by (created_at, id). Paging forward
+    passes the last session of the current page as after, paging back
+    passes the first one as before; both use keyset conditions on the
+    (email, created_at, id) index. offset is only used when jumping
+    straight to a numbered page.
+
+    Args:
+        client: Supabase client
+        email: Owner of the sessions
+        per_page: Sessions per page
+        after: Cursor of the session to continue after (older sessions)
+        before: Cursor of the session to continue before (newer sessions)
+        offset: Number of sessions to skip when no cursor is given
+
+    Returns:
+        Dictionary with the page's sessions as (timestamp, flashcards)
+        tuples, whether more pages exist in each direction, and the cursors
+        for them
+    """
+
+    query = client.table("generation_sessions").select("id, created_at").eq("email", email)
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+    newest_first = before_key is None
+    if after_key:
+        created_at, session_id = after_key
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{session_id})')
+    elif before_key:
+        created_at, session_id = before_key
+        query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{session_id})')
+    query = query.order("created_at", desc=newest_first).order("id", desc=newest_first)
+    if after_key or before_key or not offset:
+        query = query.limit(per_page + 1)
+    else:
+        query = query.range(offset, offset + per_page)
+    rows = query.execute().data or []
+
+    # One extra row tells whether another page exists in the read direction
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not newest_first:
+        rows.reverse()
+
+    flashcards_by_session: Dict[str, List[Dict[str, Any]]] = {row["id"]: [] for row in rows}
+    if rows:
+        cards = client.table("flashcard_cards").select("id, question, answer, session_id, created_at") \
+            .in_("session_id", list(flashcards_by_session)).order("id").execute().data or []
+        for card in cards:
+            card["created_at"] = to_local_time(card.get("created_at"))
+            flashcards_by_session[card["session_id"]].append(card)
+
+    sessions = [(to_local_time(row["created_at"]), flashcards_by_session[row["id"]]) for row in rows]
+    if newest_first:
+        has_next, has_prev = more, bool(after_key or offset)
+    else:
+        has_next, has_prev = True, more
+    return {
+        "sessions": sessions,
+        "has_next": has_next and bool(rows),
+        "has_prev": has_prev and bool(rows),
+        "next_cursor": encode_cursor(rows[-1]) if rows else None,
+        "prev_cursor": encode_cursor(rows[0]) if rows else None,
+    }
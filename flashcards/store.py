@@ -0,0 +1,175 @@
+import atexit
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+
+class InsertResult:
+    """Outcome of a batched flashcard insert"""
+
+    def __init__(self):
+        self.inserted: List[Dict[str, Any]] = []
+        self.errors: List[Dict[str, Any]] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"inserted": self.inserted, "errors": self.errors}
+
+
+def insert_flashcards(client, rows: List[Dict[str, Any]], table: str = "flashcards") -> InsertResult:
+    """
+    Insert several flashcard rows with a single multi-row request
+
+    PostgREST applies a multi-row insert as one statement, so a single bad
+    row rejects the whole batch. When that happens the rows are retried one
+    by one so the caller learns exactly which rows failed and why.
+
+    Every row carries a client-generated insert_key. Retries upsert on it,
+    so a batch that was committed but whose response was lost (a timeout,
+    a dropped connection) is not stored a second time.
+
+    Args:
+        client: Supabase client
+        rows: Row dictionaries to insert
+        table: Target table name
+
+    Returns:
+        InsertResult with the stored rows and per-row errors
+    """
+
+    result = InsertResult()
+    if not rows:
+        return result
+
+    rows = [row if row.get("insert_key") else dict(row, insert_key=str(uuid.uuid4())) for row in rows]
+    try:
+        res = client.table(table).insert(rows).execute()
+        result.inserted.extend(res.data or [])
+        return result
+    except Exception:
+        pass
+
+    for index, row in enumerate(rows):
+        try:
+            res = client.table(table).upsert(row, on_conflict="insert_key").execute()
+            if res.data:
+                result.inserted.append(res.data[0])
+        except Exception as e:
+            result.errors.append({"index": index, "row": row, "message": str(e)})
+    return result
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces flashcard inserts from concurrent requests into batched writes
+
+    Rows are queued by submit() and written by a background thread either
+    when max_rows are pending or when the oldest pending row has waited
+    max_delay seconds. Every submit() call gets a Future that resolves to an
+    InsertResult covering just the rows it submitted. Pending rows are
+    flushed on close(), which is registered with atexit.
+    """
+
+    def __init__(self, client, table: str = "flashcards", max_rows: int = 100, max_delay: float = 0.05):
+        self.client = client
+        self.table = table
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._pending: List[tuple] = []
+        self._pending_rows = 0
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="flashcard-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, rows: List[Dict[str, Any]]) -> Future:
+        """Queue rows for insertion and return a Future for their InsertResult"""
+        future: Future = Future()
+        if not rows:
+            future.set_result(InsertResult())
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindBuffer is closed")
+            # Results are matched back to each caller by insert_key
+            rows = [row if row.get("insert_key") else dict(row, insert_key=str(uuid.uuid4())) for row in rows]
+            self._pending.append((rows, future))
+            self._pending_rows += len(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def flush(self) -> None:
+        """Write all pending rows now, in the calling thread"""
+        with self._cond:
+            batch = self._take()
+        self._write(batch)
+
+    def close(self) -> None:
+        """Stop the background thread after flushing pending rows"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def _take(self) -> List[tuple]:
+        batch = self._pending
+        self._pending = []
+        self._pending_rows = 0
+        self._oldest = None
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending_rows >= self.max_rows:
+                        break
+                    if self._oldest is not None:
+                        remaining = self.max_delay - (time.monotonic() - self._oldest)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                batch = self._take()
+            self._write(batch)
+
+    def _write(self, batch: List[tuple]) -> None:
+        if not batch:
+            return
+        rows = [row for group, _ in batch for row in group]
+        try:
+            combined = insert_flashcards(self.client, rows, self.table)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        # Split the combined result back into one InsertResult per submit()
+        # call by insert_key, since a row whose retry returned no data would
+        # shift every later row if they were matched by position.
+        failed = {error["row"]["insert_key"]: error for error in combined.errors}
+        inserted = {row.get("insert_key"): row for row in combined.inserted}
+        for group, future in batch:
+            result = InsertResult()
+            for local_index, row in enumerate(group):
+                error = failed.get(row["insert_key"])
+                if error:
+                    result.errors.append(dict(error, index=local_index))
+                elif row["insert_key"] in inserted:
+                    result.inserted.append(inserted[row["insert_key"]])
+            future.set_result(result)
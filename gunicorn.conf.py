@@ -0,0 +1,47 @@
+"""
+Production server profile: preforked gunicorn workers sharing one preloaded app
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and forked into WEB_CONCURRENCY
+worker processes (one per CPU by default), each serving GUNICORN_THREADS
+requests at once on threads, which covers requests waiting on Supabase,
+SMTP or Chapa. Nothing heavy is created at import (see services.py), so
+workers share the master's pages and start in milliseconds.
+
+Reloads are graceful: on SIGHUP the master starts workers with the reloaded
+settings, then lets the old ones finish their requests (up to
+GRACEFUL_TIMEOUT seconds) before they exit. Preloaded application code is
+not re-imported by SIGHUP; to deploy new code, send SIGUSR2 to start a new
+master beside the old one, then SIGQUIT to the old master once it is up.
+"""
+import os
+
+_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or _cpus
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then, staggered so they never restart together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+# Read by create_app(), which then leaves background work to post_fork
+os.environ["SERVER_PREFORK"] = "1"
+# Quota counters, the quota cache and cached-login versions must agree across workers
+os.environ.setdefault("SHARED_STATE_BACKEND", "sqlite")
+# Each worker has its own process pools; split the CPUs between them
+os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, _cpus // workers)))
+os.environ.setdefault("JOB_WORKERS", str(max(1, _cpus // workers)))
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork(), so queued webhooks and ingestion jobs are resumed per worker
+    from app import services
+    services.start_background()
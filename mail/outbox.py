@@ -0,0 +1,252 @@
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Dict, List, Optional
+
+from telemetry.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConfig:
+    """SMTP connection settings, read from the environment by default"""
+
+    def __init__(self, host: str = None, port: int = None, user: str = None, password: str = None,
+                 starttls: bool = None, timeout: float = 30):
+        self.host = host or os.getenv("SMTP_SERVER", "smtp.gmail.com")
+        self.port = int(port or os.getenv("SMTP_PORT", 587))
+        self.user = user if user is not None else os.getenv("SMTP_USER")
+        self.password = password if password is not None else os.getenv("SMTP_PASSWORD")
+        if starttls is None:
+            starttls = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+        self.starttls = starttls
+        self.timeout = timeout
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.user and self.password)
+
+
+class _Message:
+    def __init__(self, from_addr: str, to_addrs: List[str], body: str):
+        self.from_addr = from_addr
+        self.to_addrs = to_addrs
+        self.body = body
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+class Outbox:
+    """
+    Asynchronous mail outbox with a persistent SMTP connection
+
+    Request handlers call enqueue() and return immediately. A background
+    thread keeps one authenticated SMTP connection open, sends queued
+    messages in batches over it, reconnects when the server drops the
+    connection, and retries failed messages with exponential backoff and
+    jitter. The connection is closed after idle_timeout seconds without
+    mail. stats() reports queue depth and send latency.
+    """
+
+    def __init__(self, config: SMTPConfig = None, batch_size: int = 20, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0, idle_timeout: float = 60.0):
+        self.config = config or SMTPConfig()
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_timeout = idle_timeout
+        self._queue: "queue.Queue[Optional[_Message]]" = queue.Queue()
+        self._retry_heap: List[tuple] = []
+        self._retry_seq = itertools.count()
+        self._conn: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._latencies = deque(maxlen=500)
+        self._counters = {"sent": 0, "failed": 0, "retried": 0, "connections": 0}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "Outbox":
+        """Start the background sender; safe to call more than once"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        return self
+
+    def enqueue(self, to_addrs, body: str, from_addr: str = None) -> None:
+        """
+        Queue a message for delivery
+
+        Args:
+            to_addrs: Recipient address or list of addresses
+            body: Full message as produced by Message.as_string()
+            from_addr: Envelope sender, defaults to the SMTP user
+        """
+
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        self.start()
+        self._queue.put(_Message(from_addr or self.config.user, list(to_addrs), body))
+
+    def enqueue_message(self, to_addr: str, subject: str, body: str, subtype: str = "plain",
+                        from_addr: str = None) -> None:
+        """Build a MIME message with a plain or html body and queue it for delivery"""
+        from_addr = from_addr or self.config.user
+        msg = MIMEMultipart("alternative" if subtype == "html" else "mixed")
+        msg["From"] = from_addr
+        msg["To"] = to_addr
+        msg["Subject"] = subject
+        msg.attach(MIMEText(body, subtype))
+        self.enqueue(to_addr, msg.as_string(), from_addr)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Send what is queued (without waiting on retries) and stop"""
+        if self._thread is None or self._stopping:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._disconnect()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, delivery counters and send latency in milliseconds"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+            retry_depth = len(self._retry_heap)
+        stats = dict(counters, queue_depth=self._queue.qsize(), retry_depth=retry_depth)
+        if latencies:
+            stats["send_latency_ms"] = {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 2),
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2),
+            }
+        return stats
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                # Stop requested: flush whatever is already queued
+                leftover = []
+                while True:
+                    try:
+                        message = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if message is not None:
+                        leftover.append(message)
+                if leftover:
+                    self._send_batch(leftover)
+                return
+            if batch:
+                self._send_batch(batch)
+            elif self._conn is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._disconnect()
+
+    def _next_batch(self) -> Optional[List[_Message]]:
+        batch = []
+        now = time.monotonic()
+        with self._lock:
+            while self._retry_heap and self._retry_heap[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._retry_heap)[2])
+            wait = self._retry_heap[0][0] - now if self._retry_heap else 1.0
+        if not batch:
+            try:
+                message = self._queue.get(timeout=max(0.01, min(wait, 1.0)))
+            except queue.Empty:
+                return []
+            if message is None:
+                return None
+            batch.append(message)
+        while len(batch) < self.batch_size:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                self._queue.put(None)
+                break
+            batch.append(message)
+        return batch
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._conn is not None:
+            return self._conn
+        with span("smtp", "connect"):
+            conn = smtplib.SMTP(self.config.host, self.config.port, timeout=self.config.timeout)
+            if self.config.starttls:
+                conn.starttls()
+            if self.config.user and self.config.password:
+                conn.login(self.config.user, self.config.password)
+        self._conn = conn
+        with self._lock:
+            self._counters["connections"] += 1
+        return conn
+
+    def _disconnect(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.quit()
+            except Exception:
+                conn.close()
+
+    def _send_batch(self, batch: List[_Message]) -> None:
+        for message in batch:
+            start = time.monotonic()
+            try:
+                self._send_one(message)
+            except Exception as e:
+                self._schedule_retry(message, e)
+                continue
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+                self._counters["sent"] += 1
+        self._last_used = time.monotonic()
+
+    def _send_one(self, message: _Message) -> None:
+        message.attempts += 1
+        try:
+            with span("smtp", "send"):
+                self._connect().sendmail(message.from_addr, message.to_addrs, message.body)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The server answered and rejected this message; the connection is fine
+            raise
+        except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+            # The pooled connection went stale; reconnect once and resend
+            self._disconnect()
+            with span("smtp", "send"):
+                self._connect().sendmail(message.from_addr, message.to_addrs, message.body)
+
+    def _schedule_retry(self, message: _Message, error: Exception) -> None:
+        permanent = isinstance(error, smtplib.SMTPRecipientsRefused) or (
+            isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600)
+        if permanent or message.attempts > self.max_retries or self._stopping:
+            logger.error("Email send failed", extra={"fields": {"attempts": message.attempts, "error": str(error)}})
+            with self._lock:
+                self._counters["failed"] += 1
+            return
+        if isinstance(error, smtplib.SMTPException) and not isinstance(
+                error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+            self._disconnect()
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (message.attempts - 1))
+        delay = random.uniform(delay / 2, delay)
+        with self._lock:
+            self._counters["retried"] += 1
+            heapq.heappush(self._retry_heap, (time.monotonic() + delay, next(self._retry_seq), message))
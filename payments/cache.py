@@ -0,0 +1,75 @@
+import logging
+from typing import Any, Dict, Optional
+
+from caching import SingleFlight, TTLCache, cached_call
+
+logger = logging.getLogger(__name__)
+
+# Payment statuses that never change once reached
+FINAL_STATUSES = frozenset(["success", "failed", "refunded", "reversed", "cancelled"])
+
+
+class PaymentVerifier:
+    """
+    Cached payment verification
+
+    Lookups go to the in-process cache first, then to the payments table,
+    and only then to Chapa. Results in a final state are cached with no
+    expiry and recorded in the payments table so other workers find them
+    there; pending results are cached briefly to absorb page refreshes.
+    """
+
+    def __init__(self, chapa, client=None, cache: TTLCache = None, pending_ttl: float = 5.0):
+        self.chapa = chapa
+        self.client = client
+        self.cache = cache or TTLCache(max_entries=4096)
+        self.pending_ttl = pending_ttl
+        self._flight = SingleFlight()
+
+    def verify(self, tx_ref: str) -> Dict[str, Any]:
+        """Verify tx_ref, returning the same shape as ChapaPayment.verify_payment"""
+        return cached_call(self.cache, self._flight, tx_ref, lambda: self._load(tx_ref), self._ttl_for)
+
+    def invalidate(self, tx_ref: str) -> None:
+        self.cache.delete(tx_ref)
+
+    def _ttl_for(self, result: Dict[str, Any]) -> Any:
+        if not result.get("verified"):
+            return False
+        if result.get("status") in FINAL_STATUSES:
+            return None
+        return self.pending_ttl
+
+    def _load(self, tx_ref: str) -> Dict[str, Any]:
+        stored = self._from_table(tx_ref)
+        if stored is not None:
+            return stored
+
+        result = self.chapa.verify_payment(tx_ref)
+        if result.get("verified") and result.get("status") in FINAL_STATUSES:
+            self._store(tx_ref, result)
+        return result
+
+    def _from_table(self, tx_ref: str) -> Optional[Dict[str, Any]]:
+        if self.client is None:
+            return None
+        try:
+            rows = self.client.table("payments").select(
+                "status, amount, currency, email, first_name, last_name, created_at"
+            ).eq("tx_ref", tx_ref).limit(1).execute().data
+        except Exception as e:
+            logger.warning("Payment lookup failed", extra={"fields": {"tx_ref": tx_ref, "error": str(e)}})
+            return None
+        if not rows or rows[0].get("status") not in FINAL_STATUSES:
+            return None
+        return dict(rows[0], verified=True)
+
+    def _store(self, tx_ref: str, result: Dict[str, Any]) -> None:
+        if self.client is None:
+            return
+        row = {key: result.get(key) for key in ("status", "amount", "currency", "email", "first_name", "last_name")}
+        row["tx_ref"] = tx_ref
+        try:
+            self.client.table("payments").upsert(row, on_conflict="tx_ref").execute()
+        except Exception as e:
+            logger.warning("Failed to store verified payment", extra={"fields": {"tx_ref": tx_ref, "error": str(e)}})
@@ -6,11 +6,20 @@ import os
 from datetime import datetime
 from typing import Dict, Optional, Any
 
+from caching import SingleFlight, TTLCache, cached_call
+from payments.http import ChapaTransport, get_transport
+
+# Bank lists barely change; share them across instances for a few hours
+BANKS_TTL = int(os.getenv("CHAPA_BANKS_TTL", 6 * 60 * 60))
+_banks_cache = TTLCache(max_entries=64, default_ttl=BANKS_TTL)
+_banks_flight = SingleFlight()
+
 class ChapaPayment:
     """Chapa.co payment integration class"""
     
-    def __init__(self):
-        self.base_url = "https://api.chapa.co/v1"
+    def __init__(self, transport: Optional[ChapaTransport] = None):
+        self.base_url = os.getenv("CHAPA_BASE_URL", "https://api.chapa.co/v1")
+        self.http = transport or get_transport()
         self.secret_key = os.getenv("CHAPA_SECRET_KEY")
         self.webhook_secret = os.getenv("CHAPA_WEBHOOK_SECRET")
         
@@ -68,11 +77,11 @@ class ChapaPayment:
         }
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/transaction/initialize",
+                endpoint="transaction/initialize",
                 json=payload,
-                headers=headers,
-                timeout=30
+                headers=headers
             )
             response.raise_for_status()
             
@@ -119,10 +128,10 @@ class ChapaPayment:
         }
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/transaction/verify/{tx_ref}",
-                headers=headers,
-                timeout=30
+                endpoint="transaction/verify",
+                headers=headers
             )
             response.raise_for_status()
             
@@ -165,6 +174,9 @@ class ChapaPayment:
         """
         Get list of banks for a specific country
         
+        Successful responses are cached for CHAPA_BANKS_TTL seconds and
+        concurrent lookups for the same country share one API call.
+        
         Args:
             country: Country code (ET for Ethiopia, NG for Nigeria, etc.)
             
@@ -172,15 +184,27 @@ class ChapaPayment:
             Dictionary containing list of banks
         """
         
+        return cached_call(
+            _banks_cache,
+            _banks_flight,
+            country,
+            lambda: self._fetch_banks(country),
+            lambda result: BANKS_TTL if result.get("status") == "success" else False
+        )
+    
+    def _fetch_banks(self, country: str) -> Dict[str, Any]:
+        """Fetch the bank list for country from the Chapa API"""
+        
         headers = {
             "Authorization": f"Bearer {self.secret_key}"
         }
         
         try:
-            response = requests.get(
-                f"{self.base_url}/banks?country={country}",
-                headers=headers,
-                timeout=30
+            response = self.http.get(
+                f"{self.base_url}/banks",
+                endpoint="banks",
+                params={"country": country},
+                headers=headers
             )
             response.raise_for_status()
             
@@ -208,43 +232,48 @@ class ChapaPayment:
                 "message": f"Unexpected error: {str(e)}"
             }
     
-    def verify_webhook(self, payload: str, signature: str) -> bool:
+    def verify_webhook(self, payload, signature: str) -> bool:
         """
         Verify webhook signature for security
         
         Args:
-            payload: Raw webhook payload
+            payload: Raw webhook payload, as bytes or str, exactly as received
             signature: Webhook signature header
             
         Returns:
             True if signature is valid, False otherwise
         """
         
-        if not self.webhook_secret:
+        if not self.webhook_secret or not signature:
             return False
         
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        
         expected_signature = hmac.new(
             self.webhook_secret.encode('utf-8'),
-            payload.encode('utf-8'),
+            payload,
             hashlib.sha256
         ).hexdigest()
         
         return hmac.compare_digest(expected_signature, signature)
     
-    def process_webhook(self, payload: Dict[str, Any], signature: str) -> Dict[str, Any]:
+    def process_webhook(self, payload: Dict[str, Any], signature: str, raw_body: bytes = None) -> Dict[str, Any]:
         """
         Process incoming webhook from Chapa
         
         Args:
             payload: Webhook payload data
             signature: Webhook signature for verification
+            raw_body: Request body the signature was computed over; the
+                payload is re-serialized only when this is not given
             
         Returns:
             Dictionary containing webhook processing result
         """
         
         # Verify webhook signature
-        if not self.verify_webhook(json.dumps(payload), signature):
+        if not self.verify_webhook(raw_body if raw_body is not None else json.dumps(payload), signature):
             return {
                 "status": "error",
                 "message": "Invalid webhook signature"
@@ -0,0 +1,217 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from telemetry import tracing
+
+# HTTP methods that are safe to retry without risking a duplicate charge
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream that is currently failing"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    After failure_threshold failures in a row the circuit opens and calls
+    fail fast for reset_timeout seconds. Then a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    Callers record exactly one outcome for every call allow() admits.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ChapaTransport:
+    """
+    Shared HTTP transport for the Chapa API
+
+    Wraps one requests.Session so every call reuses pooled keep-alive
+    connections, applies separate connect and read timeouts, retries
+    idempotent requests on connection errors and 429/5xx responses with
+    jittered exponential backoff, trips a circuit breaker when Chapa keeps
+    failing, and records per-endpoint latency.
+    """
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 16,
+                 connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 max_retries: int = 2, backoff_base: float = 0.25, backoff_max: float = 2.0,
+                 breaker: CircuitBreaker = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._latencies: Dict[str, deque] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, endpoint: str = None, **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session
+
+        Args:
+            method: HTTP method
+            url: Absolute URL
+            endpoint: Label used for latency metrics, defaults to the URL
+            **kwargs: Passed through to requests.Session.request
+
+        Returns:
+            The final response; raise_for_status() is left to the caller
+        """
+
+        method = method.upper()
+        endpoint = endpoint or url
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = 1 + (self.max_retries if method in IDEMPOTENT_METHODS else 0)
+
+        # The breaker sees one outcome per logical request, however many attempts it takes
+        if not self.breaker.allow():
+            self._record(endpoint, "rejected", None)
+            raise CircuitOpenError("Chapa API is unavailable (circuit open)")
+
+        failed = True
+        try:
+            for attempt in range(1, attempts + 1):
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    self._record(endpoint, "error", time.perf_counter() - start)
+                    if attempt == attempts:
+                        raise
+                    self._sleep(attempt)
+                    continue
+
+                elapsed = time.perf_counter() - start
+                if response.status_code in RETRY_STATUSES or response.status_code >= 500:
+                    self._record(endpoint, "error", elapsed)
+                    if attempt < attempts and response.status_code in RETRY_STATUSES:
+                        response.close()
+                        self._sleep(attempt, response.headers.get("Retry-After"))
+                        continue
+                    return response
+
+                failed = False
+                self._record(endpoint, "ok", elapsed)
+                return response
+        finally:
+            # Also reached by any other exception, so a half-open trial never stays in flight
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-endpoint call counts and latency in milliseconds"""
+        with self._lock:
+            snapshot = {endpoint: (sorted(values), dict(self._counts[endpoint]))
+                        for endpoint, values in self._latencies.items()}
+        stats: Dict[str, Any] = {"circuit": self.breaker.state, "endpoints": {}}
+        for endpoint, (values, counts) in snapshot.items():
+            entry: Dict[str, Any] = dict(counts)
+            if values:
+                entry["latency_ms"] = {
+                    "p50": round(values[len(values) // 2] * 1000, 2),
+                    "p99": round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 2),
+                    "max": round(values[-1] * 1000, 2),
+                }
+            stats["endpoints"][endpoint] = entry
+        return stats
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _record(self, endpoint: str, outcome: str, elapsed: Optional[float]) -> None:
+        tracing.record("chapa", endpoint, elapsed or 0.0, outcome)
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, {"ok": 0, "error": 0, "rejected": 0})
+            counts[outcome] += 1
+            latencies = self._latencies.setdefault(endpoint, deque(maxlen=500))
+            if elapsed is not None:
+                latencies.append(elapsed)
+
+    def _sleep(self, attempt: int, retry_after: str = None) -> None:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        if retry_after and retry_after.isdigit():
+            delay = min(self.backoff_max, float(retry_after))
+        time.sleep(random.uniform(0, delay))
+
+
+_shared_transport: Optional[ChapaTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport() -> ChapaTransport:
+    """Process-wide transport shared by every ChapaPayment instance"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = ChapaTransport(
+                pool_maxsize=int(os.getenv("CHAPA_POOL_MAXSIZE", 16)),
+                connect_timeout=float(os.getenv("CHAPA_CONNECT_TIMEOUT", 3.05)),
+                read_timeout=float(os.getenv("CHAPA_READ_TIMEOUT", 15)),
+                max_retries=int(os.getenv("CHAPA_MAX_RETRIES", 2)),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.getenv("CHAPA_BREAKER_THRESHOLD", 5)),
+                    reset_timeout=float(os.getenv("CHAPA_BREAKER_RESET", 30)),
+                ),
+            )
+        return _shared_transport
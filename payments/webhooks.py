@@ -0,0 +1,319 @@
+"""
+Durable, idempotent ingestion of Chapa webhooks
+
+The /payment-webhook route verifies the signature and calls
+WebhookQueue.enqueue(), which appends the raw event to a local SQLite
+database and returns; Chapa gets its acknowledgement within milliseconds.
+A WebhookWorker thread drains the queue in batches and upserts the
+payments table on tx_ref, so redelivered events are harmless.
+
+Events can be inspected and replayed from the command line:
+
+    python -m payments.webhooks stats
+    python -m payments.webhooks replay --status failed
+    python -m payments.webhooks replay --tx-ref TX123 --now
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from telemetry.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+WEBHOOKS_PROCESSED = counter(
+    "webhook_events_processed_total", "Queued Chapa webhook events handled by the worker, by outcome", ["outcome"],
+)
+
+DEFAULT_DB_PATH = os.getenv("WEBHOOK_QUEUE_PATH", os.path.join("instance", "webhooks.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_hash TEXT NOT NULL UNIQUE,
+    tx_ref TEXT,
+    body TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    processed_at REAL,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_pending ON webhook_events(state, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_tx_ref ON webhook_events(tx_ref);
+"""
+
+
+class WebhookQueue:
+    """
+    Local durable queue of webhook events backed by SQLite
+
+    Events are keyed by a hash of their raw body, so a webhook Chapa
+    delivers twice is stored once. The database runs in WAL mode so the
+    request threads appending events do not block the worker reading them.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # Queues created before claimed_at existed
+        if "claimed_at" not in {row["name"] for row in conn.execute("PRAGMA table_info(webhook_events)")}:
+            conn.execute("ALTER TABLE webhook_events ADD COLUMN claimed_at REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, raw_body: bytes, tx_ref: Optional[str] = None) -> bool:
+        """
+        Store an event for processing
+
+        Args:
+            raw_body: Webhook body exactly as received
+            tx_ref: Transaction reference, stored for lookups and replays
+
+        Returns:
+            True if the event is new, False if it was already queued
+        """
+
+        event_hash = hashlib.sha256(raw_body).hexdigest()
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO webhook_events (event_hash, tx_ref, body, received_at) VALUES (?, ?, ?, ?)",
+            (event_hash, tx_ref, raw_body.decode("utf-8"), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, limit: int = 100) -> List[sqlite3.Row]:
+        """Mark up to limit due events as processing and return them"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM webhook_events WHERE state = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?", (now, limit)).fetchall()
+            if rows:
+                conn.executemany("UPDATE webhook_events SET state = 'processing', claimed_at = ? WHERE id = ?",
+                                 [(now, row["id"]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def mark_done(self, event_ids: List[int]) -> None:
+        self._conn().executemany(
+            "UPDATE webhook_events SET state = 'done', processed_at = ?, last_error = NULL WHERE id = ?",
+            [(time.time(), event_id) for event_id in event_ids])
+
+    def mark_failed(self, event_id: int, error: str, attempts: int, max_attempts: int) -> None:
+        state = "failed" if attempts >= max_attempts else "pending"
+        delay = min(300, 2 ** attempts)
+        self._conn().execute(
+            "UPDATE webhook_events SET state = ?, attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            (state, attempts, error, time.time() + delay, event_id))
+
+    def requeue_stale(self, older_than: float = 300) -> int:
+        """Return events claimed more than older_than seconds ago, and never finished, to the queue"""
+        cursor = self._conn().execute(
+            "UPDATE webhook_events SET state = 'pending' "
+            "WHERE state = 'processing' AND COALESCE(claimed_at, received_at) < ?",
+            (time.time() - older_than,))
+        return cursor.rowcount
+
+    def replay(self, state: Optional[str] = None, tx_ref: Optional[str] = None, since: Optional[float] = None) -> int:
+        """Reset matching events to pending so the worker processes them again"""
+        clauses, params = [], []
+        if state:
+            clauses.append("state = ?")
+            params.append(state)
+        if tx_ref:
+            clauses.append("tx_ref = ?")
+            params.append(tx_ref)
+        if since:
+            clauses.append("received_at >= ?")
+            params.append(since)
+        where = " AND ".join(clauses) or "1 = 1"
+        cursor = self._conn().execute(
+            f"UPDATE webhook_events SET state = 'pending', attempts = 0, next_attempt_at = 0 WHERE {where}", params)
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) AS n FROM webhook_events GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+
+def payment_row(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Map a Chapa webhook payload to a payments row, or None if nothing to store
+
+    Only successful payments are stored, as the synchronous handler always
+    did: a late or replayed failure event for the same tx_ref must never
+    overwrite a recorded success, and failure events often lack the amount
+    and currency the payments table requires.
+    """
+    if not event.get("tx_ref") or event.get("status") != "success":
+        return None
+    if event.get("amount") is None or not event.get("currency"):
+        return None
+    row = {key: event.get(key) for key in ("tx_ref", "status", "amount", "currency", "email", "first_name", "last_name")}
+    return {key: value for key, value in row.items() if value is not None}
+
+
+class WebhookWorker:
+    """
+    Background processor for queued webhook events
+
+    Each batch is written with one upsert on tx_ref. If the batch write
+    fails, events are retried individually so one bad event does not hold
+    back the rest; failing events back off and are marked failed after
+    max_attempts. Events claimed stale_after seconds ago and never finished,
+    by this or any other process, are put back in the queue now and then.
+    """
+
+    def __init__(self, queue: WebhookQueue, client, on_processed: Callable[[Dict[str, Any]], None] = None,
+                 batch_size: int = 100, poll_interval: float = 0.5, max_attempts: int = 8,
+                 stale_after: float = 300):
+        self.queue = queue
+        self.client = client
+        self.on_processed = on_processed
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "WebhookWorker":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="webhook-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def notify(self) -> None:
+        """Wake the worker after an enqueue instead of waiting for the next poll"""
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        next_stale_check = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_stale_check:
+                    self.queue.requeue_stale(self.stale_after)
+                    next_stale_check = time.monotonic() + self.stale_after / 4
+                processed = self.process_batch()
+            except Exception:
+                logger.exception("Webhook worker error")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def process_batch(self) -> int:
+        """Process one batch of due events; returns how many were claimed"""
+        events = self.queue.claim(self.batch_size)
+        if not events:
+            return 0
+
+        parsed = []
+        for event in events:
+            try:
+                parsed.append((event, json.loads(event["body"])))
+            except ValueError as e:
+                self.queue.mark_failed(event["id"], f"Invalid JSON: {e}", self.max_attempts, self.max_attempts)
+                WEBHOOKS_PROCESSED.inc(outcome="invalid")
+
+        # Keep the last event per tx_ref so one upsert never touches a row twice
+        rows: Dict[str, Dict[str, Any]] = {}
+        for _, payload in parsed:
+            row = payment_row(payload)
+            if row:
+                rows[row["tx_ref"]] = row
+
+        try:
+            if rows:
+                self.client.table("payments").upsert(list(rows.values()), on_conflict="tx_ref").execute()
+            done = [event for event, _ in parsed]
+        except Exception:
+            done = []
+            for event, payload in parsed:
+                row = payment_row(payload)
+                try:
+                    if row:
+                        self.client.table("payments").upsert(row, on_conflict="tx_ref").execute()
+                    done.append(event)
+                except Exception as e:
+                    self.queue.mark_failed(event["id"], str(e), event["attempts"] + 1, self.max_attempts)
+                    WEBHOOKS_PROCESSED.inc(outcome="failed" if event["attempts"] + 1 >= self.max_attempts else "retry")
+
+        self.queue.mark_done([event["id"] for event in done])
+        if done:
+            WEBHOOKS_PROCESSED.inc(len(done), outcome="done")
+        if self.on_processed:
+            done_ids = {event["id"] for event in done}
+            for event, payload in parsed:
+                if event["id"] in done_ids:
+                    try:
+                        self.on_processed(payload)
+                    except Exception:
+                        logger.exception("Webhook post-processing error")
+        return len(events)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay queued Chapa webhooks")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="webhook queue database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="count events by state")
+    replay = commands.add_parser("replay", help="reset events to pending")
+    replay.add_argument("--status", choices=["pending", "processing", "done", "failed"])
+    replay.add_argument("--tx-ref")
+    replay.add_argument("--since", type=float, help="only events received after this UNIX timestamp")
+    replay.add_argument("--now", action="store_true", help="process the replayed events immediately")
+    args = parser.parse_args(argv)
+
+    queue = WebhookQueue(args.db)
+    if args.command == "stats":
+        print(json.dumps(queue.stats(), indent=2))
+        return
+
+    count = queue.replay(state=args.status, tx_ref=args.tx_ref, since=args.since)
+    print(f"Replayed {count} event(s)")
+    if args.now and count:
+        from dotenv import load_dotenv
+        from supabase import create_client
+        load_dotenv()
+        client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+        worker = WebhookWorker(queue, client)
+        while worker.process_batch():
+            pass
+        print(json.dumps(queue.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
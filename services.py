@@ -0,0 +1,254 @@
+"""
+Clients and background services used by the app, created on first use
+
+Nothing here connects to anything or imports a heavy dependency
+(supabase, numpy, requests, smtplib) until a request needs it, so the app
+imports quickly and a cold start serves its first page without waiting on
+subsystems that page does not use.
+"""
+import logging
+import os
+import threading
+
+from telemetry.metrics import gauge
+from telemetry.tracing import TracedClient
+
+logger = logging.getLogger(__name__)
+
+
+class lazy:
+    """
+    Like functools.cached_property, but the factory runs at most once even
+    when several request threads reach it at the same time
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+        self._lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        # Once set, the instance attribute shadows this (non-data) descriptor
+        with self._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.factory(instance)
+        return instance.__dict__[self.name]
+
+
+class Services:
+    """Lazily created Supabase client, stores, mail outbox and payment services"""
+
+    @lazy
+    def supabase(self):
+        """Supabase client, traced per query; raises if SUPABASE_URL or SUPABASE_KEY is missing"""
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in the .env file")
+        from supabase import create_client
+        return TracedClient(create_client(url, key))
+
+    @lazy
+    def user_store(self):
+        """Users table access with column projection and a short-lived record cache, invalidated across workers"""
+        from users.repository import UserRepository
+        return UserRepository(self.supabase, ttl=float(os.getenv("USER_CACHE_TTL", 300)), state=self.shared_state)
+
+    @lazy
+    def avatars(self):
+        """Content-addressed avatar images and thumbnails on local disk"""
+        from users.avatars import DEFAULT_ROOT, AvatarStore
+        return AvatarStore(DEFAULT_ROOT, max_bytes=int(os.getenv("AVATAR_MAX_BYTES", 5 * 1024 * 1024)),
+                           max_pixels=int(os.getenv("AVATAR_MAX_PIXELS", 40_000_000)))
+
+    @lazy
+    def passwords(self):
+        """Password KDFs on a bounded process pool; saturation sheds load with a 503"""
+        from users.passwords import DEFAULT_METHOD, PasswordHasher
+        return PasswordHasher(
+            method=os.getenv("PASSWORD_HASH_METHOD", DEFAULT_METHOD),
+            workers=int(os.getenv("PASSWORD_HASH_WORKERS", 0)) or None,
+            max_queue=int(os.getenv("PASSWORD_HASH_QUEUE", 32)),
+        )
+
+    @lazy
+    def flashcard_buffer(self):
+        """Write-behind buffer coalescing flashcard inserts, or None when disabled"""
+        if os.getenv("FLASHCARD_WRITE_BEHIND", "").lower() not in ("1", "true", "yes"):
+            return None
+        from flashcards.store import WriteBehindBuffer
+        return WriteBehindBuffer(
+            self.supabase,
+            max_rows=int(os.getenv("FLASHCARD_WRITE_BEHIND_MAX_ROWS", 100)),
+            max_delay=float(os.getenv("FLASHCARD_WRITE_BEHIND_MAX_DELAY", 0.05)),
+        )
+
+    @lazy
+    def generation_cache(self):
+        """Generated cards keyed by normalized notes: in-process LRU, then Supabase"""
+        from flashcards.dedup import GenerationCache
+        return GenerationCache(
+            self.supabase,
+            max_entries=int(os.getenv("GENERATION_CACHE_SIZE", 2048)),
+            ttl=float(os.getenv("GENERATION_CACHE_TTL", 6 * 60 * 60)),
+        )
+
+    @lazy
+    def dashboard_cache(self):
+        """Rendered dashboard pages per user, reused until their flashcards change"""
+        from flashcards.sessions import DashboardCache
+        return DashboardCache(
+            max_users=int(os.getenv("DASHBOARD_CACHE_USERS", 1024)),
+            ttl=float(os.getenv("DASHBOARD_CACHE_TTL", 300)),
+        )
+
+    @lazy
+    def search(self):
+        """Flashcard search: Postgres full-text index, or in-process inverted indexes"""
+        from flashcards.search import create_search
+        return create_search(
+            self.supabase,
+            backend=os.getenv("SEARCH_BACKEND", "supabase"),
+            max_users=int(os.getenv("SEARCH_INDEX_USERS", 64)),
+            ttl=float(os.getenv("SEARCH_INDEX_TTL", 3600)),
+        )
+
+    @lazy
+    def shared_state(self):
+        """Counters and cached values every worker process sees: in-process, or a local SQLite file"""
+        from shared_state import DEFAULT_DB_PATH, create_shared_state
+        return create_shared_state(os.getenv("SHARED_STATE_BACKEND", "memory"), DEFAULT_DB_PATH)
+
+    @lazy
+    def quota(self):
+        """Daily flashcard quota: atomic check-and-increment per user per UTC day"""
+        from flashcards.quota import create_quota_service
+        return create_quota_service(
+            self.supabase,
+            backend=os.getenv("QUOTA_BACKEND", "supabase"),
+            ttl=float(os.getenv("QUOTA_CACHE_TTL", 60)),
+            state=self.shared_state,
+        )
+
+    @lazy
+    def hf_client(self):
+        """Model-written questions batched across requests, or None without an API key"""
+        api_key = os.getenv("HUGGINGFACE_API_KEY")
+        if not api_key:
+            return None
+        from flashcards.inference import InferenceClient
+        model = os.getenv("HUGGINGFACE_MODEL", "valhalla/t5-small-qg-hl")
+        return InferenceClient(
+            os.getenv("HUGGINGFACE_API_URL", f"https://api-inference.huggingface.co/models/{model}"),
+            {"Authorization": f"Bearer {api_key}"},
+            batch_window=float(os.getenv("HUGGINGFACE_BATCH_WINDOW", 0.02)),
+            max_concurrency=int(os.getenv("HUGGINGFACE_MAX_CONCURRENCY", 2)),
+            timeout=float(os.getenv("HUGGINGFACE_TIMEOUT", 8)),
+        )
+
+    @lazy
+    def ingest_jobs(self):
+        """Background bulk ingestion: local job store, generator on a process pool"""
+        from flashcards.jobs import DEFAULT_DB_PATH, IngestRunner, JobStore
+        store = JobStore(DEFAULT_DB_PATH)
+        gauge("ingest_jobs", "Bulk ingestion jobs in the local job store, by state",
+              lambda: {(state,): count for state, count in store.stats().items()}, ["state"])
+        return IngestRunner(
+            store,
+            self.supabase,
+            self.quota,
+            workers=int(os.getenv("JOB_WORKERS", 0)) or None,
+            cards_per_document=int(os.getenv("JOB_CARDS_PER_DOCUMENT", 5)),
+            question_writer=self.hf_client.generate_questions if self.hf_client else None,
+            on_finished=self._on_cards_stored,
+        ).start()
+
+    @lazy
+    def outbox(self):
+        """Outgoing mail queue sending over a persistent SMTP connection"""
+        from mail.outbox import Outbox
+        outbox = Outbox()
+        gauge("mail_outbox_queue_depth", "Messages waiting in the mail outbox (including retries)",
+              lambda: sum(outbox.stats()[key] for key in ("queue_depth", "retry_depth")))
+        return outbox
+
+    @lazy
+    def chapa(self):
+        """Chapa API client, or None when payments are not configured"""
+        try:
+            from payments.chapa import ChapaPayment
+            chapa = ChapaPayment()
+        except Exception as e:
+            logger.warning("Chapa payment not initialized", extra={"fields": {"error": str(e)}})
+            return None
+        gauge("chapa_circuit_open", "1 while the Chapa circuit breaker is open",
+              lambda: int(chapa.http.breaker.state == "open"))
+        return chapa
+
+    @lazy
+    def payment_verifier(self):
+        from payments.cache import PaymentVerifier
+        return PaymentVerifier(self.chapa, self.supabase)
+
+    @lazy
+    def webhook_queue(self):
+        """Webhooks are queued on local disk and applied by a background worker"""
+        from payments.webhooks import WebhookQueue
+        queue = WebhookQueue()
+        gauge("webhook_queue_events", "Queued Chapa webhook events, by state",
+              lambda: {(state,): count for state, count in queue.stats().items()}, ["state"])
+        return queue
+
+    @lazy
+    def webhook_worker(self):
+        from payments.webhooks import WebhookWorker
+        return WebhookWorker(self.webhook_queue, self.supabase, on_processed=self._on_payment_event).start()
+
+    def _on_cards_stored(self, email):
+        """Called by the ingestion runner once a job's cards are stored"""
+        self.dashboard_cache.invalidate(email)
+        self.search.invalidate(email)
+
+    def _on_payment_event(self, event):
+        """Called by the webhook worker once an event is stored"""
+        self.payment_verifier.invalidate(event.get("tx_ref"))
+        # The user's plan may change, so drop their cached quota
+        if event.get("email"):
+            self.quota.invalidate(event.get("email"))
+
+    def resume_webhooks(self) -> None:
+        """
+        Start the webhook worker in the background if an earlier process
+        left a queue on disk, so pending events are applied without waiting
+        for the next webhook to arrive
+        """
+
+        def resume():
+            from payments.webhooks import DEFAULT_DB_PATH
+            if os.path.exists(DEFAULT_DB_PATH) and self.chapa:
+                self.webhook_worker
+
+        if os.getenv("CHAPA_SECRET_KEY"):
+            threading.Thread(target=resume, name="webhook-resume", daemon=True).start()
+
+    def resume_jobs(self) -> None:
+        """Start the ingestion runner in the background if an earlier process left unfinished jobs"""
+
+        def resume():
+            from flashcards.jobs import has_unfinished_jobs
+            if has_unfinished_jobs():
+                self.ingest_jobs
+
+        threading.Thread(target=resume, name="ingest-resume", daemon=True).start()
+
+    def start_background(self) -> None:
+        """
+        Resume queued webhooks and ingestion jobs. A preforked server calls
+        this in each worker after fork(), since threads and process pools
+        started in the parent do not survive into its children.
+        """
+        self.resume_webhooks()
+        self.resume_jobs()
@@ -0,0 +1,190 @@
+"""
+Counters, cached values and rate limits shared by every worker process
+
+Under a preforked server each worker is a separate process, so state kept
+in a dict diverges between them: a user's quota would be counted once per
+worker, and a cache entry dropped in one worker would live on in the
+others. Values that must agree live behind this small interface instead:
+get/set/delete of JSON-serializable values with an optional TTL, and an
+atomic incr() for counters.
+
+MemoryState keeps them in the process, for the development server and
+single-process deployments. SQLiteState keeps them in a local SQLite file
+in WAL mode, shared by every process on the host without another service;
+each call is one statement.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_DB_PATH = os.getenv("SHARED_STATE_PATH", os.path.join("instance", "state.sqlite3"))
+
+
+class MemoryState:
+    """Shared state for a single process"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(key, time.time())
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, None if ttl is None else time.time() + ttl)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add amount to a counter and return the new value; ttl applies when the counter is created"""
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                entry = (0, None if ttl is None else now + ttl)
+            value = entry[0] + amount
+            self._data[key] = (value, entry[1])
+            # Expired entries are only dropped when read; sweep now and then
+            if len(self._data) > 10000 and value == amount:
+                for stale in [k for k, (_, expires_at) in self._data.items() if expires_at and expires_at <= now]:
+                    del self._data[stale]
+        return value
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteState:
+    """
+    Shared state in a SQLite file, for all worker processes on one host
+
+    Each thread of each process opens its own connection; a connection
+    inherited across fork() is never reused.
+    """
+
+    # Expired rows are deleted after every this many writes per process
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _wrote(self, now: float) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._conn().execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), None if ttl is None else now + ttl),
+        )
+        self._wrote(now)
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add amount to a counter and return the new value; ttl applies when the counter is created"""
+        now = time.time()
+        # One statement, so concurrent increments from any process never lose an update
+        row = self._conn().execute(
+            """
+            INSERT INTO shared_state (key, value, expires_at) VALUES (?1, CAST(?2 AS TEXT), ?3)
+            ON CONFLICT(key) DO UPDATE SET
+                value = CASE WHEN expires_at <= ?4 THEN excluded.value
+                             ELSE CAST(CAST(value AS INTEGER) + ?2 AS TEXT) END,
+                expires_at = CASE WHEN expires_at <= ?4 THEN excluded.expires_at ELSE expires_at END
+            RETURNING value
+            """,
+            (key, amount, None if ttl is None else now + ttl, now),
+        ).fetchone()
+        self._wrote(now)
+        return int(row[0])
+
+
+class RateLimiter:
+    """
+    At most limit events per key in each fixed window of window seconds
+
+    Args:
+        state: Shared state the counters are kept in
+        name: Prefix for this limiter's keys
+        limit: Events allowed per window
+        window: Window length in seconds
+    """
+
+    def __init__(self, state, name: str, limit: int, window: float):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+    def _key(self, key: str, now: float) -> str:
+        return f"rate:{self.name}:{key}:{int(now // self.window)}"
+
+    def _retry_after(self, now: float) -> int:
+        return max(1, math.ceil(self.window - now % self.window))
+
+    def blocked(self, key: str) -> Optional[int]:
+        """Seconds until key may try again if it has used up this window, else None"""
+        now = time.time()
+        if self.state.get(self._key(key, now), 0) >= self.limit:
+            return self._retry_after(now)
+        return None
+
+    def hit(self, key: str) -> Optional[int]:
+        """Count an event for key; returns the seconds to wait if it went over the limit, else None"""
+        now = time.time()
+        if self.state.incr(self._key(key, now), 1, ttl=self.window) > self.limit:
+            return self._retry_after(now)
+        return None
+
+
+def create_shared_state(backend: str = "memory", path: str = DEFAULT_DB_PATH):
+    """Create the shared state for the configured backend ("memory" or "sqlite")"""
+    if backend == "sqlite":
+        return SQLiteState(path)
+    return MemoryState()
@@ -0,0 +1,53 @@
+"""
+Structured (JSON lines) logging with request ids
+
+configure_logging() installs one handler on the root logger that writes a
+JSON object per record, including the current request id and any fields
+passed through extra={"fields": {...}}. LOG_FORMAT=text switches to a
+plain format for local development.
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+from telemetry.tracing import current_request_id
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = None, fmt: str = None) -> None:
+    """Log to stderr as JSON lines (or text); a no-op if already configured"""
+    root = logging.getLogger()
+    if any(getattr(handler, "_app_handler", False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler._app_handler = True
+    handler.addFilter(RequestIdFilter())
+    if (fmt or os.getenv("LOG_FORMAT", "json")).lower() == "text":
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
@@ -0,0 +1,102 @@
+"""
+Flask integration: request timing, request ids, template spans and /metrics
+
+init_app() starts a trace for every request (reusing a well-formed
+X-Request-ID header when the caller sends one), times template rendering
+as "render" spans, and on the way out records the request in the
+http_request_* metrics, echoes X-Request-ID and writes one structured log
+line with the duration and a per-system span breakdown, e.g.
+
+    {"message": "GET /dashboard 200", "request_id": "...", "duration_ms": 182.4,
+     "spans": {"render": {"calls": 1, "ms": 21.3}, "supabase": {"calls": 4, "ms": 148.0}}}
+
+/metrics serves every registered metric in the Prometheus text format.
+Set METRICS_TOKEN to require "Authorization: Bearer <token>" on it.
+"""
+import hmac
+import logging
+import os
+import re
+import time
+
+from flask import Response, abort, request, template_rendered, before_render_template
+
+from telemetry import tracing
+from telemetry.metrics import REGISTRY, counter, histogram
+
+logger = logging.getLogger("app.requests")
+
+HTTP_REQUESTS = counter("http_requests_total", "Requests handled, by route and status", ["method", "route", "status"])
+HTTP_SECONDS = histogram("http_request_duration_seconds", "Request handling time", ["method", "route"])
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _route() -> str:
+    # The URL rule, not the path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _start_request():
+    incoming = request.headers.get("X-Request-ID", "")
+    tracing.start_trace(incoming if _REQUEST_ID.match(incoming) else None)
+
+
+def _finish_request(response):
+    trace = tracing.current_trace()
+    if trace is None:
+        return response
+    elapsed = time.perf_counter() - trace.started
+    route = _route()
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=str(response.status_code))
+    HTTP_SECONDS.observe(elapsed, method=request.method, route=route)
+    response.headers["X-Request-ID"] = trace.request_id
+    logger.log(
+        logging.DEBUG if route == "/metrics" else logging.INFO,
+        "%s %s %s", request.method, request.path, response.status_code,
+        extra={"fields": {
+            "method": request.method,
+            "path": request.path,
+            "route": route,
+            "status": response.status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "spans": trace.summary(),
+        }},
+    )
+    return response
+
+
+def _end_request(error=None):
+    tracing.end_trace()
+
+
+def _render_started(sender, template, context, **extra):
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    trace = tracing.current_trace()
+    started = trace.render_started if trace is not None else None
+    if started is not None:
+        tracing.record("render", template.name or "template", time.perf_counter() - started)
+        trace.render_started = None
+
+
+def metrics():
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied, f"Bearer {token}"):
+            abort(401)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app) -> None:
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    app.add_url_rule("/metrics", "metrics", metrics)
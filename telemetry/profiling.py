@@ -0,0 +1,287 @@
+"""
+On-demand profiling of the next N requests to a route
+
+Disabled unless PROFILING_SECRET is set: without it no hook or endpoint
+is registered at all. With it, the admin endpoints below (which require
+the X-Profiling-Secret header) arm a route, and while nothing is armed
+each request pays a single dict check, plus one shared-state read a second.
+
+    POST   /admin/profile          {"route": "/dashboard", "requests": 5, "mode": "stacks"}
+    GET    /admin/profile          armed routes and stored profiles
+    GET    /admin/profile/<name>   download a stored profile
+    DELETE /admin/profile          disarm everything
+
+Modes:
+    stacks       samples the request thread's stack every
+                 PROFILE_SAMPLE_INTERVAL seconds and writes collapsed
+                 stacks (.collapsed), ready for flamegraph.pl or speedscope
+    cprofile     deterministic profile (.pstats for snakeviz/gprof2dot,
+                 plus a .txt summary by cumulative time)
+    tracemalloc  allocations made during the request, by traceback (.txt)
+
+One request is profiled at a time per process; requests arriving while
+another is being profiled run normally and do not use up the armed count.
+Armed routes and their remaining counts live in shared state, so under a
+preforked server arming a route through any worker arms it in all of them
+(each notices within ARMED_REFRESH seconds) and the count is shared.
+Profiles are written to PROFILE_DIR (default instance/profiles); the
+newest PROFILE_KEEP files are kept.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import abort, g, jsonify, request, send_from_directory
+
+from shared_state import MemoryState
+from telemetry.tracing import current_request_id
+
+logger = logging.getLogger(__name__)
+
+MODES = ("stacks", "cprofile", "tracemalloc")
+MAX_REQUESTS = 100
+# Seconds a worker keeps its copy of the armed routes before reading shared state again
+ARMED_REFRESH = 1.0
+ARMED_KEY = "profile:armed"
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+class Profiler:
+    def __init__(self, directory: str, keep: int = 200, sample_interval: float = 0.001,
+                 get_state: Callable[[], Any] = None):
+        self.directory = directory
+        self.keep = keep
+        self.sample_interval = sample_interval
+        self._get_state = get_state or MemoryState
+        self._state = None
+        # route rule -> mode, as last read from shared state; empty means disabled
+        self.armed: Dict[str, str] = {}
+        self._armed_at = float("-inf")
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = self._get_state()
+        return self._state
+
+    @staticmethod
+    def _remaining_key(route: str) -> str:
+        return f"profile:remaining:{route}"
+
+    def refresh(self, force: bool = False) -> Dict[str, str]:
+        """The armed routes, re-read from shared state at most every ARMED_REFRESH seconds"""
+        now = time.monotonic()
+        if force or now - self._armed_at >= ARMED_REFRESH:
+            self.armed = self.state.get(ARMED_KEY) or {}
+            self._armed_at = now
+        return self.armed
+
+    def arm(self, route: str, requests: int, mode: str) -> None:
+        with self._lock:
+            self.state.set(self._remaining_key(route), requests)
+            self.state.set(ARMED_KEY, dict(self.refresh(force=True), **{route: mode}))
+            self.refresh(force=True)
+
+    def disarm(self, route: str = None) -> None:
+        with self._lock:
+            armed = self.refresh(force=True)
+            routes = list(armed) if route is None else [route]
+            self.state.set(ARMED_KEY, {r: mode for r, mode in armed.items() if r not in routes})
+            for r in routes:
+                self.state.delete(self._remaining_key(r))
+            self.refresh(force=True)
+
+    def status(self) -> Dict[str, Dict[str, object]]:
+        """Armed routes with their mode and the requests left, as every worker sees them"""
+        return {route: {"mode": mode, "remaining": self.state.get(self._remaining_key(route), 0)}
+                for route, mode in self.refresh(force=True).items()}
+
+    def profiles(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.listdir(self.directory), reverse=True)
+
+    def claim(self, route: str) -> Optional[str]:
+        """Mode to profile this request with, or None; consumes one armed request"""
+        mode = self.armed.get(route)
+        if mode is None or not self._busy.acquire(blocking=False):
+            return None
+        # The count is shared by every worker; whoever takes it below zero lost the race
+        remaining = self.state.incr(self._remaining_key(route), -1)
+        if remaining <= 0:
+            self.disarm(route)
+        if remaining < 0:
+            self._busy.release()
+            return None
+        return mode
+
+    def start(self, mode: str):
+        if mode == "stacks":
+            sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+            return sampler
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(25)
+        return started_here, tracemalloc.take_snapshot()
+
+    def finish(self, mode: str, state, route: str, elapsed: float) -> str:
+        try:
+            name = self._name(route)
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, name)
+            if mode == "stacks":
+                path += ".collapsed"
+                with open(path, "w") as f:
+                    for stack, count in state.stop().most_common():
+                        f.write(f"{stack} {count}\n")
+            elif mode == "cprofile":
+                state.disable()
+                state.dump_stats(path + ".pstats")
+                summary = io.StringIO()
+                pstats.Stats(state, stream=summary).sort_stats("cumulative").print_stats(40)
+                path += ".txt"
+                with open(path, "w") as f:
+                    f.write(summary.getvalue())
+            else:
+                started_here, before = state
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                if started_here:
+                    tracemalloc.stop()
+                path += ".txt"
+                with open(path, "w") as f:
+                    f.write(f"traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n\n")
+                    for stat in after.compare_to(before, "traceback")[:30]:
+                        f.write(f"{stat}\n")
+                        for line in stat.traceback.format(limit=8):
+                            f.write(f"    {line}\n")
+                        f.write("\n")
+            self._prune()
+            logger.info("Profile written", extra={"fields": {
+                "route": route, "mode": mode, "file": os.path.basename(path), "duration_ms": round(elapsed * 1000, 2)}})
+            return path
+        finally:
+            self._busy.release()
+
+    def _name(self, route: str) -> str:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        return f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{current_request_id() or os.getpid()}"
+
+    def _prune(self) -> None:
+        files = self.profiles()
+        for name in files[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def _authorized(secret: str) -> None:
+    supplied = request.headers.get("X-Profiling-Secret", "")
+    if not hmac.compare_digest(supplied.encode(), secret.encode()):
+        abort(404)
+
+
+def init_app(app, get_state: Callable[[], Any] = None) -> Optional[Profiler]:
+    """
+    Register profiling hooks and admin endpoints if PROFILING_SECRET is set
+
+    get_state returns the shared state armed routes are kept in; it is only
+    called once profiling is used.
+    """
+    secret = os.getenv("PROFILING_SECRET")
+    if not secret:
+        return None
+    profiler = Profiler(
+        os.getenv("PROFILE_DIR", os.path.join("instance", "profiles")),
+        keep=int(os.getenv("PROFILE_KEEP", 200)),
+        sample_interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.001)),
+        get_state=get_state,
+    )
+
+    @app.before_request
+    def _start_profile():
+        if not profiler.refresh() or request.url_rule is None:
+            return
+        mode = profiler.claim(request.url_rule.rule)
+        if mode:
+            g.profile = (mode, profiler.start(mode), time.perf_counter())
+
+    @app.teardown_request
+    def _finish_profile(error=None):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            mode, state, started = profile
+            try:
+                profiler.finish(mode, state, request.url_rule.rule, time.perf_counter() - started)
+            except Exception:
+                logger.exception("Failed to write profile")
+
+    def admin_profile():
+        _authorized(secret)
+        if request.method == "DELETE":
+            profiler.disarm()
+        elif request.method == "POST":
+            data = request.get_json(silent=True) or {}
+            route = data.get("route")
+            mode = data.get("mode", "stacks")
+            count = data.get("requests", 1)
+            if route not in {rule.rule for rule in app.url_map.iter_rules()}:
+                return jsonify({"status": "error", "message": f"Unknown route: {route}"}), 400
+            if mode not in MODES:
+                return jsonify({"status": "error", "message": f"mode must be one of {', '.join(MODES)}"}), 400
+            if not isinstance(count, int) or not 1 <= count <= MAX_REQUESTS:
+                return jsonify({"status": "error", "message": f"requests must be 1-{MAX_REQUESTS}"}), 400
+            profiler.arm(route, count, mode)
+        return jsonify({"status": "ok", "armed": profiler.status(), "profiles": profiler.profiles()})
+
+    def admin_profile_file(name):
+        _authorized(secret)
+        return send_from_directory(os.path.abspath(profiler.directory), name, as_attachment=True)
+
+    app.add_url_rule("/admin/profile", "admin_profile", admin_profile, methods=["GET", "POST", "DELETE"])
+    app.add_url_rule("/admin/profile/<name>", "admin_profile_file", admin_profile_file)
+    return profiler
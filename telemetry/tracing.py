@@ -0,0 +1,145 @@
+"""
+Request ids and spans around upstream calls
+
+A Trace is started for each request and carried in a context variable, so
+spans recorded anywhere while handling it (including calls fanned out by
+concurrency.run_parallel, which copies the context) are attributed to it.
+Every span also feeds the span_duration_seconds histogram, whether or not
+it happens inside a request.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from telemetry.metrics import counter, histogram
+
+SPAN_SECONDS = histogram(
+    "span_duration_seconds", "Time spent in upstream calls (Supabase, SMTP, Chapa, Hugging Face) and template rendering",
+    ["system", "operation", "outcome"],
+)
+SPAN_ERRORS = counter(
+    "span_errors_total", "Spans that ended with an error", ["system", "operation"],
+)
+
+
+class Trace:
+    """Per-request id and a summary of the spans recorded while handling it"""
+
+    def __init__(self, request_id: str = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.render_started: Optional[float] = None
+        self._spans: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, system: str, seconds: float) -> None:
+        with self._lock:
+            span = self._spans.setdefault(system, [0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Calls and total milliseconds per system, e.g. {"supabase": {"calls": 3, "ms": 41.2}}"""
+        with self._lock:
+            return {system: {"calls": calls, "ms": round(seconds * 1000, 2)}
+                    for system, (calls, seconds) in sorted(self._spans.items())}
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(request_id: str = None) -> Trace:
+    trace = Trace(request_id)
+    _current.set(trace)
+    return trace
+
+
+def end_trace() -> None:
+    _current.set(None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+
+def record(system: str, operation: str, seconds: float, outcome: str = "ok") -> None:
+    """Record a finished span; for callers that time the call themselves"""
+    SPAN_SECONDS.observe(seconds, system=system, operation=operation, outcome=outcome)
+    if outcome == "error":
+        SPAN_ERRORS.inc(system=system, operation=operation)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(system, seconds)
+
+
+@contextmanager
+def span(system: str, operation: str) -> Iterator[None]:
+    """Time the enclosed block as one call to system (e.g. "supabase", "flashcards.select")"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record(system, operation, time.perf_counter() - start, "error")
+        raise
+    record(system, operation, time.perf_counter() - start)
+
+
+# Query builder methods that decide what a PostgREST request does
+_OPERATIONS = frozenset(["select", "insert", "upsert", "update", "delete"])
+
+
+class TracedClient:
+    """
+    Supabase client wrapper that records every query's execute() as a span
+
+    Spans are labelled "<table>.<operation>" (or "rpc.<function>"), e.g.
+    "flashcards.insert". Everything else is passed through to the client.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> "_TracedQuery":
+        return _TracedQuery(self._client.table(name), name)
+
+    def from_(self, name: str) -> "_TracedQuery":
+        return _TracedQuery(self._client.from_(name), name)
+
+    def rpc(self, fn: str, *args, **kwargs) -> "_TracedQuery":
+        return _TracedQuery(self._client.rpc(fn, *args, **kwargs), "rpc", fn)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _TracedQuery:
+    def __init__(self, builder, table: str, operation: str = None):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def execute(self):
+        with span("supabase", f"{self._table}.{self._operation or 'select'}"):
+            return self._builder.execute()
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                operation = self._operation or (name if name in _OPERATIONS else None)
+                return _TracedQuery(result, self._table, operation)
+            return result
+
+        return call
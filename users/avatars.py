@@ -0,0 +1,183 @@
+"""
+Content-addressed avatar store with thumbnails
+
+Avatars arrive as base64 data URLs. put() decodes one once, checks that it
+is an image, and writes the original and a WebP thumbnail per size in
+THUMBNAIL_SIZES to a local directory, named by a hash of the image bytes.
+The users row keeps only that key, so login and profile reads no longer
+carry the image, and /avatars/<key>-<size>.webp can be cached forever
+because a key's content never changes. Identical uploads share one set of
+files.
+
+Existing rows holding data URLs are moved into the store with:
+
+    python -m users.avatars migrate [--dry-run] [--batch-size 50]
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.getenv("AVATAR_DIR", os.path.join("instance", "avatars"))
+THUMBNAIL_SIZES = (256, 64)
+KEY_LENGTH = 32
+
+_DATA_URL = re.compile(r"^data:image/[a-z0-9.+-]+;base64,", re.IGNORECASE)
+_KEY = re.compile(rf"^[0-9a-f]{{{KEY_LENGTH}}}$")
+
+
+class InvalidAvatar(ValueError):
+    """Raised for avatars that are not a decodable image within the size limit"""
+
+
+def is_key(value: Optional[str]) -> bool:
+    return bool(value) and bool(_KEY.match(value))
+
+
+def is_data_url(value: Optional[str]) -> bool:
+    return bool(value) and bool(_DATA_URL.match(value))
+
+
+class AvatarStore:
+    """
+    Avatar images and their thumbnails on local disk, keyed by content hash
+
+    Args:
+        root: Directory the files are written to; share it between hosts
+            (or sync it) when the app runs on more than one
+        max_bytes: Largest decoded image accepted
+        max_pixels: Largest image accepted, in pixels; checked from the
+            header before decoding, since a small compressed file can
+            expand to gigabytes
+        sizes: Square thumbnail sizes generated at upload time
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, max_bytes: int = 5 * 1024 * 1024, max_pixels: int = 40_000_000,
+                 sizes=THUMBNAIL_SIZES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.sizes = tuple(sizes)
+
+    def path(self, key: str, size: int) -> str:
+        return os.path.join(self.root, key[:2], f"{key}-{size}.webp")
+
+    def original_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, data_url: str) -> str:
+        """Store an avatar given as a data URL and return its key"""
+        match = _DATA_URL.match(data_url or "")
+        if not match:
+            raise InvalidAvatar("Avatar must be an image data URL")
+        # base64 grows data by 4/3; reject oversized uploads before decoding them
+        if (len(data_url) - match.end()) * 3 // 4 > self.max_bytes:
+            raise InvalidAvatar("Avatar image is too large")
+        try:
+            data = base64.b64decode(data_url[match.end():], validate=True)
+        except (binascii.Error, ValueError):
+            raise InvalidAvatar("Avatar is not valid base64")
+        return self.put_bytes(data)
+
+    def put_bytes(self, data: bytes) -> str:
+        if len(data) > self.max_bytes:
+            raise InvalidAvatar("Avatar image is too large")
+        key = hashlib.sha256(data).hexdigest()[:KEY_LENGTH]
+        if os.path.exists(self.original_path(key)) and all(os.path.exists(self.path(key, size)) for size in self.sizes):
+            return key
+
+        # Pillow is only needed by uploads and the migration
+        from PIL import Image, ImageOps, UnidentifiedImageError
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+                if width * height > self.max_pixels:
+                    raise InvalidAvatar("Avatar image dimensions are too large")
+                image.load()
+                image = ImageOps.exif_transpose(image)
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+                for size in self.sizes:
+                    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    thumbnail.save(buffer, "WEBP", quality=85, method=4)
+                    self._write(self.path(key, size), buffer.getvalue())
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise InvalidAvatar("Avatar is not a supported image") from e
+        # The original is kept so thumbnails can be regenerated at new sizes
+        self._write(self.original_path(key), data)
+        return key
+
+    def _write(self, path: str, data: bytes) -> None:
+        # Write then rename, so a reader never sees a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def migrate(client, store: AvatarStore, batch_size: int = 50, dry_run: bool = False) -> dict:
+    """
+    Move data URL avatars from the users table into the store
+
+    Reads the affected rows in keyset pages of batch_size (the avatars are
+    large, so pages are kept small) and replaces each avatar with its key.
+    Avatars that cannot be decoded are cleared. Safe to run again.
+    """
+
+    counts = {"migrated": 0, "invalid": 0, "failed": 0}
+    last_id = 0
+    while True:
+        rows = client.table("users").select("id, email, avatar").like("avatar", "data:%") \
+            .gt("id", last_id).order("id").limit(batch_size).execute().data or []
+        for row in rows:
+            try:
+                key = store.put(row["avatar"]) if not dry_run else None
+                outcome = "migrated"
+            except InvalidAvatar as e:
+                logger.warning("Clearing invalid avatar", extra={"fields": {"email": row["email"], "error": str(e)}})
+                key, outcome = None, "invalid"
+            try:
+                if not dry_run:
+                    client.table("users").update({"avatar": key}, returning="minimal").eq("id", row["id"]).execute()
+                counts[outcome] += 1
+            except Exception as e:
+                logger.error("Avatar migration error", extra={"fields": {"email": row["email"], "error": str(e)}})
+                counts["failed"] += 1
+        if len(rows) < batch_size:
+            return counts
+        last_id = rows[-1]["id"]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the avatar store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("migrate", help="move data URL avatars from the users table into the store")
+    run.add_argument("--batch-size", type=int, default=50)
+    run.add_argument("--dry-run", action="store_true", help="count the rows without changing anything")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from services import Services
+    from telemetry.logs import configure_logging
+    load_dotenv()
+    configure_logging()
+    services = Services()
+    counts = migrate(services.supabase, services.avatars, batch_size=args.batch_size, dry_run=args.dry_run)
+    print(", ".join(f"{outcome}: {count}" for outcome, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
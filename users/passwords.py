@@ -0,0 +1,128 @@
+"""
+Password hashing on a bounded process pool
+
+generate_password_hash and check_password_hash are deliberately slow KDFs.
+Running them in a separate process pool moves the work off the GIL, so
+other request threads keep running while a login storm is in progress;
+the calling thread still blocks until its result arrives. The number of
+hashes in flight is capped; beyond it callers get HasherBusy immediately,
+and a caller whose result takes longer than the timeout gets it too, so
+the app sheds load with a 503 instead of queueing without bound.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool is saturated"""
+
+
+def _hash(password: str, method: str, salt_length: int) -> str:
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _verify(pwhash: str, password: str) -> bool:
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    """
+    Bounded process pool for password hashing and verification
+
+    Args:
+        method: Werkzeug hash method including its cost parameters, e.g.
+            "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+        workers: Worker processes; defaults to the CPU count
+        max_queue: Hash jobs allowed to wait for a free worker
+        timeout: Seconds a caller waits for its result before HasherBusy
+        salt_length: Salt length passed to generate_password_hash
+    """
+
+    def __init__(self, method: str = DEFAULT_METHOD, workers: int = None, max_queue: int = 32,
+                 timeout: float = 10.0, salt_length: int = 16):
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.salt_length = salt_length
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Created on first use so importing the app does not fork workers
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Password hashing is saturated")
+        try:
+            future = self._executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future: Future):
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # Drop it if it has not started; a running job finishes and frees its slot
+            future.cancel()
+            raise HasherBusy("Password hashing timed out") from None
+
+    def hash(self, password: str) -> str:
+        """Hash password with the configured method"""
+        return self._result(self._submit(_hash, password, self.method, self.salt_length))
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """Check password against a stored hash"""
+        if not pwhash:
+            return False
+        return self._result(self._submit(_verify, pwhash, password))
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True if pwhash was made with a different method or cost than configured"""
+        return bool(pwhash) and pwhash.split("$", 1)[0] != self.method
+
+    def rehash_later(self, password: str, on_done: Callable[[str], None]) -> None:
+        """
+        Compute a new hash in the background and pass it to on_done
+
+        Used to upgrade old hashes after a successful login without making
+        the user wait for a second KDF run. Skipped when the pool is busy;
+        the next login will try again.
+        """
+
+        try:
+            future = self._submit(_hash, password, self.method, self.salt_length)
+        except HasherBusy:
+            return
+
+        def done(f: Future) -> None:
+            if f.exception() is None:
+                try:
+                    on_done(f.result())
+                except Exception as e:
+                    logger.warning("Password rehash error", extra={"fields": {"error": str(e)}})
+
+        future.add_done_callback(done)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
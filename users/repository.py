@@ -0,0 +1,82 @@
+"""
+Access to the users table with per-path column projection and caching
+
+Each lookup selects only the columns its caller needs, so existence and
+verification checks never transfer the avatar or the password hash.
+Login records are kept in an in-process LRU/TTL cache. Each user has a
+version counter in shared state that every update bumps, and a cached
+record is only used while its version is current, so a password change
+made through one worker is seen by all of them on their next login.
+"""
+from typing import Any, Dict, Optional
+
+from caching import TTLCache
+from shared_state import MemoryState
+
+# Columns needed to authenticate a user and build the login response
+LOGIN_COLUMNS = "id, name, email, password, verified, avatar, subscription_status"
+
+
+class UserRepository:
+    """Users table access used by the auth and profile routes"""
+
+    def __init__(self, client, cache_size: int = 4096, ttl: float = 300.0, state=None):
+        self.client = client
+        self.cache = TTLCache(max_entries=cache_size, default_ttl=ttl)
+        self.state = state if state is not None else MemoryState()
+
+    def _version(self, email: str) -> int:
+        return self.state.get(f"user-version:{email}", 0)
+
+    def get_for_login(self, email: str) -> Optional[Dict[str, Any]]:
+        """User record with the login columns, from cache when possible"""
+        # Read before the fetch, so an update racing it leaves the entry already stale
+        version = self._version(email)
+        cached = self.cache.get(email)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        rows = self.client.table("users").select(LOGIN_COLUMNS).eq("email", email).limit(1).execute().data
+        if not rows:
+            return None
+        # Unverified users are not cached: another worker may verify them
+        if rows[0].get("verified"):
+            self.cache.set(email, (version, rows[0]))
+        return rows[0]
+
+    def exists(self, email: str) -> bool:
+        """Whether the email is registered, reading only the id"""
+        return bool(self.client.table("users").select("id").eq("email", email).limit(1).execute().data)
+
+    def create(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Insert a new user unless the email is already registered
+
+        Uses an insert that ignores conflicts on email, so two signups racing
+        for the same address cannot both succeed.
+
+        Returns:
+            The stored row, with its generated id and created_at, or None if
+            the email was taken
+        """
+
+        result = self.client.table("users").upsert(
+            user_data, on_conflict="email", ignore_duplicates=True, returning="representation"
+        ).execute()
+        self.invalidate(user_data["email"])
+        return result.data[0] if result.data else None
+
+    def update(self, email: str, updates: Dict[str, Any]) -> bool:
+        """Apply updates to a user; returns False if no such user exists"""
+        result = self.client.table("users").update(updates, returning="minimal", count="exact").eq("email", email).execute()
+        self.invalidate(email)
+        return bool(result.count)
+
+    def mark_verified(self, email: str) -> bool:
+        """Set the verified flag in one round trip; returns False if no such user exists"""
+        return self.update(email, {"verified": True})
+
+    def invalidate(self, email: str) -> None:
+        """Drop the cached record here and, through the version bump, in every other worker"""
+        # No TTL: a counter that expired and restarted could match an old entry's version
+        self.state.incr(f"user-version:{email}")
+        self.cache.delete(email)